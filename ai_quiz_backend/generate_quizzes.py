@@ -22,10 +22,16 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quiz_project.settings')
 django.setup()
 
 # Import Django models and utilities after setting up Django
-from quiz_api.models import StudyMaterial, Quiz
-from quiz_api.openai_utils import extract_text_from_document, generate_quiz
+from django.db import connection
+from quiz_api.models import StudyMaterial, Quiz, QuestionBank
+from quiz_api.generation import QuizGenerationError, TextExtractionError, fill_question_bank, get_or_create_quiz
+from quiz_api.rate_limit import RateLimiter, set_rate_limiter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
 import time
 
+QUESTIONS_PER_QUIZ = 5
+
 def list_study_materials():
     """List all study materials with their IDs."""
     materials = StudyMaterial.objects.select_related('subchapter__chapter__subject').all()
@@ -64,71 +70,118 @@ def generate_material_quiz(material_id, level):
             return False
         
         print(f"\nGenerating {level} quiz for '{material.title}'...")
-        
-        # Get the file path
-        file_path = material.document.path
-        
-        # Extract text from the document
-        text_content = extract_text_from_document(file_path, material.file_type)
-        
-        if not text_content:
-            print(f"Error: Could not extract text from '{material.title}'.")
-            return False
-        
-        # Generate quiz questions
         print("Calling OpenAI to generate questions...")
-        questions = generate_quiz(text_content, level)
-        
-        if not questions:
-            print("Error: Failed to generate quiz questions.")
-            return False
+        quiz, created = get_or_create_quiz(material, level, QUESTIONS_PER_QUIZ)
         
-        # Create the quiz
-        quiz = Quiz.objects.create(
-            material=material,
-            level=level
-        )
-        quiz.set_questions(questions)
-        quiz.save()
-        
-        print(f"Successfully generated a {level} quiz with {len(questions)} questions for '{material.title}'.")
+        print(f"Successfully generated a {level} quiz with {len(quiz.get_questions())} questions for '{material.title}'.")
         return True
         
     except StudyMaterial.DoesNotExist:
         print(f"Error: Study material with ID {material_id} does not exist.")
         return False
+    except QuizGenerationError as e:
+        print(f"Error: {e} for '{material.title}'.")
+        return False
     except Exception as e:
         print(f"Error generating quiz: {e}")
         return False
 
-def generate_all_quizzes(level):
-    """Generate quizzes for all study materials that don't have quizzes of the specified level."""
-    materials = StudyMaterial.objects.all()
+def fill_material_question_bank(material_id, level):
+    """Fill the question bank of a study material at a level."""
+    try:
+        material = StudyMaterial.objects.get(id=material_id)
+        print(f"\nFilling {level} question bank for '{material.title}'...")
+        bank = fill_question_bank(material, level)
+        print(f"The {level} question bank for '{material.title}' has {len(bank.get_questions())} questions.")
+        return True
+    except StudyMaterial.DoesNotExist:
+        print(f"Error: Study material with ID {material_id} does not exist.")
+        return False
+    except QuizGenerationError as e:
+        print(f"Error: {e} for '{material.title}'.")
+        return False
+    except Exception as e:
+        print(f"Error filling question bank: {e}")
+        return False
+
+def generate_with_retries(material, level, retries, bank=False):
+    """
+    Generate one quiz (or fill one question bank) in a worker thread, backing
+    off between retries. Every model call it makes (summary, generation,
+    repairs) waits for the process's rate limiter. Returns None on success
+    or the last error message.
+    """
+    try:
+        for attempt in range(retries + 1):
+            try:
+                if bank:
+                    fill_question_bank(material, level)
+                    print(f"Filled {level} question bank for '{material.title}'.")
+                else:
+                    get_or_create_quiz(material, level, QUESTIONS_PER_QUIZ)
+                    print(f"Generated {level} quiz for '{material.title}'.")
+                return None
+            except TextExtractionError as e:
+                # Retrying will not make the document readable
+                return str(e)
+            except Exception as e:
+                error = str(e)
+                if attempt < retries:
+                    delay = 2 ** attempt + random.uniform(0, 1)
+                    print(f"Attempt {attempt + 1} for '{material.title}' failed ({error}). Retrying in {delay:.1f}s...")
+                    time.sleep(delay)
+        return error
+    finally:
+        # Each worker thread has its own database connection
+        connection.close()
+
+def generate_all_quizzes(level, workers=4, requests_per_minute=60, tokens_per_minute=90000, retries=3, bank=False):
+    """
+    Generate quizzes (or fill question banks) for all study materials that
+    don't have one at the specified level, running several generations at
+    once within the API rate limits.
+    """
+    materials = list(StudyMaterial.objects.all())
     
     if not materials:
         print("No study materials found. Please upload some materials first.")
         return
     
-    success_count = 0
-    total_count = 0
+    # Find the materials that already have a quiz at this level with one query
+    existing = QuestionBank.objects if bank else Quiz.objects
+    existing_material_ids = set(
+        existing.filter(level=level).order_by().values_list('material_id', flat=True)
+    )
+    pending = [material for material in materials if material.id not in existing_material_ids]
+    skipped_count = len(materials) - len(pending)
     
-    for material in materials:
-        # Check if a quiz with this level already exists
-        existing_quiz = Quiz.objects.filter(material=material, level=level).first()
-        if existing_quiz:
-            print(f"A {level} quiz already exists for '{material.title}'. Skipping.")
-            continue
-        
-        total_count += 1
-        if generate_material_quiz(material.id, level):
-            success_count += 1
-            
-        # Add a delay to avoid hitting API rate limits
-        if total_count < len(materials):
-            print("Waiting for 5 seconds before generating the next quiz...")
-            time.sleep(5)
+    kind = "question banks" if bank else "quizzes"
+    print(f"Generating {len(pending)} {level} {kind} with {workers} workers "
+          f"({skipped_count} materials already have one)...")
+    
+    # Each model call waits for the limiter with the size of its actual prompt
+    set_rate_limiter(RateLimiter(requests_per_minute, tokens_per_minute))
+    failures = []
+    started_at = time.monotonic()
+    
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(generate_with_retries, material, level, retries, bank): material
+                for material in pending
+            }
+            for future in as_completed(futures):
+                error = future.result()
+                if error:
+                    failures.append((futures[future], error))
+    finally:
+        set_rate_limiter(None)
     
-    print(f"\nGenerated {success_count} out of {total_count} quizzes at {level} level.")
+    elapsed = time.monotonic() - started_at
+    print(f"\nGenerated {len(pending) - len(failures)} out of {len(pending)} {kind} at {level} level "
+          f"in {elapsed:.1f}s ({skipped_count} skipped, {len(failures)} failed).")
+    for material, error in failures:
+        print(f"  Failed: [{material.id}] '{material.title}': {error}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate quizzes from study materials.")
@@ -139,14 +192,26 @@ if __name__ == "__main__":
     parser.add_argument("--level", choices=["Beginner", "Intermediate", "Advanced"], 
                         default="Beginner", help="Difficulty level of the quiz")
     parser.add_argument("--all", action="store_true", help="Generate quizzes for all study materials")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Number of quizzes generated at the same time with --all (default: 4)")
+    parser.add_argument("--rpm", type=int, default=60,
+                        help="Maximum OpenAI requests per minute with --all (default: 60)")
+    parser.add_argument("--tpm", type=int, default=90000,
+                        help="Maximum OpenAI tokens per minute with --all (default: 90000)")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="Retries per material after a failed generation with --all (default: 3)")
+    parser.add_argument("--bank", action="store_true",
+                        help="Fill question banks (QUESTION_BANK_SIZE questions each) instead of single quizzes")
     
     args = parser.parse_args()
     
     if args.list:
         list_study_materials()
+    elif args.material_id and args.bank:
+        fill_material_question_bank(args.material_id, args.level)
     elif args.material_id:
         generate_material_quiz(args.material_id, args.level)
     elif args.all:
-        generate_all_quizzes(args.level)
+        generate_all_quizzes(args.level, args.workers, args.rpm, args.tpm, args.retries, args.bank)
     else:
         parser.print_help()
\ No newline at end of file
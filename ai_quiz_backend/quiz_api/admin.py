@@ -1,5 +1,13 @@
-from django.contrib import admin
-from .models import Subject, Chapter, Subchapter, StudyMaterial, Quiz, QuizScore, StudyRecommendation
+from django.contrib import admin, messages
+from .models import (
+    Subject, Chapter, Subchapter, StudyMaterial, ExtractedText, MaterialContent, MaterialSummary,
+    Quiz, QuestionBank, QuizGenerationJob, QuizScore, StudyRecommendation, RecommendationState,
+    StudentPerformance, LeaderboardEntry, LLMResponseCacheEntry, LLMCallMetric,
+    LLMCallCounter, CircuitBreakerState
+)
+from .circuit_breaker import CircuitOpenError
+from .generation import QuizGenerationError, create_quizzes_for_levels
+from .ingestion import schedule_ingestion
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
@@ -27,6 +35,47 @@ class StudyMaterialAdmin(admin.ModelAdmin):
     list_filter = ('file_type', 'subchapter__chapter__subject', 'created_at')
     search_fields = ('title', 'description', 'subchapter__name', 'subchapter__chapter__name')
     ordering = ('-created_at',)
+    actions = ['generate_all_level_quizzes']
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'document' in form.changed_data:
+            # Parse the new document in the background, as uploads through the API are
+            schedule_ingestion(obj, request.user)
+    
+    @admin.action(description='Generate Beginner, Intermediate and Advanced quizzes')
+    def generate_all_level_quizzes(self, request, queryset):
+        for material in queryset:
+            try:
+                create_quizzes_for_levels(material)
+                self.message_user(request, f"Generated quizzes for all levels of '{material.title}'.")
+            except QuizGenerationError as e:
+                self.message_user(request, f"Could not generate quizzes for '{material.title}': {e}", messages.ERROR)
+            except CircuitOpenError as e:
+                # The remaining materials would fail the same way
+                self.message_user(request, f"Stopped before '{material.title}': {e}", messages.ERROR)
+                break
+
+@admin.register(ExtractedText)
+class ExtractedTextAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'extractor_version', 'created_at')
+    list_filter = ('extractor_version', 'created_at')
+    search_fields = ('content_hash',)
+    ordering = ('-created_at',)
+
+@admin.register(MaterialContent)
+class MaterialContentAdmin(admin.ModelAdmin):
+    list_display = ('material', 'status', 'page_count', 'word_count', 'updated_at')
+    list_filter = ('status', 'updated_at')
+    search_fields = ('material__title', 'content_hash')
+    ordering = ('-updated_at',)
+
+@admin.register(MaterialSummary)
+class MaterialSummaryAdmin(admin.ModelAdmin):
+    list_display = ('material', 'content_hash', 'failed_at', 'updated_at')
+    list_filter = ('updated_at', 'failed_at')
+    search_fields = ('material__title', 'content_hash')
+    ordering = ('-updated_at',)
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
@@ -35,6 +84,20 @@ class QuizAdmin(admin.ModelAdmin):
     search_fields = ('material__title', 'material__subchapter__name')
     ordering = ('-created_at',)
 
+@admin.register(QuestionBank)
+class QuestionBankAdmin(admin.ModelAdmin):
+    list_display = ('material', 'level', 'updated_at')
+    list_filter = ('level', 'updated_at')
+    search_fields = ('material__title',)
+    ordering = ('-updated_at',)
+
+@admin.register(QuizGenerationJob)
+class QuizGenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('material', 'kind', 'level', 'status', 'progress', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'level', 'created_at')
+    search_fields = ('material__title', 'error')
+    ordering = ('-created_at',)
+
 @admin.register(QuizScore)
 class QuizScoreAdmin(admin.ModelAdmin):
     list_display = ('user', 'quiz', 'score', 'time_taken', 'completed_at')
@@ -48,3 +111,51 @@ class StudyRecommendationAdmin(admin.ModelAdmin):
     list_filter = ('subchapter__chapter__subject', 'created_at')
     search_fields = ('user__username', 'subchapter__name', 'recommendation')
     ordering = ('-created_at',)
+
+@admin.register(RecommendationState)
+class RecommendationStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'pending_since', 'last_score_at', 'refreshed_at')
+    list_filter = ('refreshed_at',)
+    search_fields = ('user__username',)
+    ordering = ('-last_score_at',)
+
+@admin.register(StudentPerformance)
+class StudentPerformanceAdmin(admin.ModelAdmin):
+    list_display = ('user', 'scope', 'subject', 'chapter', 'subchapter', 'quiz_count', 'highest_score', 'last_quiz_at')
+    list_filter = ('scope', 'subject')
+    search_fields = ('user__username',)
+    ordering = ('user__username', 'scope')
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'scope', 'scope_id', 'window', 'period', 'score', 'time_seconds', 'achieved_at')
+    list_filter = ('scope', 'window', 'period')
+    search_fields = ('user__username',)
+    ordering = ('scope', 'scope_id', 'period', '-score', 'time_seconds')
+
+@admin.register(LLMResponseCacheEntry)
+class LLMResponseCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'created_at', 'expires_at', 'last_used_at')
+    list_filter = ('created_at',)
+    search_fields = ('key',)
+    ordering = ('-last_used_at',)
+
+@admin.register(LLMCallMetric)
+class LLMCallMetricAdmin(admin.ModelAdmin):
+    list_display = ('operation', 'model', 'outcome', 'cached', 'latency_ms', 'prompt_tokens', 'completion_tokens', 'created_at')
+    list_filter = ('operation', 'outcome', 'cached', 'model')
+    search_fields = ('operation', 'model')
+    ordering = ('-created_at',)
+
+@admin.register(LLMCallCounter)
+class LLMCallCounterAdmin(admin.ModelAdmin):
+    list_display = ('operation', 'model', 'outcome', 'cached', 'latency_bucket', 'calls', 'prompt_tokens', 'completion_tokens')
+    list_filter = ('operation', 'outcome', 'cached', 'model')
+    search_fields = ('operation', 'model')
+    ordering = ('operation', 'model', 'outcome', 'cached', 'latency_bucket')
+
+@admin.register(CircuitBreakerState)
+class CircuitBreakerStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'state', 'failures', 'opened_at', 'opened_total', 'rejected_total')
+    list_filter = ('state',)
+    ordering = ('name',)
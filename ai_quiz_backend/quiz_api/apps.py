@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class QuizApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz_api'
+    
+    def ready(self):
+        # Connect the handlers that keep the aggregates right when scores are deleted
+        from . import signals
@@ -0,0 +1,150 @@
+"""
+Per-material chunk index used to build quiz prompts that cover the whole
+document within a fixed character budget.
+
+Each material's text is split into fixed-size chunks with a TF-IDF keyword
+vector computed across the material's chunks. At generation time a diverse,
+representative set of chunks that fits the budget is selected instead of
+always sending the start of the document.
+"""
+import math
+import re
+from collections import Counter
+from django.db import transaction
+
+from .models import MaterialChunk
+
+# Target size of each chunk in characters
+CHUNK_SIZE = 800
+
+# Number of highest-weighted keywords kept per chunk vector
+KEYWORDS_PER_CHUNK = 25
+
+# Balance between picking representative chunks (1.0) and avoiding overlap (0.0)
+SELECTION_DIVERSITY = 0.6
+
+# Separator placed between selected chunks in the prompt
+CHUNK_SEPARATOR = "\n\n"
+
+STOPWORDS = {
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'any', 'can', 'had', 'her', 'was',
+    'one', 'our', 'out', 'has', 'his', 'how', 'its', 'may', 'who', 'did', 'get', 'she', 'him',
+    'they', 'this', 'that', 'with', 'have', 'from', 'will', 'your', 'what', 'when', 'were',
+    'which', 'their', 'there', 'been', 'them', 'then', 'than', 'these', 'those', 'into', 'also',
+    'each', 'some', 'such', 'only', 'other', 'about', 'would', 'could', 'should', 'more', 'most',
+    'yang', 'dan', 'ini', 'itu', 'untuk', 'dengan', 'dalam', 'pada', 'ada', 'adalah', 'tidak',
+}
+
+def split_into_chunks(text, chunk_size=CHUNK_SIZE):
+    """Split text into chunks of about chunk_size characters, breaking at whitespace."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            # Prefer to break at the last space in the second half of the chunk
+            space = text.rfind(' ', start + chunk_size // 2, end)
+            if space != -1:
+                end = space
+        chunks.append(text[start:end].strip())
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+def tokenize(text):
+    """Return the lower-cased keywords of a piece of text."""
+    words = re.findall(r'[^\W\d_]{3,}', text.lower())
+    return [word for word in words if word not in STOPWORDS]
+
+def compute_chunk_vectors(chunks):
+    """Compute a normalised TF-IDF keyword vector for each chunk, using the chunks as the corpus."""
+    term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+    document_frequency = Counter(term for counts in term_counts for term in counts)
+    chunk_count = len(chunks)
+    
+    vectors = []
+    for counts in term_counts:
+        total = sum(counts.values()) or 1
+        weights = {
+            term: (count / total) * (math.log((1 + chunk_count) / (1 + document_frequency[term])) + 1)
+            for term, count in counts.items()
+        }
+        top_terms = sorted(weights.items(), key=lambda item: (-item[1], item[0]))[:KEYWORDS_PER_CHUNK]
+        norm = math.sqrt(sum(weight * weight for term, weight in top_terms)) or 1
+        vectors.append({term: round(weight / norm, 4) for term, weight in top_terms})
+    return vectors
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two normalised sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(term, 0) for term, weight in a.items())
+
+def build_chunk_index(material, text):
+    """Replace the chunk index of a study material with chunks of the given text."""
+    chunks = split_into_chunks(text)
+    vectors = compute_chunk_vectors(chunks)
+    
+    chunk_objects = []
+    for position, (chunk, vector) in enumerate(zip(chunks, vectors)):
+        chunk_object = MaterialChunk(material=material, position=position, text=chunk)
+        chunk_object.set_vector(vector)
+        chunk_objects.append(chunk_object)
+    
+    # Readers see either the old index or the new one, never a partial one
+    with transaction.atomic():
+        MaterialChunk.objects.filter(material=material).delete()
+        MaterialChunk.objects.bulk_create(chunk_objects)
+    return len(chunk_objects)
+
+def select_chunks(chunks, max_chars, diversity=SELECTION_DIVERSITY):
+    """
+    Pick chunks that together fit in max_chars, favouring chunks that are
+    representative of the whole material but different from the ones already
+    picked (maximal marginal relevance). Returns them in document order.
+    """
+    vectors = {chunk.position: chunk.get_vector() for chunk in chunks}
+    
+    # Representativeness is the similarity of a chunk to the material's centroid
+    centroid = Counter()
+    for vector in vectors.values():
+        centroid.update(vector)
+    norm = math.sqrt(sum(weight * weight for weight in centroid.values())) or 1
+    centroid = {term: weight / norm for term, weight in centroid.items()}
+    relevance = {position: cosine_similarity(vector, centroid) for position, vector in vectors.items()}
+    
+    selected = []
+    remaining = list(chunks)
+    used_chars = 0
+    while remaining:
+        best_chunk = None
+        best_score = None
+        for chunk in remaining:
+            if used_chars + len(chunk.text) + len(CHUNK_SEPARATOR) > max_chars:
+                continue
+            redundancy = max(
+                (cosine_similarity(vectors[chunk.position], vectors[other.position]) for other in selected),
+                default=0
+            )
+            score = diversity * relevance[chunk.position] - (1 - diversity) * redundancy
+            if best_score is None or score > best_score:
+                best_chunk, best_score = chunk, score
+        
+        if best_chunk is None:
+            break
+        selected.append(best_chunk)
+        remaining.remove(best_chunk)
+        used_chars += len(best_chunk.text) + len(CHUNK_SEPARATOR)
+    
+    return sorted(selected, key=lambda chunk: chunk.position)
+
+def get_selected_text(material, max_chars):
+    """
+    Return a budget-sized selection of a material's chunks joined into one
+    text, or None if the material has no chunk index yet.
+    """
+    chunks = list(MaterialChunk.objects.filter(material=material))
+    selected = select_chunks(chunks, max_chars)
+    if not selected:
+        return None
+    return CHUNK_SEPARATOR.join(chunk.text for chunk in selected)
@@ -0,0 +1,297 @@
+"""
+Circuit breaker, retry policy and request hedging for calls to the OpenAI API.
+
+Each call gets a deadline of OPENAI_CALL_DEADLINE seconds covering all of
+its attempts. Timeouts, connection errors, rate limits and server errors
+are retried with jittered exponential backoff and count as failures: after
+OPENAI_CIRCUIT_FAILURE_THRESHOLD failures in a row the circuit opens and
+calls fail immediately with CircuitOpenError for
+OPENAI_CIRCUIT_RESET_TIMEOUT seconds. Then one trial call is let through,
+which closes the circuit again if it succeeds. Breaker state is stored in
+a CircuitBreakerState row, so every web and worker process sees the same
+circuit. Each process reuses the state it read for OPENAI_CIRCUIT_STATE_TTL
+seconds, so a call through a closed circuit costs no query and the row is
+only written when the failure count or the state changes.
+
+With OPENAI_HEDGE_AFTER set, an attempt that has not answered after that
+many seconds is sent a second time and the first answer wins, which cuts
+tail latency at the cost of the tokens of the duplicate request.
+"""
+import asyncio
+import logging
+import math
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import CircuitBreakerState
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Numeric values of the states in the Prometheus gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Errors that mean the API is unreachable, slow or overloaded: retried and counted against the circuit
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError
+)
+
+# Don't start another attempt with less than this many seconds left before the deadline
+MIN_ATTEMPT_TIMEOUT = 1
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+# Circuit states read by this process: name -> (CircuitBreakerState, time.monotonic() when it goes stale)
+_cached_states = {}
+_cached_states_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open."""
+    
+    def __init__(self, name, retry_after):
+        super().__init__(f"The {name} service is unavailable, retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Circuit breaker backed by the database that also runs calls with deadlines, retries and hedging."""
+    
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+    
+    def _states(self):
+        return CircuitBreakerState.objects.filter(name=self.name)
+    
+    def get_state(self):
+        """
+        Return the stored state of the circuit, creating it closed on first
+        use. The state is read again once the copy cached by this process is
+        OPENAI_CIRCUIT_STATE_TTL seconds old.
+        """
+        with _cached_states_lock:
+            cached = _cached_states.get(self.name)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        state, created = CircuitBreakerState.objects.get_or_create(name=self.name)
+        with _cached_states_lock:
+            _cached_states[self.name] = (state, time.monotonic() + settings.OPENAI_CIRCUIT_STATE_TTL)
+        return state
+    
+    def _forget_state(self):
+        """Drop the cached state after changing it, so the next call reads the new one."""
+        with _cached_states_lock:
+            _cached_states.pop(self.name, None)
+    
+    def _wait(self, state):
+        """Seconds until the open circuit lets a trial call through."""
+        return (state.opened_at + timedelta(seconds=self.reset_timeout) - timezone.now()).total_seconds()
+    
+    def retry_after(self):
+        """Seconds until a call will be let through, 0 if it would be now."""
+        state = self.get_state()
+        if state.state == CLOSED:
+            return 0
+        return max(0, math.ceil(self._wait(state)))
+    
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now."""
+        state = self.get_state()
+        if state.state == CLOSED:
+            return
+        wait_seconds = self._wait(state)
+        # Let one trial call through per reset_timeout until one succeeds; only one process wins the update
+        if wait_seconds <= 0 and self._states().filter(state=state.state, opened_at=state.opened_at).update(
+            state=HALF_OPEN, opened_at=timezone.now()
+        ):
+            self._forget_state()
+            return
+        self._states().update(rejected_total=F('rejected_total') + 1)
+        # A circuit that is due for a trial call is having it made by another request
+        raise CircuitOpenError(self.name, math.ceil(wait_seconds) if wait_seconds > 0 else self.reset_timeout)
+    
+    def record_success(self):
+        state = self.get_state()
+        if state.state == CLOSED and state.failures == 0:
+            # Nothing to reset; failures recorded by other processes since the state was read are reset by a later call
+            return
+        if self._states().exclude(state=CLOSED).update(state=CLOSED, failures=0):
+            logger.info(f"Circuit {self.name} closed")
+        else:
+            self._states().filter(failures__gt=0).update(failures=0)
+        self._forget_state()
+    
+    def record_failure(self):
+        self._states().update(failures=F('failures') + 1)
+        opened = self._states().filter(
+            Q(state=HALF_OPEN) | Q(state=CLOSED, failures__gte=self.failure_threshold)
+        ).update(state=OPEN, opened_at=timezone.now(), opened_total=F('opened_total') + 1)
+        self._forget_state()
+        if opened:
+            logger.warning(f"Circuit {self.name} opened after {self.get_state().failures} failure(s)")
+    
+    def call(self, fn):
+        """
+        Return fn(timeout) through the breaker, where timeout is the number of
+        seconds the attempt may take. Retryable errors are retried up to
+        OPENAI_MAX_RETRIES times within the call's deadline, then raised.
+        Server errors count against the circuit; other errors the service
+        answered with (bad requests) count neither way.
+        """
+        deadline = time.monotonic() + settings.OPENAI_CALL_DEADLINE
+        attempt = 0
+        while True:
+            self.before_call()
+            try:
+                result = self._attempt(fn, deadline)
+            except openai.OpenAIError as e:
+                delay = self._record_error(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.record_success()
+            return result
+    
+    async def acall(self, fn):
+        """Async version of call() for a coroutine function fn(timeout)."""
+        deadline = time.monotonic() + settings.OPENAI_CALL_DEADLINE
+        attempt = 0
+        while True:
+            await sync_to_async(self.before_call)()
+            try:
+                result = await self._aattempt(fn, deadline)
+            except openai.OpenAIError as e:
+                delay = await sync_to_async(self._record_error)(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            await sync_to_async(self.record_success)()
+            return result
+    
+    def _record_error(self, error, attempt, deadline):
+        """Count a failed attempt against the circuit if it should, and return the delay before retrying it or None."""
+        if isinstance(error, RETRYABLE_ERRORS):
+            self.record_failure()
+            delay = self._retry_delay(attempt, deadline)
+            if delay is not None:
+                logger.warning(f"{self.name} call failed ({error}), retrying in {delay:.2f}s")
+            return delay
+        if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+            self.record_failure()
+        return None
+    
+    def _attempt(self, fn, deadline):
+        """
+        Run one attempt. With OPENAI_HEDGE_AFTER set, a second request is sent
+        if the first has not answered in time; the first success is returned
+        and the other response is closed when it arrives.
+        """
+        timeout = self._attempt_timeout(deadline)
+        hedge_after = settings.OPENAI_HEDGE_AFTER
+        if not hedge_after or hedge_after >= timeout:
+            return fn(timeout)
+        
+        pool = get_hedge_pool()
+        pending = {pool.submit(fn, timeout)}
+        done, pending = wait(pending, timeout=hedge_after)
+        if not done:
+            logger.info(f"{self.name} call has not answered after {hedge_after}s, sending a hedged request")
+            pending.add(pool.submit(fn, self._attempt_timeout(deadline)))
+        
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.add_done_callback(close_response)
+                    return future.result()
+                error = error or future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+    
+    async def _aattempt(self, fn, deadline):
+        """Async version of _attempt(); the request that loses a hedged race is cancelled."""
+        timeout = self._attempt_timeout(deadline)
+        hedge_after = settings.OPENAI_HEDGE_AFTER
+        if not hedge_after or hedge_after >= timeout:
+            return await fn(timeout)
+        
+        pending = {asyncio.ensure_future(fn(timeout))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if not done:
+                logger.info(f"{self.name} call has not answered after {hedge_after}s, sending a hedged request")
+                pending.add(asyncio.ensure_future(fn(self._attempt_timeout(deadline))))
+            
+            error = None
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+                if not pending:
+                    raise error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _attempt_timeout(self, deadline):
+        return max(MIN_ATTEMPT_TIMEOUT, min(settings.OPENAI_TIMEOUT, deadline - time.monotonic()))
+    
+    def _retry_delay(self, attempt, deadline):
+        """Full-jitter exponential backoff, or None if the call should not be retried."""
+        if attempt >= settings.OPENAI_MAX_RETRIES:
+            return None
+        delay = random.uniform(0, min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+        if time.monotonic() + delay + MIN_ATTEMPT_TIMEOUT > deadline:
+            return None
+        return delay
+
+def close_response(future):
+    """Release the response of a hedged request that lost the race, such as an open stream."""
+    if not future.cancelled() and future.exception() is None:
+        close = getattr(future.result(), 'close', None)
+        if close:
+            close()
+
+def get_hedge_pool():
+    """Return the thread pool that runs hedged attempts, creating it on first use."""
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(
+                max_workers=settings.OPENAI_MAX_CONNECTIONS, thread_name_prefix='openai-hedge'
+            )
+        return _hedge_pool
+
+def get_circuit_breaker(name='openai'):
+    """Return the circuit breaker for a service."""
+    return CircuitBreaker(name, settings.OPENAI_CIRCUIT_FAILURE_THRESHOLD, settings.OPENAI_CIRCUIT_RESET_TIMEOUT)
+
+def clear_cached_circuit_states():
+    """Forget the circuit states cached by this process."""
+    with _cached_states_lock:
+        _cached_states.clear()
+
+def get_circuit_states():
+    """Return the stored state of every circuit breaker."""
+    return list(CircuitBreakerState.objects.order_by('name'))
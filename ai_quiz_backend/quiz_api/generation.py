@@ -0,0 +1,285 @@
+"""
+Quiz generation services shared by the API views, the admin and the
+command-line scripts.
+"""
+import logging
+from django.conf import settings
+from django.db import transaction
+
+from .models import Quiz, QuestionBank
+from .circuit_breaker import CircuitOpenError
+from .ingestion import get_material_text
+from .question_bank import build_variant
+from .singleflight import SingleFlight
+from .summaries import format_summary, get_material_summary
+from .validation import split_valid_questions
+from .openai_utils import (
+    QUIZ_TEXT_BUDGET, QUIZ_EXCERPT_BUDGET, agenerate_replacement_questions, generate_quiz,
+    generate_multi_level_quiz, generate_replacement_questions, stream_quiz_questions
+)
+
+logger = logging.getLogger(__name__)
+
+QUIZ_LEVELS = [level for level, label in Quiz.LEVEL_CHOICES]
+
+# Quiz generations in progress in this process, shared by identical concurrent requests
+_generations = SingleFlight()
+
+class QuizGenerationError(Exception):
+    """Raised when a quiz could not be generated from a study material."""
+
+class TextExtractionError(QuizGenerationError):
+    """Raised when no text could be read from a study material."""
+
+def get_quiz_text(material):
+    """
+    Return the study material text sent to the model: the material's summary
+    followed by a short excerpt, or a budget-sized selection of the text if
+    no summary could be made.
+    """
+    summary = get_material_summary(material)
+    excerpt_budget = QUIZ_EXCERPT_BUDGET if summary else QUIZ_TEXT_BUDGET
+    text_content = get_material_text(material, max_chars=excerpt_budget)
+    if not text_content:
+        raise TextExtractionError('Could not extract text from the document')
+    if summary:
+        return f"{format_summary(summary)}\n\nExcerpt:\n{text_content}"
+    return text_content
+
+def repair_steps(level, questions, num_questions, existing=()):
+    """
+    The repair loop shared by repair_questions() and arepair_questions(): a
+    generator that yields (missing, avoid) whenever replacement questions
+    are needed and is sent the replacements, or None if none can be made.
+    Returns the valid questions.
+    """
+    if not questions:
+        return []
+    valid, rejected = split_valid_questions(questions, existing)
+    avoid = [question['question'] for question in list(existing) + valid]
+    attempts = 0
+    while True:
+        for question, problems in rejected:
+            logger.warning(f"Rejected generated {level} question: {', '.join(problems)}")
+            text = question.get('question') if isinstance(question, dict) else None
+            if isinstance(text, str) and text not in avoid:
+                avoid.append(text)
+        
+        missing = num_questions - len(valid)
+        if missing <= 0 or attempts >= settings.QUIZ_REPAIR_ATTEMPTS:
+            return valid[:num_questions]
+        attempts += 1
+        replacements = yield missing, avoid
+        if replacements is None:
+            # Keep the questions we have rather than failing the whole generation
+            return valid
+        added, rejected = split_valid_questions(replacements, list(existing) + valid)
+        valid.extend(added[:missing])
+        avoid.extend(question['question'] for question in added[:missing])
+
+def repair_questions(text_content, level, questions, num_questions, existing=(), refresh=False):
+    """
+    Keep the valid, distinct generated questions and ask the model for
+    replacements of the rejected ones only, with a small prompt, until there
+    are num_questions or QUIZ_REPAIR_ATTEMPTS calls have been made. Questions
+    repeating one of `existing` count as duplicates. With refresh, cached
+    replacements are not reused. Returns the valid questions, possibly fewer
+    than num_questions.
+    """
+    steps = repair_steps(level, questions, num_questions, existing)
+    try:
+        missing, avoid = next(steps)
+        while True:
+            try:
+                replacements = generate_replacement_questions(text_content, level, missing, avoid, refresh)
+            except CircuitOpenError:
+                replacements = None
+            missing, avoid = steps.send(replacements)
+    except StopIteration as done:
+        return done.value
+
+async def arepair_questions(text_content, level, questions, num_questions, existing=(), refresh=False):
+    """Async version of repair_questions() for use from async views."""
+    steps = repair_steps(level, questions, num_questions, existing)
+    try:
+        missing, avoid = next(steps)
+        while True:
+            try:
+                replacements = await agenerate_replacement_questions(text_content, level, missing, avoid, refresh)
+            except CircuitOpenError:
+                replacements = None
+            missing, avoid = steps.send(replacements)
+    except StopIteration as done:
+        return done.value
+
+def save_quiz(material, level, questions, regenerate=False):
+    """
+    Save generated questions as the quiz for a study material and level.
+    With regenerate, the questions of an existing quiz are replaced (keeping
+    its scores); otherwise a quiz saved in the meantime by another request
+    is kept and the new questions are discarded. Returns (quiz, created).
+    """
+    quiz = Quiz(material=material, level=level)
+    quiz.set_questions(questions)
+    defaults = {'questions_json': quiz.questions_json}
+    if regenerate:
+        return Quiz.objects.update_or_create(material=material, level=level, defaults=defaults)
+    return Quiz.objects.get_or_create(material=material, level=level, defaults=defaults)
+
+def get_or_create_quiz(material, level, num_questions=5, regenerate=False, on_progress=None):
+    """
+    Return the quiz for a study material and level, generating it if there is
+    none yet or if regenerate is set. Regenerating bypasses the LLM response
+    cache so the quiz gets new questions. Concurrent calls for the same
+    material and level in this process share one generation, unless only
+    one of them regenerates: a regenerate never gets the result of a plain
+    generation, which may come from the cache. Returns (quiz, created).
+    on_progress, if given, is called with a completion percentage as the steps finish.
+    """
+    if not regenerate:
+        quiz = Quiz.objects.filter(material=material, level=level).first()
+        if quiz:
+            return quiz, False
+    
+    def generate():
+        text_content = get_quiz_text(material)
+        if on_progress:
+            on_progress(30)
+        
+        questions = generate_quiz(text_content, level, num_questions, refresh=regenerate)
+        questions = repair_questions(text_content, level, questions, num_questions, refresh=regenerate)
+        if not questions:
+            raise QuizGenerationError('Failed to generate quiz questions')
+        if on_progress:
+            on_progress(90)
+        
+        return save_quiz(material, level, questions, regenerate)
+    
+    return _generations.do((material.id, level, regenerate), generate)
+
+def stream_quiz(material, level, num_questions=5, regenerate=False):
+    """
+    Generate a quiz for a study material, yielding ('question', question) as
+    each question is completed by the model and finally ('quiz', quiz) once
+    the quiz has been saved. An existing quiz, or one being generated by
+    another request in this process with the same regenerate flag, is
+    replayed instead.
+    """
+    if not regenerate:
+        quiz = Quiz.objects.filter(material=material, level=level).first()
+        if quiz:
+            yield from replay_quiz(quiz)
+            return
+    
+    key = (material.id, level, regenerate)
+    call, leader = _generations.begin(key)
+    if not leader:
+        quiz, created = call.wait()
+        yield from replay_quiz(quiz)
+        return
+    
+    try:
+        text_content = get_quiz_text(material)
+        
+        questions = []
+        for question in stream_quiz_questions(text_content, level, num_questions, refresh=regenerate):
+            if split_valid_questions([question], questions)[0]:
+                questions.append(question)
+                yield 'question', question
+        
+        for question in repair_questions(
+            text_content, level, questions, num_questions, refresh=regenerate
+        )[len(questions):]:
+            questions.append(question)
+            yield 'question', question
+        
+        if not questions:
+            raise QuizGenerationError('Failed to generate quiz questions')
+        
+        result = save_quiz(material, level, questions, regenerate)
+    except BaseException as e:
+        # Includes GeneratorExit when the client disconnects mid-stream
+        _generations.fail(key, e if isinstance(e, Exception) else QuizGenerationError('Quiz generation was cancelled'))
+        raise
+    _generations.finish(key, result)
+    yield 'quiz', result[0]
+
+def replay_quiz(quiz):
+    """Yield the events of stream_quiz() for an already saved quiz."""
+    for question in quiz.get_questions():
+        yield 'question', question
+    yield 'quiz', quiz
+
+def create_quizzes_for_levels(material, levels=None, num_questions=5, regenerate=False):
+    """
+    Generate quizzes for several levels of a study material with a single
+    model call and save them together. Levels that already have a quiz are
+    kept unless regenerate is set, which also bypasses the LLM response
+    cache. Returns the quizzes in level order.
+    """
+    levels = levels or QUIZ_LEVELS
+    quizzes = {}
+    if not regenerate:
+        quizzes = {quiz.level: quiz for quiz in Quiz.objects.filter(material=material, level__in=levels)}
+    missing = [level for level in levels if level not in quizzes]
+    
+    def generate():
+        text_content = get_quiz_text(material)
+        questions_by_level = generate_multi_level_quiz(text_content, missing, num_questions, refresh=regenerate)
+        if not questions_by_level:
+            raise QuizGenerationError('Failed to generate quiz questions')
+        for level in missing:
+            questions_by_level[level] = repair_questions(
+                text_content, level, questions_by_level[level], num_questions, refresh=regenerate
+            )
+            if not questions_by_level[level]:
+                raise QuizGenerationError(f'Failed to generate {level} quiz questions')
+        
+        with transaction.atomic():
+            return {
+                level: save_quiz(material, level, questions_by_level[level], regenerate)[0]
+                for level in missing
+            }
+    
+    if missing:
+        quizzes.update(_generations.do((material.id, tuple(missing), regenerate), generate))
+    return [quizzes[level] for level in levels]
+
+def fill_question_bank(material, level, size=None, refill=False):
+    """
+    Return the question bank for a study material and level, topping it up
+    to `size` questions (QUESTION_BANK_SIZE by default) with one generation
+    call. With refill, the bank's questions are replaced. Refilling and
+    topping up bypass the LLM response cache, which would otherwise return
+    the questions the bank already has. If the material has no quiz at this
+    level yet, one is saved from the first variant of the bank so variants
+    have a quiz to record scores against.
+    """
+    size = size or settings.QUESTION_BANK_SIZE
+    
+    def generate():
+        bank = QuestionBank.objects.filter(material=material, level=level).first()
+        existing = [] if refill or bank is None else bank.get_questions()
+        if len(existing) >= size:
+            return bank
+        
+        text_content = get_quiz_text(material)
+        refresh = refill or bool(existing)
+        questions = generate_quiz(text_content, level, size - len(existing), refresh=refresh)
+        questions = existing + repair_questions(
+            text_content, level, questions, size - len(existing), existing, refresh
+        )
+        if len(questions) <= len(existing):
+            raise QuizGenerationError('Failed to generate questions for the question bank')
+        
+        with transaction.atomic():
+            bank, created = QuestionBank.objects.get_or_create(
+                material=material, level=level, defaults={'questions_json': []}
+            )
+            bank.set_questions(questions)
+            bank.save()
+            if not Quiz.objects.filter(material=material, level=level).exists():
+                save_quiz(material, level, build_variant(questions, 0, settings.QUIZ_VARIANT_SIZE))
+        return bank
+    
+    return _generations.do(('bank', material.id, level, refill), generate)
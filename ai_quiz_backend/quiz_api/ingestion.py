@@ -0,0 +1,109 @@
+"""
+Extract-on-upload ingestion pipeline for study materials.
+
+When a material is uploaded an ingestion job is queued. The background
+worker extracts its text, page count, word count and content hash into a
+MaterialContent row and builds its chunk index, so quiz generation reads
+pre-parsed text instead of parsing the document inside the request.
+"""
+import logging
+
+from .models import StudyMaterial, MaterialContent, MaterialChunk
+from .chunking import build_chunk_index, get_selected_text
+from .circuit_breaker import get_circuit_breaker
+from .openai_utils import (
+    compute_document_hash, count_document_pages, get_document_text, store_document_text
+)
+
+logger = logging.getLogger(__name__)
+
+def ingest_material(material_id):
+    """Extract and store the text and statistics of a study material."""
+    try:
+        material = StudyMaterial.objects.get(id=material_id)
+    except StudyMaterial.DoesNotExist:
+        logger.warning(f"Study material {material_id} was deleted before it could be ingested")
+        return None
+    
+    content, created = MaterialContent.objects.get_or_create(material=material)
+    try:
+        file_path = material.document.path
+        content_hash = compute_document_hash(file_path)
+        extracted = store_document_text(file_path, material.file_type, content_hash)
+        if not extracted:
+            raise ValueError("No text could be extracted from the document")
+        
+        content.extracted_text = extracted
+        content.content_hash = content_hash
+        content.page_count = count_document_pages(file_path, material.file_type)
+        content.word_count = len(extracted.text.split())
+        build_chunk_index(material, extracted.text)
+        content.status = 'ready'
+        content.error = None
+    except Exception as e:
+        logger.error(f"Error ingesting study material {material_id}: {e}")
+        MaterialChunk.objects.filter(material=material).delete()
+        content.status = 'failed'
+        content.error = str(e)
+    
+    content.save()
+    if content.status == 'ready':
+        summarize_material(material)
+    return content
+
+def summarize_material(material):
+    """
+    Write the material's summary now so the first quiz request doesn't wait
+    for it. While the OpenAI circuit is open the summary is left to that
+    request, rather than being recorded as failed.
+    """
+    # Imported here because summaries reads material text through this module
+    from .summaries import get_material_summary
+    retry_after = get_circuit_breaker().retry_after()
+    if retry_after > 0:
+        logger.info(f"Not summarizing study material {material.id} while OpenAI is unavailable (retry in {retry_after}s)")
+        return
+    try:
+        get_material_summary(material)
+    except Exception as e:
+        logger.error(f"Error summarizing study material {material.id}: {e}")
+
+def schedule_ingestion(material, user=None):
+    """
+    Mark a material's content as pending, drop the chunk index of its
+    previous document and queue an ingestion job for the background worker.
+    Returns the job.
+    """
+    # Imported here because the job queue runs ingest_material from this module
+    from .jobs import enqueue_ingestion
+    MaterialContent.objects.update_or_create(
+        material=material,
+        defaults={'status': 'pending', 'error': None}
+    )
+    MaterialChunk.objects.filter(material=material).delete()
+    job, created = enqueue_ingestion(material, user)
+    return job
+
+def get_material_text(material, max_chars=None):
+    """
+    Return the text of a study material, preferring the pre-parsed content and
+    falling back to extracting the document if ingestion hasn't finished.
+    
+    With max_chars, materials that have a chunk index return a selection of
+    chunks covering the whole document rather than just its beginning.
+    """
+    # Content that is not ready may belong to a previous document
+    content = MaterialContent.objects.filter(material=material, status='ready').first()
+    if content is None:
+        return get_document_text(material.document.path, material.file_type, max_chars)
+    
+    if max_chars is not None:
+        selected_text = get_selected_text(material, max_chars)
+        if selected_text:
+            return selected_text
+    
+    if content.extracted_text:
+        text = content.extracted_text.text
+        return text[:max_chars] if max_chars is not None else text
+    
+    return get_document_text(material.document.path, material.file_type, max_chars)
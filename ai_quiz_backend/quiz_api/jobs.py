@@ -0,0 +1,219 @@
+"""
+Database-backed queue for quiz generation and study material ingestion jobs.
+
+The API enqueues a QuizGenerationJob and returns immediately; the worker
+started with `python manage.py run_worker` claims queued jobs, generates the
+quizzes or ingests the uploaded documents and records progress, so no web
+worker parses documents or waits on OpenAI. Failed jobs are retried after a
+delay that doubles with each attempt.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MaterialContent, QuizGenerationJob
+from .circuit_breaker import CircuitOpenError
+from .generation import TextExtractionError, get_or_create_quiz
+from .ingestion import ingest_material
+
+logger = logging.getLogger(__name__)
+
+# Key of the PostgreSQL advisory lock held while a worker claims a job
+JOB_QUEUE_LOCK_ID = 4711
+
+def enqueue_quiz_generation(material, level, user=None, regenerate=False):
+    """
+    Queue a quiz generation job, reusing the queued or running job for the
+    same material and level if there is one. A regenerate request upgrades a
+    queued job, and makes a running job that is not regenerating run again
+    with regenerate once it finishes. Returns (job, created).
+    """
+    while True:
+        job = QuizGenerationJob.objects.filter(
+            material=material, kind='quiz', level=level, status__in=QuizGenerationJob.ACTIVE_STATUSES
+        ).first()
+        if job is None:
+            try:
+                with transaction.atomic():
+                    job = QuizGenerationJob.objects.create(
+                        material=material, kind='quiz', level=level, regenerate=regenerate, requested_by=user
+                    )
+                return job, True
+            except IntegrityError:
+                # Another request queued the same job at the same time
+                continue
+        
+        if not regenerate or job.regenerate:
+            return job, False
+        # Only upgrade the job in the state it was read in; otherwise look again
+        if job.status == 'queued':
+            upgraded = QuizGenerationJob.objects.filter(id=job.id, status='queued').update(regenerate=True)
+        else:
+            upgraded = QuizGenerationJob.objects.filter(id=job.id, status='running').update(
+                regenerate=True, rerun=True
+            )
+        if upgraded:
+            job.refresh_from_db()
+            return job, False
+
+def enqueue_ingestion(material, user=None):
+    """
+    Queue the ingestion of a study material's document, reusing a queued
+    ingestion job if there is one. A running ingestion may have read the
+    previous document, so it runs again once it finishes. Returns (job, created).
+    """
+    while True:
+        job = QuizGenerationJob.objects.filter(
+            material=material, kind='ingestion', status__in=QuizGenerationJob.ACTIVE_STATUSES
+        ).first()
+        if job is None:
+            try:
+                with transaction.atomic():
+                    job = QuizGenerationJob.objects.create(material=material, kind='ingestion', requested_by=user)
+                return job, True
+            except IntegrityError:
+                # Another request queued the same job at the same time
+                continue
+        
+        if job.status == 'queued':
+            return job, False
+        if QuizGenerationJob.objects.filter(id=job.id, status='running').update(rerun=True):
+            job.refresh_from_db()
+            return job, False
+
+def lock_job_queue():
+    """
+    Serialize job claims until the end of the transaction, so two workers
+    cannot both count a free slot and run more than QUIZ_JOB_MAX_CONCURRENT
+    jobs. PostgreSQL takes an advisory lock; SQLite already allows a single
+    writer at a time.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [JOB_QUEUE_LOCK_ID])
+
+def claim_next_job(kinds=None):
+    """
+    Mark the queued job that has been available the longest as running and
+    return it, or None if no queued job is available yet or
+    QUIZ_JOB_MAX_CONCURRENT jobs are already running. With kinds, only jobs
+    of those kinds are claimed.
+    """
+    with transaction.atomic():
+        lock_job_queue()
+        running_count = QuizGenerationJob.objects.filter(status='running').count()
+        if running_count >= settings.QUIZ_JOB_MAX_CONCURRENT:
+            return None
+        
+        now = timezone.now()
+        jobs = QuizGenerationJob.objects.select_for_update(skip_locked=True).filter(
+            status='queued', available_at__lte=now
+        )
+        if kinds is not None:
+            jobs = jobs.filter(kind__in=kinds)
+        job = jobs.order_by('available_at').first()
+        if job is None:
+            return None
+        
+        job.status = 'running'
+        job.progress = 10
+        job.attempts += 1
+        job.started_at = now
+        job.heartbeat_at = now
+        job.error = None
+        job.save()
+        return job
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a job that failed on its attempts-th attempt."""
+    return min(settings.QUIZ_JOB_RETRY_DELAY * 2 ** max(0, attempts - 1), settings.QUIZ_JOB_RETRY_MAX_DELAY)
+
+def finish_job(job, **fields):
+    """
+    Record the outcome of a claimed job, unless it was requested again while
+    it ran: then it is queued to run once more, with fresh attempts.
+    """
+    if QuizGenerationJob.objects.filter(id=job.id, rerun=False).update(**fields):
+        return
+    QuizGenerationJob.objects.filter(id=job.id).update(
+        status='queued', rerun=False, progress=0, attempts=0, error=None,
+        available_at=timezone.now(), finished_at=None
+    )
+
+def update_progress(job_id, progress):
+    """Record a running job's progress, which also counts as a heartbeat."""
+    QuizGenerationJob.objects.filter(id=job_id, status='running').update(
+        progress=progress, heartbeat_at=timezone.now()
+    )
+
+def record_heartbeats(job_ids):
+    """Show that the given running jobs are still being worked on."""
+    QuizGenerationJob.objects.filter(id__in=job_ids, status='running').update(heartbeat_at=timezone.now())
+
+def run_job(job):
+    """Run a claimed job and record the outcome."""
+    try:
+        if job.kind == 'ingestion':
+            run_ingestion(job)
+            return
+        quiz, created = get_or_create_quiz(
+            job.material, job.level,
+            regenerate=job.regenerate,
+            on_progress=lambda progress: update_progress(job.id, progress)
+        )
+        finish_job(job, status='succeeded', progress=100, quiz=quiz, finished_at=timezone.now())
+    except CircuitOpenError as e:
+        # OpenAI is unavailable; requeue without using up one of the job's attempts
+        logger.warning(f"Quiz generation job {job.id} postponed: {e}")
+        finish_job(
+            job, status='queued', progress=0, error=str(e), attempts=F('attempts') - 1,
+            available_at=timezone.now() + timedelta(seconds=e.retry_after)
+        )
+    except Exception as e:
+        logger.error(f"Quiz generation job {job.id} failed: {e}")
+        # Unreadable documents will not get better on retry
+        retry = not isinstance(e, TextExtractionError) and job.attempts < settings.QUIZ_JOB_MAX_ATTEMPTS
+        finish_job(
+            job,
+            status='queued' if retry else 'failed',
+            progress=0,
+            error=str(e),
+            available_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)),
+            finished_at=None if retry else timezone.now()
+        )
+    finally:
+        # Jobs run in worker threads, each with its own database connection
+        connection.close()
+
+def run_ingestion(job):
+    """Ingest the study material of a claimed ingestion job and record the outcome."""
+    content = ingest_material(job.material_id)
+    if content is not None and content.status == 'failed':
+        # ingest_material has recorded the error; an unreadable document will not get better on retry
+        finish_job(job, status='failed', progress=0, error=content.error, finished_at=timezone.now())
+    else:
+        finish_job(job, status='succeeded', progress=100, finished_at=timezone.now())
+
+def recover_stuck_jobs():
+    """
+    Requeue running jobs whose worker stopped sending heartbeats (for example
+    after a crash), or fail them once they have used all their attempts and
+    were not requested again. Returns the number of recovered jobs.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.QUIZ_JOB_STALE_AFTER)
+    stuck = QuizGenerationJob.objects.filter(status='running', heartbeat_at__lt=cutoff)
+    error = 'The worker stopped while running this job'
+    
+    exhausted = stuck.filter(attempts__gte=settings.QUIZ_JOB_MAX_ATTEMPTS, rerun=False)
+    abandoned_material_ids = list(exhausted.filter(kind='ingestion').values_list('material_id', flat=True))
+    failed_count = exhausted.update(status='failed', error=error, finished_at=timezone.now())
+    # Don't leave the content of a material that could not be ingested pending forever
+    MaterialContent.objects.filter(material_id__in=abandoned_material_ids, status='pending').update(
+        status='failed', error=error
+    )
+    # The requeued run picks up any request made while the job was stuck
+    requeued_count = stuck.update(status='queued', progress=0, error=error, rerun=False)
+    return failed_count + requeued_count
@@ -0,0 +1,169 @@
+"""
+Materialized leaderboards.
+
+A leaderboard is a scope (a material, subchapter or subject, or global) and
+a window (all time, the current ISO week or the current day). It holds one
+LeaderboardEntry per student: their best attempt in that scope and window,
+ranked by score, then by time taken, then by who got there first. Each new
+quiz score updates the student's entries in the transaction that saves it,
+so reading the top K of a leaderboard reads K rows from an index. When
+scores are deleted, the students' entries are rebuilt by the handler in
+signals.py. `python manage.py rebuild_leaderboards` recomputes the entries
+from the scores and prunes weekly and daily entries of past periods.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import LeaderboardEntry, Quiz, QuizScore
+
+SCOPES = [scope for scope, label in LeaderboardEntry.SCOPE_CHOICES]
+WINDOWS = [window for window, label in LeaderboardEntry.WINDOW_CHOICES]
+
+# Rows written per query when rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+def current_period(window, when=None):
+    """Return the period of a window that a moment (now by default) falls in."""
+    if window == 'all_time':
+        return 'all'
+    day = timezone.localdate(when)
+    if window == 'weekly':
+        year, week, weekday = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.isoformat()
+
+def leaderboard_scopes(material):
+    """Return the (scope, scope_id) of the leaderboards a score on a material counts towards."""
+    return [
+        ('global', 0),
+        ('subject', material.subchapter.chapter.subject_id),
+        ('subchapter', material.subchapter_id),
+        ('material', material.id),
+    ]
+
+def rank_key(score, time_seconds, achieved_at):
+    """Sort key of an attempt, smaller is better."""
+    return (-score, time_seconds, achieved_at)
+
+def existing_entries(user_id, keys):
+    """Return the student's entries for the given (scope, scope_id, window, period) keys by (scope, scope_id, period)."""
+    match = Q()
+    for scope, scope_id, window, period in keys:
+        match |= Q(scope=scope, scope_id=scope_id, period=period)
+    return {
+        (entry.scope, entry.scope_id, entry.period): entry
+        for entry in LeaderboardEntry.objects.filter(match, user_id=user_id)
+    }
+
+def record_leaderboard_score(score):
+    """
+    Enter a newly saved quiz score in the leaderboards of its material,
+    subchapter, subject and the global ones, wherever it beats the
+    student's entry. Call it in the transaction that saved the score.
+    """
+    quiz = Quiz.objects.select_related('material__subchapter__chapter').get(pk=score.quiz_id)
+    keys = [
+        (scope, scope_id, window, current_period(window, score.completed_at))
+        for scope, scope_id in leaderboard_scopes(quiz.material)
+        for window in WINDOWS
+    ]
+    existing = existing_entries(score.user_id, keys)
+    values = {
+        'quiz_score_id': score.id,
+        'score': score.score,
+        'time_seconds': score.time_seconds,
+        'achieved_at': score.completed_at,
+    }
+    missing = []
+    beaten = []
+    for scope, scope_id, window, period in keys:
+        entry = existing.get((scope, scope_id, period))
+        if entry is None:
+            missing.append(LeaderboardEntry(
+                user_id=score.user_id, scope=scope, scope_id=scope_id, window=window, period=period, **values
+            ))
+        elif rank_key(score.score, score.time_seconds, score.completed_at) < rank_key(
+            entry.score, entry.time_seconds, entry.achieved_at
+        ):
+            beaten.append(entry)
+    
+    if missing:
+        # An entry created by a concurrent score is kept; the update below replaces it if this one is better
+        LeaderboardEntry.objects.bulk_create(missing, ignore_conflicts=True)
+        beaten.extend(missing)
+    if beaten:
+        # Only replace entries that are still worse than this attempt when the update runs
+        better = (
+            Q(score__lt=score.score)
+            | Q(score=score.score, time_seconds__gt=score.time_seconds)
+            | Q(score=score.score, time_seconds=score.time_seconds, achieved_at__gt=score.completed_at)
+        )
+        match = Q()
+        for entry in beaten:
+            match |= Q(scope=entry.scope, scope_id=entry.scope_id, period=entry.period)
+        LeaderboardEntry.objects.filter(match, better, user_id=score.user_id).update(**values)
+
+def rebuild_leaderboards(user_ids=None):
+    """
+    Recompute the leaderboard entries of the given users (all users by
+    default) from their quiz scores, for all time and the current week and
+    day. Entries of past weeks and days are dropped. Returns the number of
+    entries written.
+    """
+    now = timezone.now()
+    periods = {window: current_period(window, now) for window in WINDOWS}
+    
+    scores = QuizScore.objects.all()
+    if user_ids is not None:
+        scores = scores.filter(user_id__in=user_ids)
+    scores = scores.values(
+        'id', 'user_id', 'score', 'time_seconds', 'completed_at',
+        material_id=F('quiz__material_id'),
+        subchapter_id=F('quiz__material__subchapter_id'),
+        subject_id=F('quiz__material__subchapter__chapter__subject_id'),
+    ).order_by('-score', 'time_seconds', 'completed_at', 'id')
+    
+    # Scores come best first, so the first one seen for a leaderboard and user is the entry
+    entries = {}
+    for row in scores.iterator():
+        windows = [
+            window for window in WINDOWS
+            if window == 'all_time' or current_period(window, row['completed_at']) == periods[window]
+        ]
+        for scope, scope_id in [('global', 0), ('subject', row['subject_id']),
+                                ('subchapter', row['subchapter_id']), ('material', row['material_id'])]:
+            for window in windows:
+                key = (row['user_id'], scope, scope_id, periods[window])
+                if key not in entries:
+                    entries[key] = LeaderboardEntry(
+                        user_id=row['user_id'], scope=scope, scope_id=scope_id, window=window,
+                        period=periods[window], quiz_score_id=row['id'], score=row['score'],
+                        time_seconds=row['time_seconds'], achieved_at=row['completed_at']
+                    )
+    
+    with transaction.atomic():
+        existing = LeaderboardEntry.objects.all()
+        if user_ids is not None:
+            existing = existing.filter(user_id__in=user_ids)
+        existing.delete()
+        LeaderboardEntry.objects.bulk_create(entries.values(), batch_size=REBUILD_BATCH_SIZE)
+    return len(entries)
+
+def prune_leaderboards():
+    """Delete the weekly and daily entries of past periods. Returns the number deleted."""
+    now = timezone.now()
+    stale = Q()
+    for window in WINDOWS:
+        if window != 'all_time':
+            stale |= Q(window=window) & ~Q(period=current_period(window, now))
+    deleted, _ = LeaderboardEntry.objects.filter(stale).delete()
+    return deleted
+
+def get_leaderboard(scope, scope_id, window, limit):
+    """Return the top `limit` entries of the current period of a leaderboard, best first."""
+    return LeaderboardEntry.objects.filter(
+        scope=scope, scope_id=scope_id, period=current_period(window)
+    ).select_related('user', 'quiz_score').defer('quiz_score__answers_json', 'quiz_score__questions_json').order_by(
+        '-score', 'time_seconds', 'achieved_at'
+    )[:limit]
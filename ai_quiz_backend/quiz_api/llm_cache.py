@@ -0,0 +1,194 @@
+"""
+Response cache for chat completions.
+
+Responses are keyed by a fingerprint of the model, messages (system and user
+prompts) and temperature, so identical generation requests are answered
+without calling the API. The storage backend is chosen with the LLM_CACHE
+setting.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import LLMResponseCacheEntry
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(model, messages, temperature):
+    """Fingerprint a chat-completion request."""
+    payload = json.dumps(
+        {'model': model, 'messages': messages, 'temperature': temperature},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LocMemLRUBackend:
+    """In-process cache that evicts the least recently used entry once full."""
+    
+    def __init__(self, timeout, max_entries, **options):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class DjangoCacheBackend:
+    """Stores responses in a Django cache; size limits come from that cache's own settings."""
+    
+    def __init__(self, timeout, cache_alias='default', **options):
+        self.timeout = timeout
+        self.cache = caches[cache_alias]
+    
+    def get(self, key):
+        return self.cache.get(f"llm:{key}")
+    
+    def set(self, key, value):
+        self.cache.set(f"llm:{key}", value, self.timeout)
+    
+    def clear(self):
+        self.cache.clear()
+
+class DatabaseBackend:
+    """Stores responses in the LLMResponseCacheEntry table, shared by every process."""
+    
+    # Only check the table size every this many writes to keep writes cheap
+    PRUNE_EVERY = 50
+    
+    def __init__(self, timeout, max_entries, **options):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._writes = 0
+    
+    def get(self, key):
+        now = timezone.now()
+        entry = LLMResponseCacheEntry.objects.filter(key=key, expires_at__gt=now).first()
+        if entry is None:
+            return None
+        LLMResponseCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=now)
+        return entry.response
+    
+    def set(self, key, value):
+        now = timezone.now()
+        LLMResponseCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'response': value,
+                'expires_at': now + timedelta(seconds=self.timeout),
+                'last_used_at': now,
+            }
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+    
+    def prune(self):
+        """Delete expired entries and the least recently used ones beyond max_entries."""
+        LLMResponseCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        stale_ids = LLMResponseCacheEntry.objects.order_by('-last_used_at').values_list(
+            'id', flat=True
+        )[self.max_entries:]
+        LLMResponseCacheEntry.objects.filter(id__in=list(stale_ids)).delete()
+    
+    def clear(self):
+        LLMResponseCacheEntry.objects.all().delete()
+
+class NullBackend:
+    """Disables caching."""
+    
+    def __init__(self, **options):
+        pass
+    
+    def get(self, key):
+        return None
+    
+    def set(self, key, value):
+        pass
+    
+    def clear(self):
+        pass
+
+BACKENDS = {
+    'locmem': LocMemLRUBackend,
+    'django': DjangoCacheBackend,
+    'database': DatabaseBackend,
+    'none': NullBackend,
+}
+
+class LLMResponseCache:
+    """
+    Wraps a cache backend so that backend errors are logged instead of
+    stopping generation. Hits and misses are counted by the LLM call metrics
+    (the `cached` label on /metrics/), which cover every process.
+    """
+    
+    def __init__(self, backend):
+        self.backend = backend
+    
+    def get(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never stop generation
+            logger.warning(f"LLM cache lookup failed: {e}")
+            return None
+    
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+    
+    def clear(self):
+        self.backend.clear()
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """Return the process-wide LLM response cache configured by settings.LLM_CACHE."""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                config = settings.LLM_CACHE
+                backend_name = config.get('BACKEND', 'locmem')
+                backend_class = BACKENDS.get(backend_name) or import_string(backend_name)
+                backend = backend_class(
+                    timeout=config.get('TIMEOUT', 7 * 24 * 60 * 60),
+                    max_entries=config.get('MAX_ENTRIES', 1000),
+                    cache_alias=config.get('CACHE_ALIAS', 'default')
+                )
+                _llm_cache = LLMResponseCache(backend)
+    return _llm_cache
@@ -0,0 +1,342 @@
+"""
+Chat-completion providers used for quiz and recommendation generation.
+
+The provider is chosen with the LLM_PROVIDER setting:
+- 'openai': the OpenAI API over shared, pooled sync and async clients,
+  behind a circuit breaker with per-call deadlines and retries
+- 'fake': a deterministic offline stand-in with configurable latency, for
+  load tests and benchmarks without network access or API costs
+- 'record': calls OpenAI and saves every response to LLM_RECORDINGS_DIR
+- 'replay': answers only from responses saved by 'record'
+- or the dotted path of a custom LLMProvider subclass
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from dataclasses import asdict, dataclass
+
+import httpx
+import openai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .circuit_breaker import RETRYABLE_ERRORS, get_circuit_breaker
+
+@dataclass
+class LLMResult:
+    """Content and token usage of one chat completion."""
+    content: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+class LLMReplayMissError(Exception):
+    """Raised in replay mode when no recording exists for a request."""
+
+class LLMProvider:
+    """
+    Base class for chat-completion providers. All requests ask for a JSON
+    object response. `operation` names the kind of request (e.g. 'quiz') for
+    providers that need it.
+    """
+    
+    def complete(self, messages, model, temperature, operation=None):
+        """Return an LLMResult for the messages."""
+        raise NotImplementedError
+    
+    async def acomplete(self, messages, model, temperature, operation=None):
+        """Async version of complete(); runs it in a thread unless overridden."""
+        return await sync_to_async(self.complete, thread_sensitive=False)(
+            messages, model, temperature, operation
+        )
+    
+    def stream(self, messages, model, temperature, operation=None, on_usage=None):
+        """
+        Yield pieces of the response content; yields it whole unless overridden.
+        on_usage, if given, is called with the final LLMResult once the stream ends.
+        """
+        result = self.complete(messages, model, temperature, operation)
+        yield result.content
+        if on_usage:
+            on_usage(result)
+
+class OpenAIProvider(LLMProvider):
+    """
+    Calls the OpenAI API through one lazily created client with a pooled
+    keep-alive HTTP connection, plus one async client per event loop (httpx
+    async connections belong to the loop that opened them).
+    """
+    
+    def __init__(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+    
+    def get_client(self):
+        """Return the shared OpenAI client, creating it and its connection pool on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(
+                        api_key=settings.OPENAI_API_KEY,
+                        timeout=self._timeout(),
+                        max_retries=0,  # Retries are made by the circuit breaker
+                        http_client=httpx.Client(limits=self._connection_limits(), timeout=self._timeout())
+                    )
+        return self._client
+    
+    def get_async_client(self):
+        """Return the shared async OpenAI client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._client_lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = openai.AsyncOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=self._timeout(),
+                    max_retries=0,  # Retries are made by the circuit breaker
+                    http_client=httpx.AsyncClient(limits=self._connection_limits(), timeout=self._timeout())
+                )
+                self._async_clients[loop] = client
+        return client
+    
+    def _timeout(self, seconds=None):
+        seconds = seconds or settings.OPENAI_TIMEOUT
+        return httpx.Timeout(seconds, connect=min(seconds, settings.OPENAI_CONNECT_TIMEOUT))
+    
+    def _connection_limits(self):
+        return httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS
+        )
+    
+    def _result(self, response, model):
+        usage = response.usage
+        return LLMResult(
+            content=response.choices[0].message.content,
+            model=response.model or model,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0
+        )
+    
+    def complete(self, messages, model, temperature, operation=None):
+        response = get_circuit_breaker().call(lambda timeout: self.get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format={"type": "json_object"},
+            timeout=self._timeout(timeout)
+        ))
+        return self._result(response, model)
+    
+    async def acomplete(self, messages, model, temperature, operation=None):
+        response = await get_circuit_breaker().acall(lambda timeout: self.get_async_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format={"type": "json_object"},
+            timeout=self._timeout(timeout)
+        ))
+        return self._result(response, model)
+    
+    def stream(self, messages, model, temperature, operation=None, on_usage=None):
+        breaker = get_circuit_breaker()
+        stream = breaker.call(lambda timeout: self.get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            response_format={"type": "json_object"},
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=self._timeout(timeout)
+        ))
+        pieces = []
+        result = LLMResult(content='', model=model)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                # The last chunk has no choices and carries the token usage
+                if chunk.usage:
+                    result.model = chunk.model or model
+                    result.prompt_tokens = chunk.usage.prompt_tokens
+                    result.completion_tokens = chunk.usage.completion_tokens
+        except RETRYABLE_ERRORS:
+            # The stream broke off after it started; too late to retry
+            breaker.record_failure()
+            raise
+        finally:
+            # Release the HTTP connection, also when the consumer stops reading early
+            stream.close()
+        if on_usage:
+            result.content = "".join(pieces)
+            on_usage(result)
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline stand-in for OpenAI. The same request always gets
+    the same well-formed response, built from words of the prompt, after
+    LLM_FAKE_LATENCY seconds.
+    """
+    
+    # Number of pieces a streamed fake response is split into
+    STREAM_PIECES = 20
+    
+    def __init__(self, latency=None):
+        self.latency = settings.LLM_FAKE_LATENCY if latency is None else latency
+    
+    def complete(self, messages, model, temperature, operation=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._result(messages, model, operation)
+    
+    async def acomplete(self, messages, model, temperature, operation=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._result(messages, model, operation)
+    
+    def stream(self, messages, model, temperature, operation=None, on_usage=None):
+        result = self._result(messages, model, operation)
+        content = result.content
+        piece_size = max(1, -(-len(content) // self.STREAM_PIECES))
+        for start in range(0, len(content), piece_size):
+            if self.latency:
+                time.sleep(self.latency / self.STREAM_PIECES)
+            yield content[start:start + piece_size]
+        if on_usage:
+            on_usage(result)
+    
+    def _result(self, messages, model, operation):
+        prompt = "\n".join(message['content'] for message in messages)
+        seed = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        rng = random.Random(seed)
+        words = sorted(set(re.findall(r'[^\W\d_]{4,}', prompt.lower()))) or ['answer']
+        
+        if operation == 'multi_level_quiz':
+            instructions = prompt.split('Study material:')[0]
+            levels = re.findall(r'^\s*- (\w+):', instructions, re.MULTILINE)
+            payload = {level: self._questions(rng, words, self._question_count(prompt)) for level in levels}
+        elif operation in ('quiz', 'quiz_repair'):
+            payload = {'questions': self._questions(rng, words, self._question_count(prompt))}
+        elif operation == 'summary':
+            payload = {
+                'key_concepts': [f"About {word}" for word in rng.sample(words, min(4, len(words)))],
+                'vocabulary': [f"{word} - a word from the lesson" for word in rng.sample(words, min(4, len(words)))],
+                'learning_objectives': [f"Explain {word}" for word in rng.sample(words, min(2, len(words)))],
+            }
+        elif operation == 'recommendations':
+            payload = {'recommendations': [
+                f"Review the lesson about '{rng.choice(words)}' and try the quiz again." for _ in range(3)
+            ]}
+        else:
+            payload = {}
+        
+        content = json.dumps(payload)
+        return LLMResult(
+            content=content,
+            model=f"fake-{model}",
+            prompt_tokens=len(prompt) // 4 + 1,
+            completion_tokens=len(content) // 4 + 1
+        )
+    
+    def _question_count(self, prompt):
+        match = re.search(r'(\d+) multiple-choice questions', prompt)
+        return int(match.group(1)) if match else 5
+    
+    def _questions(self, rng, words, count):
+        questions = []
+        for number in range(1, count + 1):
+            options = rng.sample(words, 4) if len(words) >= 4 else [f"{words[0]} {i}" for i in range(1, 5)]
+            questions.append({
+                'question': f"Question {number}: which word is about '{options[0]}'?",
+                'options': options,
+                'correct_answer': options[0],
+                'explanation': f"The study material talks about '{options[0]}'."
+            })
+        return questions
+
+class RecordReplayProvider(LLMProvider):
+    """
+    In 'record' mode, passes requests to another provider and saves each
+    response as a JSON file named after the request fingerprint. In 'replay'
+    mode, answers only from those files, without network access. Streamed
+    and non-streamed requests share the same recordings.
+    """
+    
+    def __init__(self, mode, directory=None, inner=None):
+        self.mode = mode
+        self.directory = directory or settings.LLM_RECORDINGS_DIR
+        self.inner = inner or OpenAIProvider()
+    
+    def _path(self, messages, model, temperature):
+        # Imported here to avoid a circular import with the cache's model import
+        from .llm_cache import make_cache_key
+        return os.path.join(self.directory, f"{make_cache_key(model, messages, temperature)}.json")
+    
+    def _load(self, path):
+        if not os.path.exists(path):
+            raise LLMReplayMissError(f"No recorded response for this request ({os.path.basename(path)})")
+        with open(path, encoding='utf-8') as f:
+            return LLMResult(**json.load(f)['result'])
+    
+    def _save(self, path, messages, operation, result):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'operation': operation, 'messages': messages, 'result': asdict(result)}, f, indent=2)
+    
+    def complete(self, messages, model, temperature, operation=None):
+        path = self._path(messages, model, temperature)
+        if self.mode == 'replay':
+            return self._load(path)
+        
+        result = self.inner.complete(messages, model, temperature, operation)
+        self._save(path, messages, operation, result)
+        return result
+    
+    def stream(self, messages, model, temperature, operation=None, on_usage=None):
+        path = self._path(messages, model, temperature)
+        if self.mode == 'replay':
+            result = self._load(path)
+            yield result.content
+            if on_usage:
+                on_usage(result)
+            return
+        
+        results = []
+        yield from self.inner.stream(messages, model, temperature, operation, results.append)
+        # Only a stream that ran to the end has a complete response to record
+        result = results[0] if results else None
+        if result:
+            self._save(path, messages, operation, result)
+            if on_usage:
+                on_usage(result)
+
+_llm_provider = None
+_llm_provider_lock = threading.Lock()
+
+def create_llm_provider(name):
+    """Create the provider for an LLM_PROVIDER setting value."""
+    if name == 'openai':
+        return OpenAIProvider()
+    if name == 'fake':
+        return FakeProvider()
+    if name in ('record', 'replay'):
+        return RecordReplayProvider(name)
+    return import_string(name)()
+
+def get_llm_provider():
+    """Return the process-wide provider configured by settings.LLM_PROVIDER."""
+    global _llm_provider
+    if _llm_provider is None:
+        with _llm_provider_lock:
+            if _llm_provider is None:
+                _llm_provider = create_llm_provider(settings.LLM_PROVIDER)
+    return _llm_provider
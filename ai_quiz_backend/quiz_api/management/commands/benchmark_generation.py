@@ -0,0 +1,88 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quiz_api.models import StudyMaterial
+from quiz_api.ingestion import get_material_text
+from quiz_api.metrics import percentile
+from quiz_api.openai_utils import (
+    build_quiz_messages, parse_quiz_response,
+    build_recommendation_messages, parse_recommendation_response,
+    create_chat_completion, QUIZ_TEXT_BUDGET
+)
+
+SAMPLE_TEXT = (
+    "Plants need water, sunlight and air to grow. The roots take in water from the soil, "
+    "the leaves use sunlight to make food and the stem carries water to every part of the plant. "
+    "Animals need food, water and shelter. Some animals eat plants, some eat other animals "
+    "and some eat both."
+)
+
+
+class Command(BaseCommand):
+    help = ("Measure quiz and recommendation generation throughput and latency through the "
+            "configured LLM provider (set LLM_PROVIDER=fake or replay to run offline)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operation", choices=["quiz", "recommendations"], default="quiz",
+                            help="Kind of generation call to benchmark (default: quiz)")
+        parser.add_argument("--requests", type=int, default=50, help="Number of calls to make (default: 50)")
+        parser.add_argument("--concurrency", type=int, default=4,
+                            help="Number of calls made at the same time (default: 4)")
+        parser.add_argument("--material-id", type=int,
+                            help="Use this study material's text instead of a built-in sample")
+
+    def handle(self, *args, **options):
+        text = SAMPLE_TEXT
+        if options["material_id"]:
+            try:
+                material = StudyMaterial.objects.get(id=options["material_id"])
+            except StudyMaterial.DoesNotExist:
+                raise CommandError(f"Study material with ID {options['material_id']} does not exist.")
+            text = get_material_text(material, QUIZ_TEXT_BUDGET)
+            if not text:
+                raise CommandError(f"Could not extract text from study material {material.id}.")
+
+        operation = options["operation"]
+        if operation == "quiz":
+            messages = build_quiz_messages(text, "Beginner", 5)
+            parse = parse_quiz_response
+        else:
+            user_data = {"avg_score": 55.0, "strengths": ["Animals"], "weaknesses": ["Plants"]}
+            question_data = [{"material": "Living Things", "level": "Beginner", "score": 55.0,
+                              "attempts": 2, "missed": 2, "total": 5,
+                              "concepts": ["Plants need water and sunlight", "Roots take in water"]}]
+            messages = build_recommendation_messages(user_data, question_data)
+            parse = parse_recommendation_response
+
+        # The response cache is bypassed so every call reaches the provider
+        def timed_call(_):
+            started_at = time.monotonic()
+            try:
+                ok = bool(parse(create_chat_completion(messages, operation).content))
+            except Exception:
+                ok = False
+            return time.monotonic() - started_at, ok
+
+        self.stdout.write(f"Benchmarking {options['requests']} {operation} calls with concurrency "
+                          f"{options['concurrency']} against the '{settings.LLM_PROVIDER}' provider...")
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            results = list(executor.map(timed_call, range(options["requests"])))
+        elapsed = time.monotonic() - started_at
+
+        latencies = sorted(latency for latency, _ in results)
+        failed_count = sum(1 for _, ok in results if not ok)
+        self.stdout.write(f"Completed {len(results)} calls in {elapsed:.2f}s "
+                          f"({len(results) / elapsed:.1f} calls/s, {failed_count} failed).")
+        if latencies:
+            self.stdout.write(
+                f"Latency: mean {statistics.mean(latencies) * 1000:.0f}ms, "
+                f"p50 {percentile(latencies, 50) * 1000:.0f}ms, "
+                f"p95 {percentile(latencies, 95) * 1000:.0f}ms, "
+                f"p99 {percentile(latencies, 99) * 1000:.0f}ms"
+            )
+
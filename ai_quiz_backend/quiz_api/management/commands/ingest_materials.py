@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from quiz_api.models import StudyMaterial
+from quiz_api.ingestion import ingest_material
+
+
+class Command(BaseCommand):
+    help = "Extract text and build the chunk index for study materials"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--material-id", type=int, help="Only ingest this study material")
+        parser.add_argument("--all", action="store_true",
+                            help="Re-ingest every material, not just those without ready content")
+
+    def handle(self, *args, **options):
+        materials = StudyMaterial.objects.all()
+        if options["material_id"]:
+            materials = materials.filter(id=options["material_id"])
+        elif not options["all"]:
+            materials = materials.exclude(content__status='ready')
+
+        ready_count = 0
+        total_count = 0
+        for material_id in materials.values_list('id', flat=True):
+            total_count += 1
+            content = ingest_material(material_id)
+            if content and content.status == 'ready':
+                ready_count += 1
+            else:
+                self.stderr.write(f"Could not ingest study material {material_id}")
+
+        self.stdout.write(f"Ingested {ready_count} out of {total_count} study materials.")
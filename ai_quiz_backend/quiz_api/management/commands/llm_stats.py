@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from quiz_api.metrics import llm_call_stats
+
+
+class Command(BaseCommand):
+    help = "Summarize LLM call latency percentiles, outcomes, token usage and cost per operation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24,
+                            help="Only include calls from the last this many hours (default: 24)")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options["hours"])
+        stats = llm_call_stats(since)
+        if not stats:
+            self.stdout.write(f"No LLM calls in the last {options['hours']:g} hours.")
+            return
+
+        for operation, data in stats.items():
+            outcomes = ", ".join(f"{outcome} {count}" for outcome, count in sorted(data["outcomes"].items()))
+            latency = data["latency_ms"]
+            self.stdout.write(f"\n{operation}: {data['calls']} calls ({outcomes}), {data['cache_hits']} cache hits")
+            self.stdout.write(f"  Latency: p50 {latency['p50']}ms, p95 {latency['p95']}ms, p99 {latency['p99']}ms")
+            self.stdout.write(f"  Tokens per call: {data['avg_prompt_tokens']:.0f} prompt, "
+                              f"{data['avg_completion_tokens']:.0f} completion")
+            self.stdout.write(f"  Cost per call: ${data['avg_cost_usd']:.4f}")
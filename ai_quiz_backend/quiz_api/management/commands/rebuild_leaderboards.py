@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from quiz_api.leaderboards import prune_leaderboards, rebuild_leaderboards
+
+
+class Command(BaseCommand):
+    help = "Recompute the materialized leaderboards from the quiz scores, or prune their past weekly and daily entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                            help="Only rebuild this user's entries (can be repeated)")
+        parser.add_argument("--prune", action="store_true",
+                            help="Only delete the weekly and daily entries of past weeks and days")
+
+    def handle(self, *args, **options):
+        if options["prune"]:
+            count = prune_leaderboards()
+            self.stdout.write(f"Deleted {count} past leaderboard entr{'y' if count == 1 else 'ies'}.")
+            return
+        count = rebuild_leaderboards(options["user_ids"])
+        self.stdout.write(f"Wrote {count} leaderboard entr{'y' if count == 1 else 'ies'}.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from quiz_api.performance import rebuild_student_performance
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-student performance aggregates behind the student report from the quiz scores"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                            help="Only rebuild this user's aggregates (can be repeated)")
+
+    def handle(self, *args, **options):
+        count = rebuild_student_performance(options["user_ids"])
+        self.stdout.write(f"Wrote {count} performance row(s).")
@@ -0,0 +1,79 @@
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quiz_api.circuit_breaker import get_circuit_breaker
+from quiz_api.jobs import claim_next_job, record_heartbeats, recover_stuck_jobs, run_job
+from quiz_api.recommendations import claim_next_refresh, run_refresh
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs: ingestion, quiz generation and study recommendation refreshes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=settings.QUIZ_JOB_MAX_CONCURRENT,
+                            help="Number of jobs this worker runs at the same time")
+        parser.add_argument("--poll-interval", type=float, default=settings.QUIZ_JOB_POLL_INTERVAL,
+                            help="Seconds to wait between checks for new jobs")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit once the queue is empty instead of waiting for new jobs")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        concurrency = options["concurrency"]
+        running = {}  # job id -> future
+        refreshing = {}  # user id -> future of a recommendation refresh
+        self.stdout.write(f"Worker started with concurrency {concurrency}.")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                running = {job_id: future for job_id, future in running.items() if not future.done()}
+                refreshing = {user_id: future for user_id, future in refreshing.items() if not future.done()}
+                if running:
+                    record_heartbeats(list(running))
+
+                recovered = recover_stuck_jobs()
+                if recovered:
+                    self.stdout.write(f"Recovered {recovered} stuck job(s).")
+
+                # Leave quiz jobs queued while OpenAI calls would fail fast anyway;
+                # ingestion only needs OpenAI for the summary, which it skips then
+                paused = get_circuit_breaker().retry_after() > 0
+
+                claimed = False
+                while not self.stopping and len(running) + len(refreshing) < concurrency:
+                    job = claim_next_job(kinds=['ingestion'] if paused else None)
+                    if job is None:
+                        break
+                    claimed = True
+                    if job.kind == 'ingestion':
+                        self.stdout.write(f"Running job {job.id}: ingestion of material {job.material_id}")
+                    else:
+                        self.stdout.write(f"Running job {job.id}: {job.level} quiz for material {job.material_id}")
+                    running[job.id] = executor.submit(run_job, job)
+
+                # Quiz generation goes first; recommendation refreshes use the spare capacity
+                while not self.stopping and not paused and len(running) + len(refreshing) < concurrency:
+                    state = claim_next_refresh()
+                    if state is None:
+                        break
+                    claimed = True
+                    self.stdout.write(f"Refreshing study recommendations for user {state.user_id}")
+                    refreshing[state.user_id] = executor.submit(run_refresh, state)
+
+                if self.stopping or (options["once"] and not running and not refreshing and not claimed):
+                    break
+                time.sleep(options["poll_interval"])
+
+        self.stdout.write("Worker stopped.")
+
+    def stop(self, signum, frame):
+        """Stop claiming new jobs and exit once the running ones finish."""
+        self.stdout.write("Stopping after the running jobs finish...")
+        self.stopping = True
@@ -0,0 +1,294 @@
+"""
+Latency, token-usage and outcome metrics for chat-completion calls.
+
+Every call made through openai_utils is recorded as an LLMCallMetric row,
+so the numbers are shared by all web and worker processes, and added to
+the LLMCallCounter totals. The rows are pruned after a retention period
+and summarized with percentiles by the llm_stats management command; the
+totals are never pruned and are exposed as Prometheus counters by the
+/metrics/ endpoint, which reads a few hundred rows at most.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .circuit_breaker import STATE_VALUES, CircuitOpenError, get_circuit_states
+from .models import LLMCallCounter, LLMCallMetric
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+# Only delete metrics older than the retention period every this many writes
+PRUNE_EVERY = 500
+
+_writes = 0
+_writes_lock = threading.Lock()
+
+def token_cost(model, prompt_tokens, completion_tokens):
+    """Return the USD cost of a call, using the longest matching LLM_TOKEN_PRICES prefix."""
+    prices = [
+        (prefix, price) for prefix, price in settings.LLM_TOKEN_PRICES.items()
+        if model.startswith(prefix)
+    ]
+    if not prices:
+        return 0.0
+    prompt_price, completion_price = max(prices, key=lambda item: len(item[0]))[1]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+class LLMCallTracker:
+    """
+    Context manager that times one chat-completion call and records it when
+    the block exits. Exceptions raised while parsing (after parsing()) count
+    as parse errors, calls refused by the circuit breaker as 'circuit_open',
+    streams closed before they finished (e.g. the client disconnected) as
+    'aborted' and any other exception as an API error; the exception still
+    propagates. Use `async with` from async code.
+    """
+    
+    def __init__(self, operation, model):
+        self.operation = operation or 'unknown'
+        self.model = model
+        self.cached = False
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.result = None
+        self._parsing = False
+    
+    def add_usage(self, llm_result):
+        """Record the model and token usage of a provider LLMResult."""
+        self.model = llm_result.model
+        self.prompt_tokens = llm_result.prompt_tokens
+        self.completion_tokens = llm_result.completion_tokens
+    
+    def parsing(self):
+        """Mark that the response has arrived and is being parsed."""
+        self._parsing = True
+    
+    def finish(self, result):
+        """Record the parsed result; an empty result counts as an 'empty' outcome."""
+        self.result = result
+    
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.save(exc_type)
+        return False
+    
+    async def __aenter__(self):
+        return self.__enter__()
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await sync_to_async(self.save)(exc_type)
+        return False
+    
+    def outcome(self, exc_type=None):
+        if exc_type is not None and issubclass(exc_type, CircuitOpenError):
+            return 'circuit_open'
+        if exc_type is not None and issubclass(exc_type, GeneratorExit):
+            return 'aborted'
+        if exc_type is not None:
+            return 'parse_error' if self._parsing else 'api_error'
+        return 'ok' if self.result else 'empty'
+    
+    def save(self, exc_type=None):
+        """Store the call; metrics problems are logged and never break generation."""
+        try:
+            record_llm_call(
+                operation=self.operation,
+                model=self.model,
+                outcome=self.outcome(exc_type),
+                cached=self.cached,
+                latency_ms=round((time.monotonic() - self.started_at) * 1000),
+                prompt_tokens=self.prompt_tokens,
+                completion_tokens=self.completion_tokens,
+            )
+        except Exception as e:
+            logger.error(f"Error recording LLM call metric: {e}")
+
+def latency_bucket(latency_ms):
+    """Return the index of the first LATENCY_BUCKETS bound a latency falls under, or len(LATENCY_BUCKETS)."""
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if latency_ms <= bound * 1000:
+            return index
+    return len(LATENCY_BUCKETS)
+
+def count_llm_call(operation, model, outcome, cached, latency_ms, prompt_tokens, completion_tokens):
+    """Add one call to its LLMCallCounter row, creating the row for the first such call."""
+    key = {
+        'operation': operation, 'model': model, 'outcome': outcome, 'cached': cached,
+        'latency_bucket': latency_bucket(latency_ms),
+    }
+    increments = {
+        'calls': F('calls') + 1,
+        'latency_ms': F('latency_ms') + latency_ms,
+        'prompt_tokens': F('prompt_tokens') + prompt_tokens,
+        'completion_tokens': F('completion_tokens') + completion_tokens,
+    }
+    if LLMCallCounter.objects.filter(**key).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            LLMCallCounter.objects.create(
+                calls=1, latency_ms=latency_ms, prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens, **key
+            )
+    except IntegrityError:
+        # Another process created the row at the same time
+        LLMCallCounter.objects.filter(**key).update(**increments)
+
+def record_llm_call(**fields):
+    """
+    Store one LLMCallMetric row and add the call to the counters, pruning
+    old rows every PRUNE_EVERY writes.
+    """
+    global _writes
+    with transaction.atomic():
+        metric = LLMCallMetric.objects.create(**fields)
+        count_llm_call(**fields)
+    with _writes_lock:
+        _writes += 1
+        prune = _writes % PRUNE_EVERY == 0
+    if prune:
+        prune_llm_metrics()
+    return metric
+
+def prune_llm_metrics():
+    """Delete metrics older than LLM_METRICS_RETENTION_DAYS; the LLMCallCounter totals are kept."""
+    cutoff = timezone.now() - timedelta(days=settings.LLM_METRICS_RETENTION_DAYS)
+    return LLMCallMetric.objects.filter(created_at__lt=cutoff).delete()[0]
+
+def percentile(sorted_values, percent):
+    """Return the nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, round(percent / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+def llm_call_stats(since=None):
+    """
+    Summarize calls per operation: call and outcome counts, cache hits,
+    p50/p95/p99 latency of calls that reached the model, average tokens and
+    average cost per call.
+    """
+    metrics = LLMCallMetric.objects.all()
+    if since is not None:
+        metrics = metrics.filter(created_at__gte=since)
+    
+    stats = {}
+    for operation in metrics.values_list('operation', flat=True).distinct().order_by('operation'):
+        calls = metrics.filter(operation=operation)
+        outcomes = dict(calls.values_list('outcome').annotate(count=Count('id')).order_by())
+        uncached = calls.filter(cached=False)
+        latencies = list(uncached.order_by('latency_ms').values_list('latency_ms', flat=True))
+        
+        cost = 0.0
+        for model, prompt_tokens, completion_tokens in uncached.values_list('model').annotate(
+            prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens')
+        ).order_by():
+            cost += token_cost(model, prompt_tokens, completion_tokens)
+        
+        uncached_count = len(latencies)
+        tokens = uncached.aggregate(prompt=Sum('prompt_tokens'), completion=Sum('completion_tokens'))
+        stats[operation] = {
+            'calls': sum(outcomes.values()),
+            'outcomes': outcomes,
+            'cache_hits': calls.filter(cached=True).count(),
+            'latency_ms': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+            },
+            'avg_prompt_tokens': (tokens['prompt'] or 0) / uncached_count if uncached_count else 0,
+            'avg_completion_tokens': (tokens['completion'] or 0) / uncached_count if uncached_count else 0,
+            'avg_cost_usd': cost / uncached_count if uncached_count else 0,
+        }
+    return stats
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+def render_prometheus_metrics():
+    """Render the LLM call counters in the Prometheus text exposition format."""
+    calls = {}
+    histograms = {}
+    tokens = {}
+    for counter in LLMCallCounter.objects.all():
+        key = (counter.operation, counter.model, counter.outcome, counter.cached)
+        calls[key] = calls.get(key, 0) + counter.calls
+        if counter.cached:
+            continue
+        # Latency of calls that reached the model; cache hits would skew the histogram
+        histogram = histograms.setdefault(counter.operation, {
+            'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'count': 0, 'total_ms': 0
+        })
+        histogram['buckets'][counter.latency_bucket] += counter.calls
+        histogram['count'] += counter.calls
+        histogram['total_ms'] += counter.latency_ms
+        usage = tokens.setdefault((counter.operation, counter.model), {'prompt': 0, 'completion': 0})
+        usage['prompt'] += counter.prompt_tokens
+        usage['completion'] += counter.completion_tokens
+    
+    lines = []
+    lines.append("# HELP quizwhiz_llm_calls_total Chat-completion calls by operation, model, outcome and cache use.")
+    lines.append("# TYPE quizwhiz_llm_calls_total counter")
+    for (operation, model, outcome, cached), count in sorted(calls.items()):
+        labels = _labels(operation=operation, model=model, outcome=outcome, cached=str(cached).lower())
+        lines.append(f"quizwhiz_llm_calls_total{labels} {count}")
+    
+    lines.append("# HELP quizwhiz_llm_call_duration_seconds Latency of uncached chat-completion calls.")
+    lines.append("# TYPE quizwhiz_llm_call_duration_seconds histogram")
+    for operation, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+            cumulative += count
+            labels = _labels(operation=operation, le=bound)
+            lines.append(f"quizwhiz_llm_call_duration_seconds_bucket{labels} {cumulative}")
+        labels = _labels(operation=operation, le="+Inf")
+        lines.append(f"quizwhiz_llm_call_duration_seconds_bucket{labels} {histogram['count']}")
+        labels = _labels(operation=operation)
+        lines.append(f"quizwhiz_llm_call_duration_seconds_sum{labels} {histogram['total_ms'] / 1000}")
+        lines.append(f"quizwhiz_llm_call_duration_seconds_count{labels} {histogram['count']}")
+    
+    lines.append("# HELP quizwhiz_llm_tokens_total Tokens used by chat-completion calls.")
+    lines.append("# TYPE quizwhiz_llm_tokens_total counter")
+    for (operation, model), usage in sorted(tokens.items()):
+        for token_type in ('prompt', 'completion'):
+            labels = _labels(operation=operation, model=model, type=token_type)
+            lines.append(f"quizwhiz_llm_tokens_total{labels} {usage[token_type]}")
+    
+    lines.append("# HELP quizwhiz_llm_cost_usd_total Estimated cost of chat-completion calls in USD.")
+    lines.append("# TYPE quizwhiz_llm_cost_usd_total counter")
+    for (operation, model), usage in sorted(tokens.items()):
+        labels = _labels(operation=operation, model=model)
+        cost = token_cost(model, usage['prompt'], usage['completion'])
+        lines.append(f"quizwhiz_llm_cost_usd_total{labels} {cost:.6f}")
+    
+    circuits = get_circuit_states()
+    lines.append("# HELP quizwhiz_llm_circuit_state Circuit breaker state (0 closed, 1 half-open, 2 open).")
+    lines.append("# TYPE quizwhiz_llm_circuit_state gauge")
+    for circuit in circuits:
+        lines.append(f"quizwhiz_llm_circuit_state{_labels(service=circuit.name)} {STATE_VALUES[circuit.state]}")
+    lines.append("# HELP quizwhiz_llm_circuit_opened_total Times the circuit breaker opened.")
+    lines.append("# TYPE quizwhiz_llm_circuit_opened_total counter")
+    for circuit in circuits:
+        lines.append(f"quizwhiz_llm_circuit_opened_total{_labels(service=circuit.name)} {circuit.opened_total}")
+    lines.append("# HELP quizwhiz_llm_circuit_rejected_total Calls refused while the circuit was open.")
+    lines.append("# TYPE quizwhiz_llm_circuit_rejected_total counter")
+    for circuit in circuits:
+        lines.append(f"quizwhiz_llm_circuit_rejected_total{_labels(service=circuit.name)} {circuit.rejected_total}")
+    
+    return "\n".join(lines) + "\n"
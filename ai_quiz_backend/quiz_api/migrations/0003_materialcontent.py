@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0002_extractedtext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('page_count', models.IntegerField(blank=True, null=True)),
+                ('word_count', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('extracted_text', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='materials', to='quiz_api.extractedtext')),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='content', to='quiz_api.studymaterial')),
+            ],
+        ),
+    ]
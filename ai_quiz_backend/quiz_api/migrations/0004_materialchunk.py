@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0003_materialcontent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('text', models.TextField()),
+                ('vector_json', models.TextField()),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='quiz_api.studymaterial')),
+            ],
+            options={
+                'ordering': ['material', 'position'],
+                'unique_together': {('material', 'position')},
+            },
+        ),
+    ]
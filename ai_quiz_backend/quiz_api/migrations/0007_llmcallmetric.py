@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0006_quizgenerationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCallMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('empty', 'Empty'), ('parse_error', 'Parse Error'), ('api_error', 'API Error')], max_length=20)),
+                ('cached', models.BooleanField(default=False)),
+                ('latency_ms', models.PositiveIntegerField()),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['operation', 'created_at'], name='quiz_api_ll_operati_020fa1_idx')],
+            },
+        ),
+    ]
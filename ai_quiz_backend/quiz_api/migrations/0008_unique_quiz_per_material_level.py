@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:22
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_quizzes(apps, schema_editor):
+    """Keep the newest quiz per material and level, moving scores and jobs of the others to it."""
+    Quiz = apps.get_model('quiz_api', 'Quiz')
+    QuizScore = apps.get_model('quiz_api', 'QuizScore')
+    QuizGenerationJob = apps.get_model('quiz_api', 'QuizGenerationJob')
+    
+    duplicates = Quiz.objects.values('material_id', 'level').annotate(count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        quiz_ids = list(Quiz.objects.filter(
+            material_id=duplicate['material_id'], level=duplicate['level']
+        ).order_by('-created_at', '-id').values_list('id', flat=True))
+        keep_id, remove_ids = quiz_ids[0], quiz_ids[1:]
+        QuizScore.objects.filter(quiz_id__in=remove_ids).update(quiz_id=keep_id)
+        QuizGenerationJob.objects.filter(quiz_id__in=remove_ids).update(quiz_id=keep_id)
+        Quiz.objects.filter(id__in=remove_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0007_llmcallmetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizgenerationjob',
+            name='regenerate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(merge_duplicate_quizzes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='quiz',
+            constraint=models.UniqueConstraint(fields=('material', 'level'), name='unique_quiz_per_material_level'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0008_unique_quiz_per_material_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizscore',
+            name='variant_seed',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='QuestionBank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('Beginner', 'Beginner'), ('Intermediate', 'Intermediate'), ('Advanced', 'Advanced')], max_length=20)),
+                ('questions_json', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_banks', to='quiz_api.studymaterial')),
+            ],
+            options={
+                'unique_together': {('material', 'level')},
+            },
+        ),
+    ]
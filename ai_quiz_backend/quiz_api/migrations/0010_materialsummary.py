@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0009_questionbank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('summary_json', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='quiz_api.studymaterial')),
+            ],
+        ),
+    ]
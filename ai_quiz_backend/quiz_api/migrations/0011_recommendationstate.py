@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0010_materialsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending_since', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('last_score_at', models.DateTimeField(blank=True, null=True)),
+                ('refresh_started_at', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_state', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0011_recommendationstate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmcallmetric',
+            name='outcome',
+            field=models.CharField(choices=[('ok', 'OK'), ('empty', 'Empty'), ('parse_error', 'Parse Error'), ('api_error', 'API Error'), ('circuit_open', 'Circuit Open')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:10
+
+import json
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# (model, text field, new JSON field)
+JSON_FIELDS = [
+    ('Quiz', 'questions_json', 'questions_data'),
+    ('QuestionBank', 'questions_json', 'questions_data'),
+    ('QuizScore', 'answers_json', 'answers_data'),
+]
+
+BATCH_SIZE = 500
+
+
+def decode_json_text(apps, schema_editor):
+    """Copy the JSON text columns into the new native JSON columns."""
+    for model_name, text_field, json_field in JSON_FIELDS:
+        model = apps.get_model('quiz_api', model_name)
+        batch = []
+        for row in model.objects.only('id', text_field).iterator(chunk_size=BATCH_SIZE):
+            text = getattr(row, text_field)
+            try:
+                value = json.loads(text) if text else None
+            except ValueError:
+                logger.warning(f"{model_name} {row.id} has invalid JSON in {text_field}; it is left empty")
+                value = None
+            if value is None and model_name != 'QuizScore':
+                value = []
+            setattr(row, json_field, value)
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, [json_field])
+                batch = []
+        model.objects.bulk_update(batch, [json_field])
+
+
+def encode_json_text(apps, schema_editor):
+    """Copy the native JSON columns back into the JSON text columns."""
+    for model_name, text_field, json_field in JSON_FIELDS:
+        model = apps.get_model('quiz_api', model_name)
+        batch = []
+        for row in model.objects.only('id', json_field).iterator(chunk_size=BATCH_SIZE):
+            value = getattr(row, json_field)
+            setattr(row, text_field, None if value is None else json.dumps(value))
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_update(batch, [text_field])
+                batch = []
+        model.objects.bulk_update(batch, [text_field])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0012_llmcallmetric_circuit_open_outcome'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='questions_data',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='questionbank',
+            name='questions_data',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='quizscore',
+            name='answers_data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        # The text columns must accept NULL while the reverse migration refills them
+        migrations.AlterField(
+            model_name='quiz',
+            name='questions_json',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='questionbank',
+            name='questions_json',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(decode_json_text, encode_json_text),
+        migrations.RemoveField(
+            model_name='quiz',
+            name='questions_json',
+        ),
+        migrations.RemoveField(
+            model_name='questionbank',
+            name='questions_json',
+        ),
+        migrations.RemoveField(
+            model_name='quizscore',
+            name='answers_json',
+        ),
+        migrations.RenameField(
+            model_name='quiz',
+            old_name='questions_data',
+            new_name='questions_json',
+        ),
+        migrations.RenameField(
+            model_name='questionbank',
+            old_name='questions_data',
+            new_name='questions_json',
+        ),
+        migrations.RenameField(
+            model_name='quizscore',
+            old_name='answers_data',
+            new_name='answers_json',
+        ),
+    ]
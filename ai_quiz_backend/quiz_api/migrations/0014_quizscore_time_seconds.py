@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:34
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+
+def parse_time_taken(text):
+    """Parse "m:ss" or "h:mm:ss" into seconds; unreadable values count as 0."""
+    try:
+        seconds = 0
+        for part in str(text or '0').strip().split(':'):
+            seconds = seconds * 60 + int(part)
+        return max(seconds, 0)
+    except ValueError:
+        return None
+
+
+def fill_time_seconds(apps, schema_editor):
+    QuizScore = apps.get_model('quiz_api', 'QuizScore')
+    batch = []
+    for score in QuizScore.objects.only('id', 'time_taken').iterator(chunk_size=BATCH_SIZE):
+        seconds = parse_time_taken(score.time_taken)
+        if seconds is None:
+            logger.warning(f"Quiz score {score.id} has an unreadable time taken {score.time_taken!r}; using 0")
+            seconds = 0
+        score.time_seconds = seconds
+        batch.append(score)
+        if len(batch) >= BATCH_SIZE:
+            QuizScore.objects.bulk_update(batch, ['time_seconds'])
+            batch = []
+    QuizScore.objects.bulk_update(batch, ['time_seconds'])
+
+
+def fill_time_taken(apps, schema_editor):
+    QuizScore = apps.get_model('quiz_api', 'QuizScore')
+    batch = []
+    for score in QuizScore.objects.only('id', 'time_seconds').iterator(chunk_size=BATCH_SIZE):
+        score.time_taken = f"{score.time_seconds // 60}:{score.time_seconds % 60:02d}"
+        batch.append(score)
+        if len(batch) >= BATCH_SIZE:
+            QuizScore.objects.bulk_update(batch, ['time_taken'])
+            batch = []
+    QuizScore.objects.bulk_update(batch, ['time_taken'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0013_native_json_questions_and_answers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizscore',
+            name='time_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Nullable while the reverse migration refills it
+        migrations.AlterField(
+            model_name='quizscore',
+            name='time_taken',
+            field=models.CharField(max_length=20, null=True),
+        ),
+        migrations.RunPython(fill_time_seconds, fill_time_taken),
+        migrations.RemoveField(
+            model_name='quizscore',
+            name='time_taken',
+        ),
+        migrations.AddIndex(
+            model_name='quizscore',
+            index=models.Index(fields=['quiz', '-score', 'time_seconds'], name='quizscore_leaderboard_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizscore',
+            index=models.Index(fields=['user', '-completed_at'], name='quizscore_user_recent_idx'),
+        ),
+    ]
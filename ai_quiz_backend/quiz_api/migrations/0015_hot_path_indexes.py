@@ -0,0 +1,93 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0014_quizscore_time_seconds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chapter',
+            index=models.Index(fields=['subject', 'order', 'name'], name='chapter_subject_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='questionbank',
+            index=models.Index(fields=['level', 'material'], name='qbank_level_material_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['level', 'material'], name='quiz_level_material_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizgenerationjob',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['created_at'], name='quizjob_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizgenerationjob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['heartbeat_at'], name='quizjob_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizscore',
+            index=models.Index(fields=['user', 'quiz'], name='quizscore_user_quiz_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studymaterial',
+            index=models.Index(fields=['subchapter', '-created_at'], name='material_subchapter_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studyrecommendation',
+            index=models.Index(fields=['user', '-created_at'], name='studyrec_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subchapter',
+            index=models.Index(fields=['chapter', 'order', 'name'], name='subchapter_chapter_order_idx'),
+        ),
+        # The new composite indexes start with these foreign keys, so their own indexes are dropped
+        migrations.AlterField(
+            model_name='chapter',
+            name='subject',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chapters', to='quiz_api.subject'),
+        ),
+        migrations.AlterField(
+            model_name='questionbank',
+            name='material',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='question_banks', to='quiz_api.studymaterial'),
+        ),
+        migrations.AlterField(
+            model_name='quiz',
+            name='material',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='quizzes', to='quiz_api.studymaterial'),
+        ),
+        migrations.AlterField(
+            model_name='quizscore',
+            name='quiz',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='quiz_api.quiz'),
+        ),
+        migrations.AlterField(
+            model_name='quizscore',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='quiz_scores', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='studymaterial',
+            name='subchapter',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='study_materials', to='quiz_api.subchapter'),
+        ),
+        migrations.AlterField(
+            model_name='studyrecommendation',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='subchapter',
+            name='chapter',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='subchapters', to='quiz_api.chapter'),
+        ),
+    ]
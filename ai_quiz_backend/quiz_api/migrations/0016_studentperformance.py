@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0015_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentPerformance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('overall', 'Overall'), ('subject', 'Subject'), ('chapter', 'Chapter'), ('subchapter', 'Subchapter')], max_length=20)),
+                ('scope_id', models.PositiveIntegerField(default=0)),
+                ('quiz_count', models.PositiveIntegerField(default=0)),
+                ('total_score', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('highest_score', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('last_quiz_at', models.DateTimeField(blank=True, null=True)),
+                ('chapter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='quiz_api.chapter')),
+                ('subchapter', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='quiz_api.subchapter')),
+                ('subject', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='quiz_api.subject')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='performance', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'scope_id'), name='unique_student_performance')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0016_studentperformance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('global', 'Global'), ('subject', 'Subject'), ('subchapter', 'Subchapter'), ('material', 'Material')], max_length=20)),
+                ('scope_id', models.PositiveIntegerField(default=0)),
+                ('window', models.CharField(choices=[('all_time', 'All Time'), ('weekly', 'Weekly'), ('daily', 'Daily')], max_length=10)),
+                ('period', models.CharField(max_length=10)),
+                ('score', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('time_seconds', models.PositiveIntegerField()),
+                ('achieved_at', models.DateTimeField()),
+                ('quiz_score', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='quiz_api.quizscore')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'leaderboard entries',
+                'indexes': [models.Index(fields=['scope', 'scope_id', 'period', '-score', 'time_seconds', 'achieved_at'], name='leaderboard_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'scope', 'scope_id', 'period'), name='unique_leaderboard_entry')],
+            },
+        ),
+    ]
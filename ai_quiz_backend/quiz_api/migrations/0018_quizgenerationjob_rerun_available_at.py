@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:52
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0017_leaderboardentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='quizgenerationjob',
+            name='quizjob_queued_idx',
+        ),
+        migrations.AddField(
+            model_name='quizgenerationjob',
+            name='available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='quizgenerationjob',
+            name='rerun',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='quizgenerationjob',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['available_at'], name='quizjob_queued_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def queue_pending_ingestions(apps, schema_editor):
+    """Queue an ingestion job for content left pending by the ingestion threads this replaces."""
+    MaterialContent = apps.get_model('quiz_api', 'MaterialContent')
+    QuizGenerationJob = apps.get_model('quiz_api', 'QuizGenerationJob')
+    QuizGenerationJob.objects.bulk_create([
+        QuizGenerationJob(material_id=material_id, kind='ingestion', level='')
+        for material_id in MaterialContent.objects.filter(status='pending').values_list('material_id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0018_quizgenerationjob_rerun_available_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='quizgenerationjob',
+            name='unique_active_quiz_generation_job',
+        ),
+        migrations.AddField(
+            model_name='quizgenerationjob',
+            name='kind',
+            field=models.CharField(choices=[('quiz', 'Quiz generation'), ('ingestion', 'Ingestion')], default='quiz', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='quizgenerationjob',
+            name='level',
+            field=models.CharField(blank=True, choices=[('Beginner', 'Beginner'), ('Intermediate', 'Intermediate'), ('Advanced', 'Advanced')], max_length=20),
+        ),
+        migrations.AddConstraint(
+            model_name='quizgenerationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('material', 'kind', 'level'), name='unique_active_quiz_generation_job'),
+        ),
+        migrations.RunPython(queue_pending_ingestions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:00
+
+from django.db import migrations, models
+
+# metrics.LATENCY_BUCKETS when the counters were introduced
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def count_recorded_calls(apps, schema_editor):
+    """Start the counters from the call metrics that have not been pruned yet."""
+    LLMCallMetric = apps.get_model('quiz_api', 'LLMCallMetric')
+    LLMCallCounter = apps.get_model('quiz_api', 'LLMCallCounter')
+    counters = {}
+    for operation, model, outcome, cached, latency_ms, prompt_tokens, completion_tokens in (
+        LLMCallMetric.objects.values_list(
+            'operation', 'model', 'outcome', 'cached', 'latency_ms', 'prompt_tokens', 'completion_tokens'
+        ).iterator()
+    ):
+        bucket = next(
+            (index for index, bound in enumerate(LATENCY_BUCKETS) if latency_ms <= bound * 1000),
+            len(LATENCY_BUCKETS)
+        )
+        key = (operation, model, outcome, cached, bucket)
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = LLMCallCounter(
+                operation=operation, model=model, outcome=outcome, cached=cached, latency_bucket=bucket
+            )
+        counter.calls += 1
+        counter.latency_ms += latency_ms
+        counter.prompt_tokens += prompt_tokens
+        counter.completion_tokens += completion_tokens
+    LLMCallCounter.objects.bulk_create(counters.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0019_quizgenerationjob_kind'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmcallmetric',
+            name='outcome',
+            field=models.CharField(choices=[('ok', 'OK'), ('empty', 'Empty'), ('parse_error', 'Parse Error'), ('api_error', 'API Error'), ('circuit_open', 'Circuit Open'), ('aborted', 'Aborted')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='LLMCallCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('empty', 'Empty'), ('parse_error', 'Parse Error'), ('api_error', 'API Error'), ('circuit_open', 'Circuit Open'), ('aborted', 'Aborted')], max_length=20)),
+                ('cached', models.BooleanField(default=False)),
+                ('latency_bucket', models.PositiveSmallIntegerField()),
+                ('calls', models.PositiveBigIntegerField(default=0)),
+                ('latency_ms', models.PositiveBigIntegerField(default=0)),
+                ('prompt_tokens', models.PositiveBigIntegerField(default=0)),
+                ('completion_tokens', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('operation', 'model', 'outcome', 'cached', 'latency_bucket'), name='unique_llm_call_counter')],
+            },
+        ),
+        migrations.RunPython(count_recorded_calls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0020_llmcallcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='materialsummary',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
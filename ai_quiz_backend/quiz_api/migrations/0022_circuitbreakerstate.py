@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0021_materialsummary_failed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CircuitBreakerState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('state', models.CharField(choices=[('closed', 'Closed'), ('half_open', 'Half Open'), ('open', 'Open')], default='closed', max_length=20)),
+                ('failures', models.IntegerField(default=0)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('opened_total', models.PositiveBigIntegerField(default=0)),
+                ('rejected_total', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
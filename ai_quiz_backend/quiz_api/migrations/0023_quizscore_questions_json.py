@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+from quiz_api.question_bank import build_variant
+
+BATCH_SIZE = 2000
+
+
+def fill_variant_questions(apps, schema_editor):
+    """Rebuild the questions of earlier variant attempts from their bank, as the bank is now."""
+    QuestionBank = apps.get_model('quiz_api', 'QuestionBank')
+    QuizScore = apps.get_model('quiz_api', 'QuizScore')
+    banks = {}
+    batch = []
+    scores = QuizScore.objects.filter(variant_seed__isnull=False).select_related('quiz').only(
+        'id', 'variant_seed', 'quiz__material_id', 'quiz__level'
+    )
+    for score in scores.iterator(chunk_size=BATCH_SIZE):
+        key = (score.quiz.material_id, score.quiz.level)
+        if key not in banks:
+            bank = QuestionBank.objects.filter(material_id=key[0], level=key[1]).first()
+            banks[key] = bank.questions_json if bank else None
+        if not banks[key]:
+            continue
+        score.questions_json = build_variant(banks[key], score.variant_seed, settings.QUIZ_VARIANT_SIZE)
+        batch.append(score)
+        if len(batch) >= BATCH_SIZE:
+            QuizScore.objects.bulk_update(batch, ['questions_json'])
+            batch = []
+    QuizScore.objects.bulk_update(batch, ['questions_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz_api', '0022_circuitbreakerstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizscore',
+            name='questions_json',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_variant_questions, migrations.RunPython.noop),
+    ]
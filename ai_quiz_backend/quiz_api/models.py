@@ -3,6 +3,30 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 import json
 
+def parse_time_taken(value):
+    """
+    Parse a time taken such as "5:30" (m:ss), "1:05:30" (h:mm:ss) or a
+    number of seconds into whole seconds. Raises ValueError if it can't.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid time taken: {value!r}")
+    if isinstance(value, (int, float)):
+        seconds = int(value)
+    else:
+        parts = [int(part) for part in str(value).strip().split(':')]
+        if len(parts) > 3 or any(part < 0 for part in parts) or any(part >= 60 for part in parts[1:]):
+            raise ValueError(f"Invalid time taken: {value!r}")
+        seconds = 0
+        for part in parts:
+            seconds = seconds * 60 + part
+    if seconds < 0:
+        raise ValueError(f"Invalid time taken: {value!r}")
+    return seconds
+
+def format_time_taken(seconds):
+    """Format whole seconds as m:ss, e.g. 330 -> "5:30"."""
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
 class Subject(models.Model):
     """Subject/course model (e.g., Mathematics, Science)"""
     name = models.CharField(max_length=100)
@@ -17,7 +41,7 @@ class Subject(models.Model):
 
 class Chapter(models.Model):
     """Chapter within a subject"""
-    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='chapters')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='chapters', db_index=False)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     order = models.IntegerField(default=0)
@@ -28,10 +52,14 @@ class Chapter(models.Model):
     
     class Meta:
         ordering = ['order', 'name']
+        indexes = [
+            # A subject's chapters in order; also serves the subject foreign key
+            models.Index(fields=['subject', 'order', 'name'], name='chapter_subject_order_idx'),
+        ]
 
 class Subchapter(models.Model):
     """Subchapter within a chapter"""
-    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name='subchapters')
+    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name='subchapters', db_index=False)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     order = models.IntegerField(default=0)
@@ -42,10 +70,14 @@ class Subchapter(models.Model):
     
     class Meta:
         ordering = ['order', 'name']
+        indexes = [
+            # A chapter's subchapters in order; also serves the chapter foreign key
+            models.Index(fields=['chapter', 'order', 'name'], name='subchapter_chapter_order_idx'),
+        ]
 
 class StudyMaterial(models.Model):
     """Study materials for a subchapter (PDFs, DOCX files)"""
-    subchapter = models.ForeignKey(Subchapter, on_delete=models.CASCADE, related_name='study_materials')
+    subchapter = models.ForeignKey(Subchapter, on_delete=models.CASCADE, related_name='study_materials', db_index=False)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
     document = models.FileField(upload_to='study_materials/')
@@ -59,6 +91,84 @@ class StudyMaterial(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A subchapter's materials, newest first; also serves the subchapter foreign key
+            models.Index(fields=['subchapter', '-created_at'], name='material_subchapter_idx'),
+        ]
+
+class ExtractedText(models.Model):
+    """Text extracted from a document, keyed by the SHA-256 of the file bytes"""
+    content_hash = models.CharField(max_length=64)
+    extractor_version = models.IntegerField()
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} (extractor v{self.extractor_version})"
+    
+    class Meta:
+        unique_together = ['content_hash', 'extractor_version']
+
+class MaterialContent(models.Model):
+    """Pre-parsed text and statistics for a study material, filled in when it is uploaded"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
+    material = models.OneToOneField(StudyMaterial, on_delete=models.CASCADE, related_name='content')
+    extracted_text = models.ForeignKey(ExtractedText, on_delete=models.SET_NULL, null=True, blank=True, related_name='materials')
+    content_hash = models.CharField(max_length=64, blank=True)
+    page_count = models.IntegerField(null=True, blank=True)
+    word_count = models.IntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.material.title} content ({self.status})"
+
+class MaterialSummary(models.Model):
+    """Compact model-written summary of a study material, shared by quiz and recommendation prompts"""
+    material = models.OneToOneField(StudyMaterial, on_delete=models.CASCADE, related_name='summary')
+    content_hash = models.CharField(max_length=64)  # Hash of the document the summary was made from
+    summary_json = models.TextField()  # Key concepts, vocabulary and learning objectives as JSON
+    failed_at = models.DateTimeField(null=True, blank=True)  # Set when summarizing this document failed
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.material.title} summary"
+    
+    def get_summary(self):
+        """Returns the summary as a dict of lists"""
+        return json.loads(self.summary_json)
+    
+    def set_summary(self, summary):
+        """Sets the summary from a dict of lists"""
+        self.summary_json = json.dumps(summary)
+
+class MaterialChunk(models.Model):
+    """Fixed-size chunk of a study material's text with its TF-IDF keyword vector"""
+    material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='chunks')
+    position = models.IntegerField()
+    text = models.TextField()
+    vector_json = models.TextField()  # Stores JSON mapping of keyword -> TF-IDF weight
+    
+    def __str__(self):
+        return f"{self.material.title} chunk {self.position}"
+    
+    def get_vector(self):
+        """Returns the keyword vector as a dict"""
+        return json.loads(self.vector_json)
+    
+    def set_vector(self, vector):
+        """Sets the keyword vector from a dict"""
+        self.vector_json = json.dumps(vector)
+    
+    class Meta:
+        ordering = ['material', 'position']
+        unique_together = ['material', 'position']
 
 class Quiz(models.Model):
     """Quiz generated from study material"""
@@ -68,9 +178,9 @@ class Quiz(models.Model):
         ('Advanced', 'Advanced'),
     ]
     
-    material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='quizzes')
+    material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='quizzes', db_index=False)
     level = models.CharField(max_length=20, choices=LEVEL_CHOICES)
-    questions_json = models.TextField()  # Stores JSON representation of questions
+    questions_json = models.JSONField(default=list)  # List of question objects
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -78,44 +188,149 @@ class Quiz(models.Model):
     
     def get_questions(self):
         """Returns the quiz questions as Python objects"""
-        return json.loads(self.questions_json)
+        return self.questions_json
     
     def set_questions(self, questions):
         """Sets the quiz questions from Python objects"""
-        self.questions_json = json.dumps(questions)
+        self.questions_json = questions
     
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            # One quiz per material and level, so concurrent generations cannot create duplicates
+            models.UniqueConstraint(fields=['material', 'level'], name='unique_quiz_per_material_level'),
+        ]
+        indexes = [
+            # Materials that have a quiz at a level (bulk generation, ?level= filter)
+            models.Index(fields=['level', 'material'], name='quiz_level_material_idx'),
+        ]
         verbose_name_plural = 'Quizzes'
 
+class QuestionBank(models.Model):
+    """Pool of generated questions for a material and level, from which quiz variants are drawn"""
+    material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='question_banks', db_index=False)
+    level = models.CharField(max_length=20, choices=Quiz.LEVEL_CHOICES)
+    questions_json = models.JSONField(default=list)  # List of question objects
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.material.title} Question Bank - {self.level}"
+    
+    def get_questions(self):
+        """Returns the bank's questions as Python objects"""
+        return self.questions_json
+    
+    def set_questions(self, questions):
+        """Sets the bank's questions from Python objects"""
+        self.questions_json = questions
+    
+    class Meta:
+        unique_together = ('material', 'level')
+        indexes = [
+            models.Index(fields=['level', 'material'], name='qbank_level_material_idx'),
+        ]
+
+class QuizGenerationJob(models.Model):
+    """Queued request to generate a quiz or ingest a study material, processed by the background worker"""
+    KIND_CHOICES = [
+        ('quiz', 'Quiz generation'),
+        ('ingestion', 'Ingestion'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    ACTIVE_STATUSES = ['queued', 'running']
+    
+    material = models.ForeignKey(StudyMaterial, on_delete=models.CASCADE, related_name='generation_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='quiz')
+    level = models.CharField(max_length=20, choices=Quiz.LEVEL_CHOICES, blank=True)  # Blank for ingestion
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.IntegerField(default=0)  # Percentage
+    quiz = models.ForeignKey(Quiz, on_delete=models.SET_NULL, null=True, blank=True, related_name='generation_jobs')
+    error = models.TextField(blank=True, null=True)
+    attempts = models.IntegerField(default=0)
+    regenerate = models.BooleanField(default=False)  # Replace the questions of an existing quiz
+    rerun = models.BooleanField(default=False)  # Requested again while running; run once more when done
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='quiz_generation_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)  # Not claimed before this time (retry backoff)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        if self.kind == 'ingestion':
+            return f"{self.material.title} ingestion job ({self.status})"
+        return f"{self.material.title} {self.level} quiz job ({self.status})"
+    
+    class Meta:
+        ordering = ['created_at']
+        constraints = [
+            # Only one queued or running job per material, kind and level, so repeated requests share it
+            models.UniqueConstraint(
+                fields=['material', 'kind', 'level'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_quiz_generation_job'
+            ),
+        ]
+        indexes = [
+            # The worker claims the queued job that has been available longest and looks for running jobs that stopped
+            models.Index(fields=['available_at'], condition=models.Q(status='queued'), name='quizjob_queued_idx'),
+            models.Index(fields=['heartbeat_at'], condition=models.Q(status='running'), name='quizjob_running_idx'),
+        ]
+
 class QuizScore(models.Model):
     """Student scores on quizzes"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_scores')
-    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='scores')
+    # The foreign keys are served by the composite indexes below
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_scores', db_index=False)
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='scores', db_index=False)
     score = models.DecimalField(max_digits=5, decimal_places=2)  # Percentage score
-    time_taken = models.CharField(max_length=20)  # Formatted time (e.g., "5:30")
-    answers_json = models.TextField(blank=True, null=True)  # Stores student's answers as JSON
+    time_seconds = models.PositiveIntegerField(default=0)  # Time taken, shown as m:ss (e.g., "5:30")
+    answers_json = models.JSONField(blank=True, null=True)  # Student's answers, in question order
+    variant_seed = models.BigIntegerField(null=True, blank=True)  # Seed of the question bank variant taken, if any
+    questions_json = models.JSONField(blank=True, null=True)  # Questions of the variant taken, as answered; null for the quiz's own
     completed_at = models.DateTimeField(default=timezone.now)
     
     def __str__(self):
         return f"{self.user.username} - {self.quiz} - {self.score}%"
     
+    @property
+    def time_taken(self):
+        """Time taken formatted as m:ss"""
+        return format_time_taken(self.time_seconds)
+    
+    def get_questions(self):
+        """Returns the questions the student answered: the variant's if one was taken, else the quiz's"""
+        if self.questions_json is not None:
+            return self.questions_json
+        return self.quiz.get_questions()
+    
     def get_answers(self):
         """Returns the student's answers as Python objects"""
-        if self.answers_json:
-            return json.loads(self.answers_json)
-        return []
+        return self.answers_json or []
     
     def set_answers(self, answers):
         """Sets the student's answers from Python objects"""
-        self.answers_json = json.dumps(answers)
+        self.answers_json = answers
     
     class Meta:
         ordering = ['-completed_at']
+        indexes = [
+            # Leaderboards: best score first, fastest time breaking ties
+            models.Index(fields=['quiz', '-score', 'time_seconds'], name='quizscore_leaderboard_idx'),
+            # A student's recent activity
+            models.Index(fields=['user', '-completed_at'], name='quizscore_user_recent_idx'),
+            # A student's attempts at a quiz
+            models.Index(fields=['user', 'quiz'], name='quizscore_user_quiz_idx'),
+        ]
 
 class StudyRecommendation(models.Model):
     """Personalized study recommendations for students"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations', db_index=False)
     subchapter = models.ForeignKey(Subchapter, on_delete=models.CASCADE, related_name='recommendations')
     recommendation = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -125,3 +340,178 @@ class StudyRecommendation(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A student's recommendations, newest first; also serves the user foreign key
+            models.Index(fields=['user', '-created_at'], name='studyrec_user_recent_idx'),
+        ]
+
+class RecommendationState(models.Model):
+    """When a student's study recommendations were last recomputed and whether newer scores are waiting"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='recommendation_state')
+    pending_since = models.DateTimeField(null=True, blank=True, db_index=True)  # Oldest score not yet reflected
+    last_score_at = models.DateTimeField(null=True, blank=True)
+    refresh_started_at = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    
+    def __str__(self):
+        return f"Recommendation state for {self.user.username}"
+
+class StudentPerformance(models.Model):
+    """Running totals of a student's quiz scores, overall and per subject, chapter and subchapter"""
+    SCOPE_CHOICES = [
+        ('overall', 'Overall'),
+        ('subject', 'Subject'),
+        ('chapter', 'Chapter'),
+        ('subchapter', 'Subchapter'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='performance', db_index=False)
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    scope_id = models.PositiveIntegerField(default=0)  # Id of the subject, chapter or subchapter; 0 overall
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    subchapter = models.ForeignKey(Subchapter, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    quiz_count = models.PositiveIntegerField(default=0)
+    total_score = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    highest_score = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    last_quiz_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.scope} {self.scope_id}: {self.quiz_count} quizzes"
+    
+    @property
+    def avg_score(self):
+        return self.total_score / self.quiz_count if self.quiz_count else 0
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'scope_id'], name='unique_student_performance'),
+        ]
+
+class LeaderboardEntry(models.Model):
+    """A student's best attempt in one leaderboard: a scope and a time window"""
+    SCOPE_CHOICES = [
+        ('global', 'Global'),
+        ('subject', 'Subject'),
+        ('subchapter', 'Subchapter'),
+        ('material', 'Material'),
+    ]
+    WINDOW_CHOICES = [
+        ('all_time', 'All Time'),
+        ('weekly', 'Weekly'),
+        ('daily', 'Daily'),
+    ]
+    
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    scope_id = models.PositiveIntegerField(default=0)  # Id of the subject, subchapter or material; 0 global
+    window = models.CharField(max_length=10, choices=WINDOW_CHOICES)
+    period = models.CharField(max_length=10)  # 'all', ISO week (e.g. '2026-W42') or date (e.g. '2026-10-17')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_entries', db_index=False)
+    quiz_score = models.ForeignKey(QuizScore, on_delete=models.CASCADE, related_name='+')
+    score = models.DecimalField(max_digits=5, decimal_places=2)
+    time_seconds = models.PositiveIntegerField()
+    achieved_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.scope} {self.scope_id} {self.period} - {self.user.username}: {self.score}"
+    
+    class Meta:
+        verbose_name_plural = 'leaderboard entries'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'scope_id', 'period'], name='unique_leaderboard_entry'),
+        ]
+        indexes = [
+            # Top K of a leaderboard: best score first, then fastest, then earliest
+            models.Index(
+                fields=['scope', 'scope_id', 'period', '-score', 'time_seconds', 'achieved_at'],
+                name='leaderboard_rank_idx'
+            ),
+        ]
+
+class LLMResponseCacheEntry(models.Model):
+    """Cached chat-completion response, used by the database LLM cache backend"""
+    key = models.CharField(max_length=64, unique=True)
+    response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    last_used_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return self.key
+    
+    class Meta:
+        verbose_name_plural = 'LLM response cache entries'
+
+class LLMCallMetric(models.Model):
+    """Timing, token usage and outcome of one chat-completion call"""
+    OUTCOME_CHOICES = (
+        ('ok', 'OK'),
+        ('empty', 'Empty'),
+        ('parse_error', 'Parse Error'),
+        ('api_error', 'API Error'),
+        ('circuit_open', 'Circuit Open'),
+        ('aborted', 'Aborted'),
+    )
+    
+    operation = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES)
+    cached = models.BooleanField(default=False)
+    latency_ms = models.PositiveIntegerField()
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.operation} ({self.outcome}, {self.latency_ms}ms)"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['operation', 'created_at']),
+        ]
+
+class LLMCallCounter(models.Model):
+    """
+    Running totals of chat-completion calls per operation, model, outcome,
+    cache use and latency bucket. Unlike LLMCallMetric rows they are never
+    pruned, so the Prometheus counters read from them only go up.
+    """
+    operation = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    outcome = models.CharField(max_length=20, choices=LLMCallMetric.OUTCOME_CHOICES)
+    cached = models.BooleanField(default=False)
+    latency_bucket = models.PositiveSmallIntegerField()  # Index into metrics.LATENCY_BUCKETS; its length for slower calls
+    calls = models.PositiveBigIntegerField(default=0)
+    latency_ms = models.PositiveBigIntegerField(default=0)
+    prompt_tokens = models.PositiveBigIntegerField(default=0)
+    completion_tokens = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.operation} ({self.outcome}, bucket {self.latency_bucket}): {self.calls} calls"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['operation', 'model', 'outcome', 'cached', 'latency_bucket'],
+                name='unique_llm_call_counter'
+            ),
+        ]
+
+class CircuitBreakerState(models.Model):
+    """State of a circuit breaker, shared by the web and worker processes that call the service"""
+    STATE_CHOICES = (
+        ('closed', 'Closed'),
+        ('half_open', 'Half Open'),
+        ('open', 'Open'),
+    )
+    
+    name = models.CharField(max_length=50, unique=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='closed')
+    failures = models.IntegerField(default=0)  # Failures in a row
+    opened_at = models.DateTimeField(null=True, blank=True)  # When the circuit opened or the last trial call started
+    opened_total = models.PositiveBigIntegerField(default=0)
+    rejected_total = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name} circuit ({self.state})"
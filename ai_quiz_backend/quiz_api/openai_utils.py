@@ -1,63 +1,303 @@
-import openai
 import json
 import os
+import re
+import hashlib
 import logging
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from asgiref.sync import sync_to_async
 from django.conf import settings
 
+from .models import ExtractedText
+from .llm_cache import get_llm_cache, make_cache_key
+from .llm_providers import get_llm_provider
+from .rate_limit import estimate_prompt_tokens, get_rate_limiter
+from .circuit_breaker import CircuitOpenError
+from .metrics import LLMCallTracker
+from .streaming import JSONArrayObjectParser
+from .validation import validate_question
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Set up OpenAI API key
-openai.api_key = settings.OPENAI_API_KEY
+# the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
+OPENAI_MODEL = "gpt-4o"
+OPENAI_TEMPERATURE = 0.7
+
+QUIZ_SYSTEM_PROMPT = "You are an expert educational content creator specializing in creating quizzes for primary school students in Malaysia."
+
+# Bump this whenever the extraction logic changes so cached text is re-extracted
+EXTRACTOR_VERSION = 2
+
+# XML namespaces used when streaming Word documents
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MARKUP_COMPATIBILITY_NS = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+
+# Number of characters of study material sent to the model when generating a quiz
+QUIZ_TEXT_BUDGET = 4000
+
+# Characters of raw text sent alongside the material summary, which carries the main points
+QUIZ_EXCERPT_BUDGET = 1500
+
+# Characters of study material sent when asking for replacements of rejected questions
+QUIZ_REPAIR_TEXT_BUDGET = 2000
+
+# Number of characters read when summarizing a study material (done once per document)
+SUMMARY_TEXT_BUDGET = 12000
+
+# Sections of a material summary
+SUMMARY_SECTIONS = ["key_concepts", "vocabulary", "learning_objectives"]
+
+def collect_text(pieces, max_chars=None, separator=""):
+    """
+    Join text pieces from an iterator, stopping as soon as max_chars characters
+    have been collected so the remaining pieces are never produced.
+    """
+    collected = []
+    total = 0
+    for piece in pieces:
+        collected.append(piece)
+        total += len(piece) + len(separator)
+        if max_chars is not None and total >= max_chars:
+            break
+    text = separator.join(collected)
+    return text[:max_chars] if max_chars is not None else text
+
+def iter_doc_paragraphs(file_path):
+    """
+    Yield the text of each paragraph in a Word document.
+    
+    word/document.xml is streamed straight out of the archive with an
+    incremental parser, so media parts are never read and the document tree
+    is discarded block by block instead of being held in memory.
+    """
+    with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as document_xml:
+        paragraphs = []  # Text buffers for the open (possibly nested) paragraphs
+        depth = 0
+        run_depth = 0
+        fallback_depth = None
+        body = None
+        
+        for event, elem in ET.iterparse(document_xml, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if elem.tag == WORD_NS + 'body':
+                    body = elem
+                elif fallback_depth is not None:
+                    continue
+                elif elem.tag == MARKUP_COMPATIBILITY_NS + 'Fallback':
+                    # Fallback content repeats text boxes already read from the main choice
+                    fallback_depth = depth
+                elif elem.tag == WORD_NS + 'p':
+                    paragraphs.append([])
+                elif elem.tag == WORD_NS + 'r':
+                    run_depth += 1
+                continue
+            
+            if fallback_depth is not None:
+                if depth == fallback_depth:
+                    fallback_depth = None
+            elif elem.tag == WORD_NS + 'p':
+                yield "".join(paragraphs.pop())
+            elif elem.tag == WORD_NS + 'r':
+                run_depth -= 1
+            elif paragraphs and run_depth:
+                if elem.tag == WORD_NS + 't':
+                    paragraphs[-1].append(elem.text or "")
+                elif elem.tag == WORD_NS + 'tab':
+                    paragraphs[-1].append("\t")
+                elif elem.tag in (WORD_NS + 'br', WORD_NS + 'cr'):
+                    paragraphs[-1].append("\n")
+            
+            depth -= 1
+            if body is not None and depth == 2:
+                # A top-level block has been read; drop it to keep memory flat
+                body.clear()
+
+def iter_pdf_pages(file_path):
+    """Yield the text of each PDF page, only parsing a page when it is requested."""
+    from PyPDF2 import PdfReader
+    yield from iter_reader_pages(PdfReader(file_path))
 
-def extract_text_from_doc(file_path):
-    """Extract text from Word document."""
+def iter_reader_pages(reader):
+    """Yield the text of each page of an open PdfReader."""
+    for page in reader.pages:
+        yield (page.extract_text() or "") + "\n"
+
+def extract_text_from_doc(file_path, max_chars=None):
+    """Extract text from Word document, optionally stopping after max_chars characters."""
     try:
-        import docx
-        doc = docx.Document(file_path)
-        return " ".join([paragraph.text for paragraph in doc.paragraphs])
+        return collect_text(iter_doc_paragraphs(file_path), max_chars, separator=" ")
     except Exception as e:
         logger.error(f"Error extracting text from Word document: {e}")
         return None
 
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF document."""
+def extract_text_from_pdf(file_path, max_chars=None):
+    """Extract text from PDF document, optionally stopping after max_chars characters."""
     try:
-        from PyPDF2 import PdfReader
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return collect_text(iter_pdf_pages(file_path), max_chars)
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         return None
 
-def extract_text_from_document(file_path, file_type):
+def extract_text_from_document(file_path, file_type, max_chars=None):
     """Extract text from document based on file type."""
     file_type = file_type.lower()
     if "pdf" in file_type:
-        return extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path, max_chars)
     elif "doc" in file_type or "docx" in file_type:
-        return extract_text_from_doc(file_path)
+        return extract_text_from_doc(file_path, max_chars)
     else:
         logger.warning(f"Unsupported file type for text extraction: {file_type}")
         return None
 
-def generate_quiz(text_content, level="Beginner", num_questions=5):
+def extract_pdf_page_range(file_path, start, end):
+    """Extract the text of pages [start, end) of a PDF. Runs inside extraction worker processes."""
+    from PyPDF2 import PdfReader
+    reader = PdfReader(file_path)
+    return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+
+def split_page_range(page_count, parts):
+    """Split page_count pages into at most `parts` contiguous (start, end) ranges."""
+    size = max(1, -(-page_count // parts))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def extract_text_parallel(file_path, file_type, workers=None):
     """
-    Generate quiz questions based on study material content.
-    Level can be "Beginner", "Intermediate", or "Advanced"
+    Extract the full text of a document, spreading the pages of large PDFs
+    across a process pool and reassembling them in page order.
+    
+    Word documents, PDFs with fewer than PARALLEL_EXTRACTION_MIN_PAGES pages
+    and a single worker fall back to the serial extractors, as do PDFs whose
+    process pool fails.
     """
-    # Adjust quiz difficulty based on level
+    workers = workers or settings.TEXT_EXTRACTION_WORKERS
+    if "pdf" not in file_type.lower() or workers <= 1:
+        return extract_text_from_document(file_path, file_type)
+    
+    try:
+        from PyPDF2 import PdfReader
+        reader = PdfReader(file_path)
+        page_count = len(reader.pages)
+        if page_count < settings.PARALLEL_EXTRACTION_MIN_PAGES:
+            # Reuse the open reader instead of parsing the file again
+            return collect_text(iter_reader_pages(reader))
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        return None
+    
+    try:
+        # Use a few ranges per worker so one slow range doesn't leave the others idle
+        ranges = split_page_range(page_count, workers * 2)
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+            results = executor.map(
+                extract_pdf_page_range,
+                [file_path] * len(ranges),
+                [start for start, end in ranges],
+                [end for start, end in ranges]
+            )
+            return "".join(text for pages in results for text in pages)
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF in parallel, extracting serially instead: {e}")
+    
+    try:
+        return collect_text(iter_reader_pages(reader))
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {e}")
+        return None
+
+def compute_document_hash(file_path, chunk_size=1024 * 1024):
+    """Compute the SHA-256 hash of a document's bytes without loading it into memory."""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def count_document_pages(file_path, file_type):
+    """Return the number of pages in a document, or None if it cannot be determined."""
+    file_type = file_type.lower()
+    try:
+        if "pdf" in file_type:
+            from PyPDF2 import PdfReader
+            return len(PdfReader(file_path).pages)
+        if "doc" in file_type:
+            # Word only records the page count in the document properties
+            with zipfile.ZipFile(file_path) as archive:
+                app_xml = archive.read('docProps/app.xml').decode('utf-8')
+            match = re.search(r'<Pages>(\d+)</Pages>', app_xml)
+            return int(match.group(1)) if match else None
+    except Exception as e:
+        logger.warning(f"Could not count pages of {file_path}: {e}")
+    return None
+
+def store_document_text(file_path, file_type, content_hash=None):
+    """
+    Return the ExtractedText row for a document, extracting and storing the
+    full text if this content has not been extracted before.
+    """
+    content_hash = content_hash or compute_document_hash(file_path)
+    cached = ExtractedText.objects.filter(
+        content_hash=content_hash,
+        extractor_version=EXTRACTOR_VERSION
+    ).first()
+    if cached:
+        return cached
+    
+    text = extract_text_parallel(file_path, file_type)
+    if not text:
+        return None
+    
+    # PostgreSQL text columns cannot store NUL characters, which PDFs sometimes yield
+    extracted, created = ExtractedText.objects.get_or_create(
+        content_hash=content_hash,
+        extractor_version=EXTRACTOR_VERSION,
+        defaults={'text': text.replace("\x00", "")}
+    )
+    return extracted
+
+def get_document_text(file_path, file_type, max_chars=None):
+    """
+    Extract text from a document, reusing the stored text when a file with the
+    same content has already been extracted by the current extractor version.
+    
+    When max_chars is given and nothing is stored yet, only as many pages as
+    needed are parsed and the partial text is not stored.
+    """
+    try:
+        content_hash = compute_document_hash(file_path)
+    except OSError as e:
+        logger.error(f"Error reading document for hashing: {e}")
+        return None
+    
+    if max_chars is not None:
+        cached = ExtractedText.objects.filter(
+            content_hash=content_hash,
+            extractor_version=EXTRACTOR_VERSION
+        ).first()
+        if cached:
+            return cached.text[:max_chars]
+        return extract_text_from_document(file_path, file_type, max_chars)
+    
+    extracted = store_document_text(file_path, file_type, content_hash)
+    return extracted.text if extracted else None
+
+def get_level_difficulty(level):
+    """Describe how difficult the questions of a quiz level should be."""
     if level == "Beginner":
-        difficulty = "simple, focusing on basic recall and understanding"
+        return "simple, focusing on basic recall and understanding"
     elif level == "Intermediate":
-        difficulty = "moderately challenging, testing application and analysis"
+        return "moderately challenging, testing application and analysis"
     else:  # Advanced
-        difficulty = "challenging, requiring synthesis and evaluation"
-        
-    # Define the prompt with detailed instructions
+        return "challenging, requiring synthesis and evaluation"
+
+def build_quiz_messages(text_content, level="Beginner", num_questions=5):
+    """Build the chat messages asking the model for a quiz on the given material."""
+    # Adjust quiz difficulty based on level
+    difficulty = get_level_difficulty(level)
+    
+    # Define the prompt with detailed instructions, limiting the material to avoid token limits
     prompt = f"""
     Create a quiz with {num_questions} multiple-choice questions based on the following study material.
     Make the questions {difficulty}, appropriate for Malaysian Standard 1 students.
@@ -77,40 +317,424 @@ def generate_quiz(text_content, level="Beginner", num_questions=5):
     ]
     
     Study material:
-    {text_content[:4000]}  # Limit text to avoid token limits
+    {text_content[:QUIZ_TEXT_BUDGET]}
+    """
+    
+    return [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_quiz_response(content):
+    """Parse the model's quiz response into a list of questions."""
+    questions = json.loads(content)
+    
+    # Ensure the response is in the expected format
+    if isinstance(questions, dict) and "questions" in questions:
+        questions = questions["questions"]
+    
+    # Validate quiz format
+    if not isinstance(questions, list):
+        logger.error("Invalid quiz format returned from the model")
+        questions = []
+    
+    return questions
+
+def build_repair_messages(text_content, level, num_questions, avoid_questions):
+    """
+    Build the chat messages asking for a few replacement questions, listing
+    the questions already written so the model doesn't repeat them.
+    """
+    difficulty = get_level_difficulty(level)
+    avoid = "\n    ".join(f"- {question}" for question in avoid_questions)
+    
+    prompt = f"""
+    Write {num_questions} multiple-choice questions based on the study material below.
+    Make them {difficulty}, appropriate for Malaysian Standard 1 students.
+    Each question needs 4 distinct options, a correct_answer copied exactly from the options and a brief explanation.
+    
+    Do not repeat or rephrase these questions:
+    {avoid}
+    
+    Return a JSON array of objects with "question", "options", "correct_answer" and "explanation".
+    
+    Study material:
+    {text_content[:QUIZ_REPAIR_TEXT_BUDGET]}
+    """
+    
+    return [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def build_multi_level_quiz_messages(text_content, levels, num_questions=5):
+    """Build the chat messages asking for quizzes at several levels in a single completion."""
+    level_instructions = "\n".join(
+        f"    - {level}: {get_level_difficulty(level)}" for level in levels
+    )
+    
+    prompt = f"""
+    Create {len(levels)} separate quizzes, each with {num_questions} multiple-choice questions, based on the following study material.
+    The quizzes are for Malaysian Standard 1 students and must match these difficulty levels:
+{level_instructions}
+
+    Each question should have 4 options with only one correct answer.
+    Include a brief explanation for the correct answer.
+    Do not repeat a question across levels.
+    
+    Format the response as a JSON object with one key per level, each holding an array of objects with the following structure:
+    {{
+      "{levels[0]}": [
+        {{
+          "question": "Question text here?",
+          "options": ["Option A", "Option B", "Option C", "Option D"],
+          "correct_answer": "Option that is correct",
+          "explanation": "Brief explanation of why this answer is correct"
+        }},
+        ...
+      ],
+      ...
+    }}
+    
+    Study material:
+    {text_content[:QUIZ_TEXT_BUDGET]}
+    """
+    
+    return [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_multi_level_quiz_response(content, levels):
+    """
+    Parse a multi-level quiz response into a dict of level -> questions.
+    Returns an empty dict unless every requested level has questions.
     """
+    quizzes = json.loads(content)
+    if isinstance(quizzes, dict) and isinstance(quizzes.get("quizzes"), dict):
+        quizzes = quizzes["quizzes"]
     
+    if not isinstance(quizzes, dict):
+        logger.error("Invalid multi-level quiz format returned from OpenAI")
+        return {}
+    
+    result = {}
+    for level in levels:
+        questions = quizzes.get(level)
+        if not isinstance(questions, list) or not questions:
+            logger.error(f"Multi-level quiz response is missing the {level} quiz")
+            return {}
+        result[level] = questions
+    return result
+
+def build_summary_messages(text_content):
+    """Build the chat messages asking the model for a compact summary of a study material."""
+    prompt = f"""
+    Summarize the following study material for Malaysian Standard 1 students as compact notes.
+    
+    Format the response as a JSON object with the following structure:
+    {{
+      "key_concepts": ["Short statement of a concept taught"],
+      "vocabulary": ["Word - short meaning"],
+      "learning_objectives": ["What the student should be able to do"]
+    }}
+    Use at most 8 short items per list and keep the facts needed to write quiz questions.
+    
+    Study material:
+    {text_content[:SUMMARY_TEXT_BUDGET]}
+    """
+    
+    return [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_summary_response(content):
+    """Parse the model's summary response, returning {} unless every section is a list of strings."""
+    summary = json.loads(content)
+    if not isinstance(summary, dict):
+        return {}
+    
+    parsed = {}
+    for section in SUMMARY_SECTIONS:
+        items = summary.get(section)
+        if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+            logger.error(f"Invalid summary format returned from the model: bad '{section}'")
+            return {}
+        parsed[section] = items
+    return parsed
+
+def format_quiz_history(quiz_history):
+    """
+    Render quiz history entries as one compact line each, e.g.
+    "- Plants (Beginner): 60%, 2 attempts, missed 2/5. Concepts: ...".
+    """
+    lines = []
+    for entry in quiz_history:
+        line = f"- {entry.get('material', 'Quiz')} ({entry.get('level', 'N/A')}): {entry.get('score', 'N/A')}%"
+        if entry.get('attempts', 1) > 1:
+            line += f", {entry['attempts']} attempts"
+        if entry.get('total'):
+            line += f", missed {entry.get('missed', 0)}/{entry['total']}"
+        if entry.get('concepts'):
+            line += f". Concepts: {'; '.join(entry['concepts'])}"
+        lines.append(line)
+    return "\n".join(lines) or "None"
+
+def build_recommendation_messages(user_data, question_data):
+    """Build the chat messages asking the model for study recommendations."""
+    # Format the user data and quiz history compactly to keep the prompt small
+    prompt = f"""
+    Based on the student's performance data, generate personalized study recommendations.
+    
+    Student Performance Summary:
+    Average Score: {user_data.get('avg_score', 'N/A')}%
+    Strengths: {', '.join(user_data.get('strengths', ['N/A']))}
+    Weaknesses: {', '.join(user_data.get('weaknesses', ['N/A']))}
+    
+    Recent Quiz Results:
+{format_quiz_history(question_data)}
+
+    Provide 3-5 specific, actionable recommendations to help this student improve.
+    Format your response as a JSON array of recommendation strings.
+    Make recommendations appropriate for a Standard 1 student in Malaysia.
+    """
+    
+    return [
+        {"role": "system", "content": "You are an expert educational advisor specializing in primary education in Malaysia."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_recommendation_response(content):
+    """Parse the model's recommendations response into a list of strings."""
+    recommendations = json.loads(content)
+    
+    # Check if the response is in expected format
+    if isinstance(recommendations, dict) and "recommendations" in recommendations:
+        recommendations = recommendations["recommendations"]
+    
+    if not isinstance(recommendations, list):
+        logger.error("Invalid recommendations format returned from OpenAI")
+        recommendations = []
+    
+    return recommendations
+
+def create_chat_completion(messages, operation=None):
+    """
+    Send a JSON-mode chat completion through the configured provider and
+    return its LLMResult, waiting for the rate limiter first if one is set.
+    """
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_prompt_tokens(messages)
+    if limiter:
+        limiter.acquire(estimated_tokens)
+    result = get_llm_provider().complete(messages, OPENAI_MODEL, OPENAI_TEMPERATURE, operation)
+    if limiter:
+        limiter.settle(estimated_tokens, result.prompt_tokens + result.completion_tokens)
+    return result
+
+async def acreate_chat_completion(messages, operation=None):
+    """Async version of create_chat_completion()."""
+    limiter = get_rate_limiter()
+    estimated_tokens = estimate_prompt_tokens(messages)
+    if limiter:
+        await sync_to_async(limiter.acquire, thread_sensitive=False)(estimated_tokens)
+    result = await get_llm_provider().acomplete(messages, OPENAI_MODEL, OPENAI_TEMPERATURE, operation)
+    if limiter:
+        limiter.settle(estimated_tokens, result.prompt_tokens + result.completion_tokens)
+    return result
+
+def stream_chat_completion(messages, operation=None, on_usage=None):
+    """
+    Stream a JSON-mode chat completion, yielding pieces of the message content
+    as they arrive. on_usage is called with the final LLMResult. Waits for
+    the rate limiter first if one is set.
+    """
+    limiter = get_rate_limiter()
+    if not limiter:
+        return get_llm_provider().stream(messages, OPENAI_MODEL, OPENAI_TEMPERATURE, operation, on_usage)
+    
+    estimated_tokens = estimate_prompt_tokens(messages)
+    limiter.acquire(estimated_tokens)
+    
+    def record_usage(result):
+        limiter.settle(estimated_tokens, result.prompt_tokens + result.completion_tokens)
+        if on_usage:
+            on_usage(result)
+    return get_llm_provider().stream(messages, OPENAI_MODEL, OPENAI_TEMPERATURE, operation, record_usage)
+
+def cached_chat_completion(messages, parse, operation=None, refresh=False):
+    """
+    Return parse() of the chat completion for messages, answering repeated
+    requests from the LLM response cache. With refresh, the cached response
+    is skipped and replaced by a new one, for callers that want different
+    output for the same prompt. Only responses that parse into a non-empty
+    result are cached. Every call is recorded in the LLM metrics.
+    """
+    cache = get_llm_cache()
+    key = make_cache_key(OPENAI_MODEL, messages, OPENAI_TEMPERATURE)
+    with LLMCallTracker(operation, OPENAI_MODEL) as call:
+        content = None if refresh else cache.get(key)
+        if content is not None:
+            call.cached = True
+        else:
+            response = create_chat_completion(messages, operation)
+            call.add_usage(response)
+            content = response.content
+        call.parsing()
+        result = parse(content)
+        call.finish(result)
+    
+    if result and not call.cached:
+        cache.set(key, content)
+    return result
+
+async def acached_chat_completion(messages, parse, operation=None, refresh=False):
+    """Async version of cached_chat_completion()."""
+    cache = get_llm_cache()
+    key = make_cache_key(OPENAI_MODEL, messages, OPENAI_TEMPERATURE)
+    async with LLMCallTracker(operation, OPENAI_MODEL) as call:
+        content = None if refresh else await sync_to_async(cache.get)(key)
+        if content is not None:
+            call.cached = True
+        else:
+            response = await acreate_chat_completion(messages, operation)
+            call.add_usage(response)
+            content = response.content
+        call.parsing()
+        result = parse(content)
+        call.finish(result)
+    
+    if result and not call.cached:
+        await sync_to_async(cache.set)(key, content)
+    return result
+
+def generate_quiz(text_content, level="Beginner", num_questions=5, refresh=False):
+    """
+    Generate quiz questions based on study material content.
+    Level can be "Beginner", "Intermediate", or "Advanced".
+    With refresh, new questions are generated even if the response is cached.
+    """
     try:
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert educational content creator specializing in creating quizzes for primary school students in Malaysia."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
-        )
-        
-        # Parse the JSON response
-        content = response.choices[0].message.content
-        questions = json.loads(content)
-        
-        # Ensure the response is in the expected format
-        if isinstance(questions, dict) and "questions" in questions:
-            questions = questions["questions"]
-            
-        # Validate quiz format
-        if not isinstance(questions, list):
-            logger.error("Invalid quiz format returned from OpenAI")
-            questions = []
-            
-        return questions
-        
+        messages = build_quiz_messages(text_content, level, num_questions)
+        return cached_chat_completion(messages, parse_quiz_response, 'quiz', refresh)
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error generating quiz: {e}")
         return []
 
+def generate_replacement_questions(text_content, level, num_questions, avoid_questions, refresh=False):
+    """Ask for num_questions new questions that differ from avoid_questions (a list of question texts)."""
+    try:
+        messages = build_repair_messages(text_content, level, num_questions, avoid_questions)
+        return cached_chat_completion(messages, parse_quiz_response, 'quiz_repair', refresh)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating replacement questions: {e}")
+        return []
+
+async def agenerate_quiz(text_content, level="Beginner", num_questions=5, refresh=False):
+    """
+    Async version of generate_quiz() for use from async views. Like it, the
+    questions are returned as generated; pass them to
+    generation.arepair_questions() to drop and replace the unusable ones.
+    """
+    try:
+        messages = build_quiz_messages(text_content, level, num_questions)
+        return await acached_chat_completion(messages, parse_quiz_response, 'quiz', refresh)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating quiz: {e}")
+        return []
+
+async def agenerate_replacement_questions(text_content, level, num_questions, avoid_questions, refresh=False):
+    """Async version of generate_replacement_questions()."""
+    try:
+        messages = build_repair_messages(text_content, level, num_questions, avoid_questions)
+        return await acached_chat_completion(messages, parse_quiz_response, 'quiz_repair', refresh)
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating replacement questions: {e}")
+        return []
+
+def generate_multi_level_quiz(text_content, levels, num_questions=5, refresh=False):
+    """
+    Generate quizzes for several levels with one completion, so the study
+    material is only sent once. Returns a dict of level -> questions, or an
+    empty dict if any level could not be generated. With refresh, new
+    questions are generated even if the response is cached.
+    """
+    try:
+        messages = build_multi_level_quiz_messages(text_content, levels, num_questions)
+        return cached_chat_completion(
+            messages,
+            lambda content: parse_multi_level_quiz_response(content, levels),
+            'multi_level_quiz',
+            refresh
+        )
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating multi-level quiz: {e}")
+        return {}
+
+def stream_quiz_questions(text_content, level="Beginner", num_questions=5, refresh=False):
+    """
+    Generate quiz questions with a streamed completion, yielding each valid
+    question as soon as the model has finished writing it. Cached responses
+    are replayed immediately unless refresh is set. API errors are raised to
+    the caller.
+    """
+    messages = build_quiz_messages(text_content, level, num_questions)
+    cache = get_llm_cache()
+    key = make_cache_key(OPENAI_MODEL, messages, OPENAI_TEMPERATURE)
+    
+    with LLMCallTracker('quiz_stream', OPENAI_MODEL) as call:
+        content = None if refresh else cache.get(key)
+        if content is not None:
+            call.cached = True
+            call.parsing()
+            questions = [q for q in parse_quiz_response(content) if not validate_question(q)]
+            call.finish(questions)
+            yield from questions
+            return
+        
+        parser = JSONArrayObjectParser()
+        pieces = []
+        questions = []
+        for piece in stream_chat_completion(messages, 'quiz', on_usage=call.add_usage):
+            pieces.append(piece)
+            for question in parser.feed(piece):
+                if not validate_question(question):
+                    questions.append(question)
+                    yield question
+        call.finish(questions)
+    
+    content = "".join(pieces)
+    try:
+        if parse_quiz_response(content):
+            cache.set(key, content)
+    except ValueError:
+        logger.error("Streamed quiz response was not valid JSON")
+
+def generate_material_summary(text_content):
+    """
+    Summarize study material into key concepts, vocabulary and learning
+    objectives. Returns {} if the summary could not be generated.
+    """
+    try:
+        messages = build_summary_messages(text_content)
+        return cached_chat_completion(messages, parse_summary_response, 'summary')
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating material summary: {e}")
+        return {}
+
 def generate_study_recommendations(user_data, question_data):
     """
     Generate personalized study recommendations based on quiz performance.
@@ -123,47 +747,21 @@ def generate_study_recommendations(user_data, question_data):
     - A list of personalized recommendations
     """
     try:
-        # Format the user data and quiz data for the API
-        prompt = f"""
-        Based on the student's performance data, generate personalized study recommendations.
-        
-        Student Performance Summary:
-        Average Score: {user_data.get('avg_score', 'N/A')}%
-        Strengths: {', '.join(user_data.get('strengths', ['N/A']))}
-        Weaknesses: {', '.join(user_data.get('weaknesses', ['N/A']))}
-        
-        Recent Quiz Results:
-        {json.dumps(question_data, indent=2)}
-        
-        Provide 3-5 specific, actionable recommendations to help this student improve.
-        Format your response as a JSON array of recommendation strings.
-        Make recommendations appropriate for a Standard 1 student in Malaysia.
-        """
-        
-        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-        response = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert educational advisor specializing in primary education in Malaysia."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
-        )
-        
-        content = response.choices[0].message.content
-        recommendations = json.loads(content)
-        
-        # Check if the response is in expected format
-        if isinstance(recommendations, dict) and "recommendations" in recommendations:
-            recommendations = recommendations["recommendations"]
-            
-        if not isinstance(recommendations, list):
-            logger.error("Invalid recommendations format returned from OpenAI")
-            recommendations = []
-            
-        return recommendations
-        
+        messages = build_recommendation_messages(user_data, question_data)
+        return cached_chat_completion(messages, parse_recommendation_response, 'recommendations')
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error generating study recommendations: {e}")
-        return []
\ No newline at end of file
+        return []
+
+async def agenerate_study_recommendations(user_data, question_data):
+    """Async version of generate_study_recommendations() for use from async views."""
+    try:
+        messages = build_recommendation_messages(user_data, question_data)
+        return await acached_chat_completion(messages, parse_recommendation_response, 'recommendations')
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating study recommendations: {e}")
+        return []
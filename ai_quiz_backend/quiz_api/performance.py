@@ -0,0 +1,160 @@
+"""
+Per-student performance aggregates behind the student report.
+
+Each new quiz score is added to the student's StudentPerformance rows for
+the overall total and for the subject, chapter and subchapter of the quiz,
+in the same transaction as the score; the rows of students whose scores
+are deleted are rebuilt by the handler in signals.py. `python manage.py
+rebuild_performance` recomputes the rows from the scores.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum, Window
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+
+from .models import Quiz, QuizScore, StudentPerformance
+
+# Scopes from the widest to the narrowest
+SCOPES = [scope for scope, label in StudentPerformance.SCOPE_CHOICES]
+
+# Rows written per query when rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+# Most recent quizzes listed under each subchapter of the student report
+REPORT_RECENT_QUIZZES = 10
+
+def performance_keys(subchapter):
+    """Return the scope fields of the rows a score on a subchapter's material counts towards."""
+    chapter = subchapter.chapter
+    return [
+        {'scope': 'overall', 'scope_id': 0},
+        {'scope': 'subject', 'scope_id': chapter.subject_id, 'subject_id': chapter.subject_id},
+        {'scope': 'chapter', 'scope_id': chapter.id, 'subject_id': chapter.subject_id, 'chapter_id': chapter.id},
+        {'scope': 'subchapter', 'scope_id': subchapter.id, 'subject_id': chapter.subject_id,
+         'chapter_id': chapter.id, 'subchapter_id': subchapter.id},
+    ]
+
+def record_score(score):
+    """
+    Add a newly saved quiz score to the student's performance rows. Call it
+    in the transaction that saved the score, so the totals never miss or
+    double count it.
+    """
+    quiz = Quiz.objects.select_related('material__subchapter__chapter').get(pk=score.quiz_id)
+    keys = performance_keys(quiz.material.subchapter)
+    match = Q()
+    for key in keys:
+        match |= Q(scope=key['scope'], scope_id=key['scope_id'])
+    
+    rows = StudentPerformance.objects.filter(match, user_id=score.user_id)
+    existing = set(rows.values_list('scope', flat=True))
+    missing = [StudentPerformance(user_id=score.user_id, **key) for key in keys if key['scope'] not in existing]
+    if missing:
+        # Rows created by a concurrent score are kept; the update below adds to them
+        StudentPerformance.objects.bulk_create(missing, ignore_conflicts=True)
+    
+    rows.update(
+        quiz_count=F('quiz_count') + 1,
+        total_score=F('total_score') + score.score,
+        highest_score=Greatest('highest_score', score.score),
+        last_quiz_at=Greatest(Coalesce('last_quiz_at', score.completed_at), score.completed_at),
+    )
+
+def rebuild_student_performance(user_ids=None):
+    """
+    Recompute the performance rows of the given users (all users by default)
+    from their quiz scores. Returns the number of rows written.
+    """
+    scores = QuizScore.objects.all()
+    if user_ids is not None:
+        scores = scores.filter(user_id__in=user_ids)
+    
+    totals = {}
+    per_subchapter = scores.values(
+        'user_id',
+        subchapter_id=F('quiz__material__subchapter_id'),
+        chapter_id=F('quiz__material__subchapter__chapter_id'),
+        subject_id=F('quiz__material__subchapter__chapter__subject_id'),
+    ).annotate(
+        count=Count('id'), total=Sum('score'), highest=Max('score'), last=Max('completed_at')
+    ).order_by()
+    for group in per_subchapter.iterator():
+        keys = [
+            ('overall', 0, {}),
+            ('subject', group['subject_id'], {'subject_id': group['subject_id']}),
+            ('chapter', group['chapter_id'], {'subject_id': group['subject_id'], 'chapter_id': group['chapter_id']}),
+            ('subchapter', group['subchapter_id'], {'subject_id': group['subject_id'],
+                                                    'chapter_id': group['chapter_id'],
+                                                    'subchapter_id': group['subchapter_id']}),
+        ]
+        for scope, scope_id, fields in keys:
+            row = totals.get((group['user_id'], scope, scope_id))
+            if row is None:
+                row = totals[(group['user_id'], scope, scope_id)] = StudentPerformance(
+                    user_id=group['user_id'], scope=scope, scope_id=scope_id, **fields
+                )
+            row.quiz_count += group['count']
+            row.total_score += group['total']
+            row.highest_score = max(row.highest_score, group['highest'])
+            row.last_quiz_at = max(row.last_quiz_at, group['last']) if row.last_quiz_at else group['last']
+    
+    with transaction.atomic():
+        existing = StudentPerformance.objects.all()
+        if user_ids is not None:
+            existing = existing.filter(user_id__in=user_ids)
+        existing.delete()
+        StudentPerformance.objects.bulk_create(totals.values(), batch_size=REBUILD_BATCH_SIZE)
+    return len(totals)
+
+def get_student_performance(user):
+    """
+    Return the student's overall performance row (None if they have no
+    scores) and their subject -> chapter -> subchapter performance as nested
+    dicts keyed by name, from the stored aggregates. Each subchapter also
+    lists the student's REPORT_RECENT_QUIZZES most recent quizzes in it.
+    """
+    rows = sorted(
+        StudentPerformance.objects.filter(user=user).select_related('subject', 'chapter', 'subchapter'),
+        key=lambda row: SCOPES.index(row.scope)
+    )
+    
+    # Only the most recent scores of each subchapter are fetched, however long the student's history
+    recent_scores = QuizScore.objects.filter(user=user).annotate(recent_rank=Window(
+        RowNumber(), partition_by=F('quiz__material__subchapter_id'), order_by=F('completed_at').desc()
+    )).filter(recent_rank__lte=REPORT_RECENT_QUIZZES)
+    quizzes = {}
+    for score in recent_scores.values(
+        'score', 'completed_at', 'quiz_id', level=F('quiz__level'), title=F('quiz__material__title'),
+        subchapter_id=F('quiz__material__subchapter_id')
+    ).order_by('completed_at'):
+        quizzes.setdefault(score['subchapter_id'], []).append({
+            'id': score['quiz_id'],
+            'title': score['title'],
+            'level': score['level'],
+            'score': float(score['score']),
+            'date': score['completed_at'].strftime('%Y-%m-%d %H:%M')
+        })
+    
+    overall = None
+    subjects = {}
+    chapters = {}
+    subject_performance = {}
+    for row in rows:
+        data = {
+            'total_quizzes': row.quiz_count,
+            'total_score': float(row.total_score),
+            'avg_score': float(row.avg_score),
+            'highest_score': float(row.highest_score),
+            'last_quiz_at': row.last_quiz_at,
+        }
+        if row.scope == 'overall':
+            overall = row
+        elif row.scope == 'subject':
+            data['chapters'] = {}
+            subjects[row.scope_id] = subject_performance[row.subject.name] = data
+        elif row.scope == 'chapter' and row.subject_id in subjects:
+            data['subchapters'] = {}
+            chapters[row.scope_id] = subjects[row.subject_id]['chapters'][row.chapter.name] = data
+        elif row.scope == 'subchapter' and row.chapter_id in chapters:
+            data['quizzes'] = quizzes.get(row.scope_id, [])
+            chapters[row.chapter_id]['subchapters'][row.subchapter.name] = data
+    return overall, subject_performance
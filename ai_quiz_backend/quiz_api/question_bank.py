@@ -0,0 +1,27 @@
+"""
+Quiz variants drawn locally from a question bank.
+
+A bank holds many generated questions for a material and level. Each
+student gets a random subset with shuffled options, reproducible from an
+integer seed, so serving a unique quiz needs no model call.
+"""
+import hashlib
+import random
+
+def variant_seed(user_id, bank_id, attempt):
+    """Return the seed of a student's variant: stable for one attempt, new for each retake."""
+    digest = hashlib.sha256(f"{user_id}:{bank_id}:{attempt}".encode('utf-8')).digest()
+    # Keep within a signed 64-bit integer for BigIntegerField
+    return int.from_bytes(digest[:8], 'big') >> 1
+
+def build_variant(questions, seed, count):
+    """Pick `count` questions and shuffle their options, deterministically for the seed."""
+    rng = random.Random(seed)
+    picked = rng.sample(questions, min(count, len(questions)))
+    
+    variant = []
+    for question in picked:
+        options = list(question['options'])
+        rng.shuffle(options)
+        variant.append({**question, 'options': options})
+    return variant
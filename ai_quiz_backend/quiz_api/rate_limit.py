@@ -0,0 +1,80 @@
+"""
+Client-side rate limiting for calls to the OpenAI API.
+
+A RateLimiter installed with set_rate_limiter() is waited for before every
+provider call made through openai_utils, with the size of the actual prompt,
+and corrected with the real token usage once the call has finished.
+"""
+import threading
+import time
+
+# Characters per token used to estimate the size of a prompt before sending it
+CHARS_PER_TOKEN = 4
+
+def estimate_prompt_tokens(messages):
+    """Estimate the number of tokens of a list of chat messages."""
+    return sum(len(message['content']) for message in messages) // CHARS_PER_TOKEN + 1
+
+class TokenBucket:
+    """Bucket holding up to `capacity` units, refilled continuously at rate_per_minute."""
+    
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+    
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        self.available = min(self.capacity, self.available + elapsed * self.rate_per_second)
+        self.updated_at = now
+    
+    def wait_time(self, amount):
+        """Seconds until `amount` units will be available."""
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self.rate_per_second)
+    
+    def take(self, amount):
+        """Remove `amount` units; a negative amount gives units back."""
+        self.available = min(self.capacity, self.available - min(amount, self.capacity))
+
+class RateLimiter:
+    """
+    Thread-safe limiter enforcing both requests per minute and tokens per
+    minute, matching how OpenAI rate-limits an API key.
+    """
+    
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._lock = threading.Lock()
+    
+    def acquire(self, estimated_tokens):
+        """Block until one request using about estimated_tokens tokens may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return
+            time.sleep(wait)
+    
+    def settle(self, estimated_tokens, used_tokens):
+        """Correct the token bucket once a request's real usage is known."""
+        with self._lock:
+            self.tokens.take(used_tokens - estimated_tokens)
+
+_rate_limiter = None
+
+def set_rate_limiter(limiter):
+    """Make every provider call in this process wait for `limiter`, or stop limiting with None."""
+    global _rate_limiter
+    _rate_limiter = limiter
+
+def get_rate_limiter():
+    """Return the rate limiter installed in this process, if any."""
+    return _rate_limiter
@@ -0,0 +1,193 @@
+"""
+Study recommendations, recomputed in the background.
+
+Submitting a quiz score marks the student's recommendations as pending.
+The worker started with `python manage.py run_worker` recomputes them once
+the student has paused for RECOMMENDATION_DEBOUNCE seconds, or at the
+latest RECOMMENDATION_STALE_AFTER seconds after the first new score, so
+the API only ever reads stored recommendations.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Avg, Max, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import QuizScore, RecommendationState, StudyRecommendation
+from .openai_utils import generate_study_recommendations
+from .summaries import get_stored_summaries
+
+logger = logging.getLogger(__name__)
+
+# Number of recent quizzes described to the model when generating recommendations
+RECOMMENDATION_HISTORY_QUIZZES = 10
+
+class RecommendationError(Exception):
+    """Raised when recommendations could not be generated."""
+
+def build_quiz_history(scores):
+    """
+    Describe a student's most recent quizzes compactly: average score,
+    attempts, questions missed in the latest attempt and the key concepts of
+    the material.
+    """
+    recent_quiz_ids = list(
+        scores.values('quiz_id').annotate(last_completed=Max('completed_at'))
+        .order_by('-last_completed').values_list('quiz_id', flat=True)[:RECOMMENDATION_HISTORY_QUIZZES]
+    )
+    history = {}
+    recent_scores = scores.filter(quiz_id__in=recent_quiz_ids).select_related('quiz__material')
+    for score in recent_scores.order_by('-completed_at'):
+        entry = history.get(score.quiz_id)
+        if entry is None:
+            questions = score.get_questions()
+            answers = score.get_answers()
+            missed = sum(
+                1 for question, answer in zip(questions, answers)
+                if answer != question.get('correct_answer')
+            )
+            entry = history[score.quiz_id] = {
+                'material_id': score.quiz.material_id,
+                'material': score.quiz.material.title,
+                'level': score.quiz.level,
+                'scores': [],
+                'missed': missed,
+                'total': len(questions) if answers else 0,
+            }
+        entry['scores'].append(float(score.score))
+    
+    summaries = get_stored_summaries({entry['material_id'] for entry in history.values()})
+    quiz_history = []
+    for entry in history.values():
+        scores_taken = entry.pop('scores')
+        summary = summaries.get(entry.pop('material_id')) or {}
+        entry['score'] = round(sum(scores_taken) / len(scores_taken), 1)
+        entry['attempts'] = len(scores_taken)
+        entry['concepts'] = summary.get('key_concepts', [])[:3]
+        quiz_history.append(entry)
+    return quiz_history
+
+def find_strengths_and_weaknesses(scores):
+    """
+    Split the subchapters of the student's five most recent quizzes into
+    strengths (a score of 70% or more on the material) and weaknesses.
+    Returns two lists of subchapters, most recent first.
+    """
+    recent_scores = scores.select_related(
+        'quiz__material__subchapter__chapter__subject'
+    ).order_by('-completed_at')[:5]
+    
+    strengths = []
+    weaknesses = []
+    for score in recent_scores:
+        material = score.quiz.material
+        subchapter = material.subchapter
+        if subchapter in strengths or subchapter in weaknesses:
+            continue
+        if scores.filter(quiz__material=material, score__gte=70).exists():
+            strengths.append(subchapter)
+        else:
+            weaknesses.append(subchapter)
+    return strengths, weaknesses
+
+def describe_subchapter(subchapter):
+    return f"{subchapter.chapter.subject.name} - {subchapter.chapter.name} - {subchapter.name}"
+
+def refresh_recommendations(user):
+    """
+    Recompute a student's study recommendations from their quiz scores and
+    replace the stored ones. Raises RecommendationError if the model gave none.
+    """
+    scores = QuizScore.objects.filter(user=user)
+    if not scores.exists():
+        return []
+    
+    strengths, weaknesses = find_strengths_and_weaknesses(scores)
+    user_data = {
+        'avg_score': float(scores.aggregate(avg_score=Avg('score'))['avg_score']),
+        'strengths': [describe_subchapter(subchapter) for subchapter in strengths[:3]],  # Top 3 strengths
+        'weaknesses': [describe_subchapter(subchapter) for subchapter in weaknesses[:3]]  # Top 3 weaknesses
+    }
+    
+    recommendations = generate_study_recommendations(user_data, build_quiz_history(scores))
+    if not recommendations:
+        raise RecommendationError('Failed to generate study recommendations')
+    
+    # Save the first 2 recommendations for each of the top 2 weaknesses
+    with transaction.atomic():
+        StudyRecommendation.objects.filter(user=user).delete()
+        saved_recommendations = []
+        for subchapter in weaknesses[:2]:
+            for rec_text in recommendations[:2]:
+                saved_recommendations.append(StudyRecommendation.objects.create(
+                    user=user,
+                    subchapter=subchapter,
+                    recommendation=rec_text
+                ))
+            recommendations = recommendations[2:]
+            if not recommendations:
+                break
+    return saved_recommendations
+
+def mark_recommendations_stale(user):
+    """Record that the student has a new, changed or deleted score their recommendations don't reflect yet."""
+    now = timezone.now()
+    state, created = RecommendationState.objects.get_or_create(
+        user=user, defaults={'pending_since': now, 'last_score_at': now}
+    )
+    if not created:
+        RecommendationState.objects.filter(pk=state.pk).update(
+            pending_since=Coalesce('pending_since', now), last_score_at=now
+        )
+
+def due_refreshes():
+    """States whose pending recommendations should be recomputed now."""
+    now = timezone.now()
+    return RecommendationState.objects.filter(
+        Q(last_score_at__lte=now - timedelta(seconds=settings.RECOMMENDATION_DEBOUNCE)) |
+        Q(pending_since__lte=now - timedelta(seconds=settings.RECOMMENDATION_STALE_AFTER)),
+        Q(refresh_started_at__isnull=True) |
+        Q(refresh_started_at__lte=now - timedelta(seconds=settings.RECOMMENDATION_RETRY_AFTER)),
+        pending_since__isnull=False
+    )
+
+def claim_next_refresh():
+    """Mark the longest-waiting due refresh as started and return its state, or None."""
+    with transaction.atomic():
+        state = due_refreshes().select_for_update(skip_locked=True).order_by('pending_since').first()
+        if state is None:
+            return None
+        state.refresh_started_at = timezone.now()
+        state.save(update_fields=['refresh_started_at'])
+        return state
+
+def run_refresh(state):
+    """
+    Recompute the recommendations of a claimed state. Scores submitted while
+    it runs leave the state pending; a failed refresh is retried after
+    RECOMMENDATION_RETRY_AFTER seconds.
+    """
+    try:
+        refresh_recommendations(state.user)
+        RecommendationState.objects.filter(pk=state.pk).update(
+            refreshed_at=timezone.now(), refresh_started_at=None, error=None
+        )
+        RecommendationState.objects.filter(
+            pk=state.pk, last_score_at__lte=state.refresh_started_at
+        ).update(pending_since=None)
+    except Exception as e:
+        logger.error(f"Refreshing recommendations for user {state.user_id} failed: {e}")
+        RecommendationState.objects.filter(pk=state.pk).update(error=str(e))
+    finally:
+        # Refreshes run in worker threads, each with its own database connection
+        connection.close()
+
+def get_recommendation_freshness(state):
+    """Describe how up to date a student's stored recommendations are."""
+    return {
+        'refreshed_at': state.refreshed_at if state else None,
+        'pending': bool(state and state.pending_since),
+        'pending_since': state.pending_since if state else None,
+    }
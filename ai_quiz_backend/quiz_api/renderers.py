@@ -0,0 +1,85 @@
+"""
+Passing stored JSON columns through to API responses without decoding and
+re-encoding them.
+
+with_raw_json() makes a queryset load a JSON column as its stored text,
+serializers wrap that text in RawJSON with stored_json(), and
+RawJSONRenderer splices it into the response body as it is.
+"""
+import re
+import secrets
+
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from rest_framework.compat import INDENT_SEPARATORS, LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+class RawJSON:
+    """JSON text that RawJSONRenderer writes into the response unchanged."""
+    
+    def __init__(self, text):
+        self.text = text
+
+def with_raw_json(queryset, *fields):
+    """
+    Load each JSON field as text in `<field>_raw` instead of decoding it into
+    Python objects; read it back with stored_json().
+    """
+    return queryset.defer(*fields).annotate(**{
+        f'{field}_raw': Cast(field, output_field=TextField()) for field in fields
+    })
+
+def stored_json(obj, field):
+    """Return a model's JSON field as RawJSON if loaded with with_raw_json(), else its decoded value."""
+    if hasattr(obj, f'{field}_raw'):
+        text = getattr(obj, f'{field}_raw')
+        return None if text is None else RawJSON(text)
+    return getattr(obj, field)
+
+class RawJSONEncoder(encoders.JSONEncoder):
+    """
+    Encodes RawJSON values as unique placeholders that the renderer replaces
+    with their text once the rest of the response has been encoded.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token = secrets.token_hex(8)
+        self.raw_values = []
+    
+    def default(self, obj):
+        if isinstance(obj, RawJSON):
+            self.raw_values.append(obj.text)
+            return f"\x00{self.token}:{len(self.raw_values) - 1}\x00"
+        return super().default(obj)
+    
+    def splice(self, content):
+        """Replace the placeholders in encoded content with the raw JSON text."""
+        if not self.raw_values:
+            return content
+        placeholder = re.compile(r'"\\u0000' + self.token + r':(\d+)\\u0000"')
+        return placeholder.sub(lambda match: self.raw_values[int(match.group(1))], content)
+
+class RawJSONRenderer(JSONRenderer):
+    """JSONRenderer that writes RawJSON values into the body without re-encoding them."""
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+        if indent is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        else:
+            separators = INDENT_SEPARATORS
+        
+        encoder = RawJSONEncoder(
+            indent=indent, ensure_ascii=self.ensure_ascii, allow_nan=not self.strict, separators=separators
+        )
+        content = encoder.splice(encoder.encode(data))
+        
+        # Escape the line separators that are valid JSON but break JavaScript, as JSONRenderer does
+        content = content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return content.encode()
@@ -1,12 +1,19 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Subject, Chapter, Subchapter, StudyMaterial, Quiz, QuizScore, StudyRecommendation
+from .models import (
+    Subject, Chapter, Subchapter, StudyMaterial, MaterialContent,
+    Quiz, QuestionBank, QuizGenerationJob, QuizScore, StudyRecommendation, LeaderboardEntry,
+    format_time_taken, parse_time_taken
+)
+from .question_bank import build_variant
+from .renderers import stored_json
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
-        
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     confirm_password = serializers.CharField(write_only=True)
@@ -14,7 +21,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'email', 'password', 'confirm_password', 'first_name', 'last_name']
-        
+    
     def validate(self, data):
         if data.get('password') != data.get('confirm_password'):
             raise serializers.ValidationError("Passwords do not match.")
@@ -34,7 +41,7 @@ class ChapterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Chapter
         fields = ['id', 'subject', 'name', 'description', 'order', 'created_at']
-        
+
 class ChapterDetailSerializer(serializers.ModelSerializer):
     subject = SubjectSerializer(read_only=True)
     
@@ -61,15 +68,21 @@ class StudyMaterialSerializer(serializers.ModelSerializer):
         model = StudyMaterial
         fields = ['id', 'subchapter', 'title', 'description', 'document', 
                  'file_type', 'file_size', 'uploaded_by', 'created_at']
-        
+
+class MaterialContentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MaterialContent
+        fields = ['status', 'page_count', 'word_count', 'content_hash', 'updated_at']
+
 class StudyMaterialDetailSerializer(serializers.ModelSerializer):
     subchapter = SubchapterDetailSerializer(read_only=True)
     uploaded_by = UserSerializer(read_only=True)
+    content = MaterialContentSerializer(read_only=True)
     
     class Meta:
         model = StudyMaterial
         fields = ['id', 'subchapter', 'title', 'description', 'document', 
-                 'file_type', 'file_size', 'uploaded_by', 'created_at']
+                 'file_type', 'file_size', 'uploaded_by', 'content', 'created_at']
 
 class QuizQuestionSerializer(serializers.Serializer):
     question = serializers.CharField()
@@ -83,11 +96,10 @@ class QuizSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quiz
         fields = ['id', 'material', 'level', 'questions', 'created_at']
-        
-    def get_questions(self, obj):
-        questions = obj.get_questions()
-        return questions
     
+    def get_questions(self, obj):
+        return stored_json(obj, 'questions_json')
+
 class QuizDetailSerializer(serializers.ModelSerializer):
     material = StudyMaterialSerializer(read_only=True)
     questions = serializers.SerializerMethodField()
@@ -95,36 +107,79 @@ class QuizDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quiz
         fields = ['id', 'material', 'level', 'questions', 'created_at']
-        
+    
     def get_questions(self, obj):
-        questions = obj.get_questions()
-        return questions
+        return stored_json(obj, 'questions_json')
+
+class QuestionBankSerializer(serializers.ModelSerializer):
+    question_count = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = QuestionBank
+        fields = ['id', 'material', 'level', 'question_count', 'created_at', 'updated_at']
+    
+    def get_question_count(self, obj):
+        return len(obj.get_questions())
+
+class QuizGenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = QuizGenerationJob
+        fields = ['id', 'material', 'kind', 'level', 'status', 'progress', 'quiz', 'error', 
+                 'attempts', 'created_at', 'started_at', 'finished_at']
+
+class TimeTakenField(serializers.Field):
+    """Time taken stored in seconds, read and written as m:ss (e.g. "5:30")."""
+    default_error_messages = {
+        'invalid': 'Enter the time taken as m:ss, e.g. "5:30".',
+    }
+    
+    def to_representation(self, value):
+        return format_time_taken(value)
+    
+    def to_internal_value(self, data):
+        try:
+            return parse_time_taken(data)
+        except (TypeError, ValueError):
+            self.fail('invalid')
 
 class QuizScoreSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    time_taken = TimeTakenField(source='time_seconds')
     answers = serializers.SerializerMethodField()
     
     class Meta:
         model = QuizScore
-        fields = ['id', 'user', 'quiz', 'score', 'time_taken', 'answers', 'completed_at']
-        
-    def get_answers(self, obj):
-        return obj.get_answers()
+        fields = ['id', 'user', 'quiz', 'score', 'time_taken', 'answers', 'variant_seed', 'completed_at']
+        # The variant's questions are saved with the score, so the variant taken can't change
+        read_only_fields = ['variant_seed']
     
+    def get_answers(self, obj):
+        return stored_json(obj, 'answers_json')
+
 class QuizScoreCreateSerializer(serializers.ModelSerializer):
     answers = serializers.JSONField(write_only=True)
+    time_taken = TimeTakenField(source='time_seconds')
     
     class Meta:
         model = QuizScore
-        fields = ['quiz', 'score', 'time_taken', 'answers']
-        
+        fields = ['quiz', 'score', 'time_taken', 'answers', 'variant_seed']
+    
+    def validate(self, data):
+        # Save the variant's questions with the score: the answers are in their order, not the quiz's
+        seed = data.get('variant_seed')
+        if seed is not None:
+            quiz = data['quiz']
+            bank = QuestionBank.objects.filter(material_id=quiz.material_id, level=quiz.level).first()
+            if bank is None:
+                raise serializers.ValidationError({'variant_seed': 'This quiz has no question bank to draw variants from.'})
+            data['questions_json'] = build_variant(bank.get_questions(), seed, settings.QUIZ_VARIANT_SIZE)
+        return data
+    
     def create(self, validated_data):
         answers = validated_data.pop('answers')
-        user = self.context['request'].user
-        quiz_score = QuizScore.objects.create(user=user, **validated_data)
-        quiz_score.set_answers(answers)
-        quiz_score.save()
-        return quiz_score
+        # The view passes the user to save(); fall back to the request user
+        user = validated_data.pop('user', None) or self.context['request'].user
+        return QuizScore.objects.create(user=user, answers_json=answers, **validated_data)
 
 class StudyRecommendationSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -137,7 +192,17 @@ class StudyRecommendationSerializer(serializers.ModelSerializer):
 class LeaderboardSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     quiz = QuizSerializer(read_only=True)
+    time_taken = TimeTakenField(source='time_seconds', read_only=True)
     
     class Meta:
         model = QuizScore
-        fields = ['id', 'user', 'quiz', 'score', 'time_taken', 'completed_at']
\ No newline at end of file
+        fields = ['id', 'user', 'quiz', 'score', 'time_taken', 'completed_at']
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+    quiz = serializers.IntegerField(source='quiz_score.quiz_id', read_only=True)
+    time_taken = TimeTakenField(source='time_seconds', read_only=True)
+    
+    class Meta:
+        model = LeaderboardEntry
+        fields = ['user', 'username', 'quiz', 'score', 'time_taken', 'achieved_at']
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Keep the per-student aggregates and leaderboards right when quiz scores
+are deleted.
+
+Scores are not only deleted one at a time through the API: deleting a
+study material, quiz or user deletes theirs by cascade, and teachers can
+delete them from the admin. A post_delete handler notes the students who
+lost scores and rebuilds their aggregates and leaderboard entries once the
+transaction commits, once per student however many of their scores were
+deleted, so a deleted best attempt gives way to the next best one.
+"""
+import threading
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import QuizScore
+from .leaderboards import rebuild_leaderboards
+from .performance import rebuild_student_performance
+
+# Students whose scores were deleted in this thread's transaction and not rebuilt yet
+_pending = threading.local()
+
+def pending_user_ids():
+    if not hasattr(_pending, 'user_ids'):
+        _pending.user_ids = set()
+    return _pending.user_ids
+
+def rebuild_pending_students():
+    """Rebuild the aggregates and leaderboard entries of the students noted so far; later callbacks find nothing left to do."""
+    user_ids = pending_user_ids()
+    if not user_ids:
+        return
+    user_ids = list(user_ids)
+    pending_user_ids().clear()
+    rebuild_student_performance(user_ids)
+    rebuild_leaderboards(user_ids)
+
+@receiver(post_delete, sender=QuizScore)
+def quiz_score_deleted(sender, instance, **kwargs):
+    pending_user_ids().add(instance.user_id)
+    transaction.on_commit(rebuild_pending_students)
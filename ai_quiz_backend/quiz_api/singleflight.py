@@ -0,0 +1,73 @@
+"""
+In-process request coalescing: concurrent calls for the same key share one
+computation instead of each doing the work.
+"""
+import threading
+
+class Call:
+    """One in-flight computation whose result is shared by every caller of its key."""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+    
+    def wait(self, timeout=None):
+        """Wait for the computation and return its result, or raise its error."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for a shared computation")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+class SingleFlight:
+    """
+    Thread-safe registry of in-flight computations by key. The first caller
+    for a key becomes the leader and does the work; callers arriving while it
+    runs wait for and receive the leader's result (or error).
+    """
+    
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+    
+    def begin(self, key):
+        """
+        Join the computation for key. Returns (call, leader); a leader must
+        end it with finish() or fail(), anyone else can call call.wait().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = Call()
+            return call, True
+    
+    def finish(self, key, result):
+        """Publish the leader's result to the waiting callers."""
+        call = self._end(key)
+        call.result = result
+        call.done.set()
+    
+    def fail(self, key, error):
+        """Publish the leader's error to the waiting callers."""
+        call = self._end(key)
+        call.error = error
+        call.done.set()
+    
+    def _end(self, key):
+        with self._lock:
+            return self._calls.pop(key)
+    
+    def do(self, key, fn):
+        """Return fn() for key, sharing one call of fn among concurrent callers."""
+        call, leader = self.begin(key)
+        if not leader:
+            return call.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            self.fail(key, e)
+            raise
+        self.finish(key, result)
+        return result
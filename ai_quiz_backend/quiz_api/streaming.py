@@ -0,0 +1,68 @@
+"""
+Helpers for streaming generated questions to the client with Server-Sent Events.
+"""
+import json
+from rest_framework.renderers import BaseRenderer
+
+class JSONArrayObjectParser:
+    """
+    Incrementally parses JSON text as it is streamed and returns every object
+    that is a direct element of an array as soon as its closing brace arrives,
+    e.g. each question of {"questions": [{...}, {...}]}.
+    """
+    
+    def __init__(self):
+        self.containers = []  # Open '{' and '[' characters
+        self.in_string = False
+        self.escaped = False
+        self.current = None  # Characters of the object being captured
+        self.capture_depth = None
+    
+    def feed(self, text):
+        """Consume a chunk of JSON text and return the objects it completed."""
+        objects = []
+        for char in text:
+            if self.current is not None:
+                self.current.append(char)
+            
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if char == '{' and self.current is None and self.containers and self.containers[-1] == '[':
+                    self.current = [char]
+                    self.capture_depth = len(self.containers)
+                self.containers.append(char)
+            elif char in '}]':
+                if self.containers:
+                    self.containers.pop()
+                if self.current is not None and len(self.containers) == self.capture_depth:
+                    try:
+                        objects.append(json.loads("".join(self.current)))
+                    except ValueError:
+                        pass
+                    self.current = None
+        return objects
+
+def format_sse(event, data):
+    """Encode one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets streaming views pass content negotiation for EventSource clients,
+    which send `Accept: text/event-stream`. Non-streamed responses such as
+    validation errors are rendered as JSON.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode(self.charset)
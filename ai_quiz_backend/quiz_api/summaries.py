@@ -0,0 +1,104 @@
+"""
+Per-material summaries: key concepts, vocabulary and learning objectives
+written once by the model and reused by every quiz level and by study
+recommendations instead of resending the raw document text.
+
+A summary records the hash of the document it was made from and is
+rewritten when the document changes. When no summary can be made, the
+failure is recorded the same way and the model is not asked again for
+that document until SUMMARY_RETRY_AFTER has passed.
+"""
+import logging
+import os
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import MaterialContent, MaterialSummary
+from .ingestion import get_material_text
+from .openai_utils import (
+    SUMMARY_SECTIONS, SUMMARY_TEXT_BUDGET, compute_document_hash, generate_material_summary
+)
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Summaries being written in this process, shared by concurrent requests
+_summaries = SingleFlight()
+
+def get_content_hash(material):
+    """Return the hash of a material's current document."""
+    content = MaterialContent.objects.filter(material=material, status='ready').first()
+    if content and content.content_hash:
+        return content.content_hash
+    # Until ingestion finishes, hash the file once per version of it rather than on every request
+    path = material.document.path
+    stat = os.stat(path)
+    return hash_document_version(path, stat.st_size, stat.st_mtime_ns)
+
+@lru_cache(maxsize=256)
+def hash_document_version(path, size, mtime_ns):
+    """Return the hash of the document at path, cached by its size and modification time."""
+    return compute_document_hash(path)
+
+def get_material_summary(material):
+    """
+    Return the summary of a study material as a dict of lists, writing it if
+    there is none or the document has changed since. Returns None if no
+    summary could be made.
+    """
+    try:
+        content_hash = get_content_hash(material)
+    except OSError as e:
+        logger.error(f"Could not read the document of study material {material.id}: {e}")
+        return None
+    
+    summary = MaterialSummary.objects.filter(material=material, content_hash=content_hash).first()
+    if summary and summary.failed_at is None:
+        return summary.get_summary()
+    if summary and summary.failed_at > timezone.now() - timedelta(seconds=settings.SUMMARY_RETRY_AFTER):
+        # Summarizing this document failed recently; don't ask the model again on every request
+        return None
+    
+    return _summaries.do((material.id, content_hash), lambda: write_material_summary(material, content_hash))
+
+def write_material_summary(material, content_hash):
+    """
+    Summarize a material's text with the model and store it under
+    content_hash, or record under content_hash that no summary could be made.
+    """
+    text_content = get_material_text(material, max_chars=SUMMARY_TEXT_BUDGET)
+    summary_data = generate_material_summary(text_content) if text_content else None
+    
+    summary, created = MaterialSummary.objects.get_or_create(
+        material=material, defaults={'content_hash': content_hash, 'summary_json': '{}'}
+    )
+    summary.content_hash = content_hash
+    summary.set_summary(summary_data or {})
+    summary.failed_at = None if summary_data else timezone.now()
+    summary.save()
+    return summary_data or None
+
+def get_stored_summaries(material_ids):
+    """
+    Return {material id: summary} for the materials whose summary was made
+    from their current, ingested document, without calling the model or
+    reading any document.
+    """
+    summaries = MaterialSummary.objects.filter(
+        material_id__in=material_ids, failed_at__isnull=True,
+        material__content__status='ready', content_hash=F('material__content__content_hash')
+    )
+    return {summary.material_id: summary.get_summary() for summary in summaries}
+
+def format_summary(summary):
+    """Render a summary as compact labelled lines for a prompt."""
+    lines = []
+    for section in SUMMARY_SECTIONS:
+        items = summary.get(section)
+        if items:
+            label = section.replace('_', ' ').capitalize()
+            lines.append(f"{label}: {'; '.join(items)}")
+    return "\n".join(lines)
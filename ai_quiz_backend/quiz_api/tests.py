@@ -1,3 +1,1883 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import openai
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .models import (
+    Subject, Chapter, Subchapter, StudyMaterial, ExtractedText, MaterialContent, MaterialChunk, MaterialSummary, Quiz, QuestionBank,
+    QuizGenerationJob, QuizScore, StudyRecommendation, RecommendationState, StudentPerformance, LeaderboardEntry, LLMCallMetric, LLMCallCounter,
+    CircuitBreakerState
+)
+from .chunking import CHUNK_SEPARATOR, build_chunk_index, compute_chunk_vectors, select_chunks, split_into_chunks
+from .admin import StudyMaterialAdmin
+from .circuit_breaker import CircuitOpenError, clear_cached_circuit_states, get_circuit_breaker
+from .generation import (
+    arepair_questions, create_quizzes_for_levels, fill_question_bank, get_or_create_quiz, repair_questions, stream_quiz
+)
+from .ingestion import get_material_text, schedule_ingestion
+from .jobs import claim_next_job, enqueue_quiz_generation, recover_stuck_jobs, run_job
+from .leaderboards import get_leaderboard, rebuild_leaderboards, record_leaderboard_score
+from .llm_cache import get_llm_cache
+from .metrics import prune_llm_metrics, record_llm_call, render_prometheus_metrics
+from .llm_providers import FakeProvider, LLMReplayMissError, OpenAIProvider, RecordReplayProvider
+from .openai_utils import (
+    agenerate_quiz, agenerate_study_recommendations, cached_chat_completion, generate_quiz, parse_quiz_response,
+    stream_chat_completion, stream_quiz_questions
+)
+from .summaries import get_content_hash, get_material_summary, get_stored_summaries
+from .singleflight import Call, SingleFlight
+from .performance import record_score
+from .question_bank import build_variant
+from .recommendations import RECOMMENDATION_HISTORY_QUIZZES, build_quiz_history
+from .rate_limit import RateLimiter, TokenBucket, estimate_prompt_tokens, set_rate_limiter
+from .streaming import JSONArrayObjectParser
+from .validation import split_valid_questions, validate_question
+from .openai_utils import (
+    EXTRACTOR_VERSION, compute_document_hash, extract_text_from_doc, extract_text_from_pdf, extract_text_parallel, get_document_text
+)
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one line of Helvetica text per page."""
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in page_ids) + b"] /Count %d >>" % len(pages),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, text in zip(page_ids, pages):
+        stream = b"BT /F1 12 Tf 72 720 Td (" + text.encode() + b") Tj ET"
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (page_id + 1)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def write_docx(path, body):
+    """Write a Word document whose body is the given WordprocessingML markup."""
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+        ' xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+        ' xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape">'
+        f'<w:body>{body}</w:body></w:document>'
+    )
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('word/document.xml', document)
+        archive.writestr('docProps/app.xml', '<Properties><Pages>1</Pages></Properties>')
+        archive.writestr('word/media/image1.png', b'\x89PNG')
+
+@skipUnless(connection.vendor in ('postgresql', 'sqlite'), 'EXPLAIN plans are checked on PostgreSQL and SQLite')
+class HotQueryIndexTests(TestCase):
+    """
+    The queries behind the busiest endpoints, the worker and generate_quizzes.py
+    must be answerable from an index. On PostgreSQL sequential scans are
+    disabled in the planner, so a query only shows a "Seq Scan" if no index
+    can serve it. SQLite shows a table it reads without an index as
+    "SCAN <table>" in its query plan.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='student', password='password')
+        cls.subject = Subject.objects.create(name='Science')
+        cls.chapter = Chapter.objects.create(subject=cls.subject, name='Plants', order=1)
+        cls.subchapter = Subchapter.objects.create(chapter=cls.chapter, name='Leaves', order=1)
+        cls.material = StudyMaterial.objects.create(
+            subchapter=cls.subchapter, title='Leaves', document='study_materials/leaves.pdf',
+            file_type='pdf', file_size='1 KB'
+        )
+        cls.quiz = Quiz.objects.create(material=cls.material, level='Beginner', questions_json=[])
+        QuestionBank.objects.create(material=cls.material, level='Beginner', questions_json=[])
+        QuizScore.objects.create(user=cls.user, quiz=cls.quiz, score=80, time_seconds=330, answers_json=[])
+        StudyRecommendation.objects.create(user=cls.user, subchapter=cls.subchapter, recommendation='Read again')
+        QuizGenerationJob.objects.create(material=cls.material, level='Intermediate')
+        rebuild_leaderboards()
+    
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+    
+    def assertNoSeqScan(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            # "SCAN <table> USING [COVERING] INDEX <index>" walks an index instead of the table
+            full_scans = [line for line in plan.splitlines() if re.search(r'\bSCAN\b(?!.*\bUSING\b.*\bINDEX\b)', line)]
+            self.assertEqual(full_scans, [], plan)
+        else:
+            self.assertNotIn('Seq Scan', plan, plan)
+    
+    def test_quiz_by_material_and_level(self):
+        self.assertNoSeqScan(Quiz.objects.filter(material=self.material, level='Beginner'))
+    
+    def test_quizzes_of_material(self):
+        self.assertNoSeqScan(Quiz.objects.filter(material=self.material))
+    
+    def test_materials_with_quiz_at_level(self):
+        self.assertNoSeqScan(Quiz.objects.filter(level='Beginner').values_list('material_id', flat=True))
+        self.assertNoSeqScan(QuestionBank.objects.filter(level='Beginner').values_list('material_id', flat=True))
+    
+    def test_student_attempts_at_quiz(self):
+        self.assertNoSeqScan(QuizScore.objects.filter(user=self.user, quiz=self.quiz))
+    
+    def test_student_recent_scores(self):
+        self.assertNoSeqScan(QuizScore.objects.filter(user=self.user).order_by('-completed_at')[:5])
+    
+    def test_leaderboard(self):
+        self.assertNoSeqScan(QuizScore.objects.filter(quiz=self.quiz).order_by('-score', 'time_seconds')[:10])
+    
+    def test_student_recommendations(self):
+        self.assertNoSeqScan(StudyRecommendation.objects.filter(user=self.user).order_by('-created_at'))
+    
+    def test_chapters_of_subject(self):
+        self.assertNoSeqScan(Chapter.objects.filter(subject=self.subject))
+    
+    def test_subchapters_of_chapter(self):
+        self.assertNoSeqScan(Subchapter.objects.filter(chapter=self.chapter))
+    
+    def test_materials_of_subchapter(self):
+        self.assertNoSeqScan(StudyMaterial.objects.filter(subchapter=self.subchapter))
+    
+    def test_next_queued_job(self):
+        self.assertNoSeqScan(QuizGenerationJob.objects.filter(
+            status='queued', available_at__lte=timezone.now()
+        ).order_by('available_at')[:1])
+    
+    def test_leaderboards(self):
+        for scope, scope_id in [('global', 0), ('subject', self.subject.id), ('material', self.material.id)]:
+            self.assertNoSeqScan(get_leaderboard(scope, scope_id, 'weekly', 10))
+    
+    def test_student_leaderboard_entries(self):
+        self.assertNoSeqScan(LeaderboardEntry.objects.filter(user=self.user, scope='global', scope_id=0, period='all'))
+
+class ExtractedTextCacheTests(TestCase):
+    """Extracted text is stored by content hash and reused until the extractor changes."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'leaves.pdf')
+        write_pdf(self.path, ['Leaves make food', 'Roots drink water'])
+    
+    def test_second_extraction_is_served_from_the_store(self):
+        text = get_document_text(self.path, 'pdf')
+        self.assertIn('Roots drink water', text)
+        with mock.patch('quiz_api.openai_utils.extract_text_parallel') as extract:
+            self.assertEqual(get_document_text(self.path, 'pdf'), text)
+            self.assertEqual(get_document_text(self.path, 'pdf', max_chars=10), text[:10])
+        extract.assert_not_called()
+        self.assertEqual(ExtractedText.objects.count(), 1)
+    
+    def test_new_extractor_version_extracts_again(self):
+        get_document_text(self.path, 'pdf')
+        with mock.patch('quiz_api.openai_utils.EXTRACTOR_VERSION', EXTRACTOR_VERSION + 1), \
+                mock.patch('quiz_api.openai_utils.extract_text_parallel', return_value='Re-extracted') as extract:
+            self.assertEqual(get_document_text(self.path, 'pdf'), 'Re-extracted')
+            self.assertEqual(get_document_text(self.path, 'pdf'), 'Re-extracted')
+        extract.assert_called_once()
+        self.assertEqual(sorted(ExtractedText.objects.values_list('extractor_version', flat=True)), [
+            EXTRACTOR_VERSION, EXTRACTOR_VERSION + 1
+        ])
+    
+    def test_partial_extraction_is_not_stored(self):
+        self.assertEqual(get_document_text(self.path, 'pdf', max_chars=10), 'Leaves mak')
+        self.assertFalse(ExtractedText.objects.exists())
+
+class PDFTextBudgetTests(TestCase):
+    """PDF extraction with a character budget stops parsing pages once the budget is filled."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'leaves.pdf')
+        write_pdf(self.path, [f'Page {number} about leaves' for number in range(1, 21)])
+    
+    def count_parsed_pages(self):
+        from PyPDF2 import PageObject
+        return mock.patch.object(PageObject, 'extract_text', autospec=True, side_effect=PageObject.extract_text)
+    
+    def extract_counting_pages(self, max_chars):
+        with self.count_parsed_pages() as parse:
+            text = extract_text_from_pdf(self.path, max_chars)
+        return text, parse.call_count
+    
+    def test_extraction_stops_at_the_budget(self):
+        text, pages_parsed = self.extract_counting_pages(max_chars=30)
+        self.assertEqual(len(text), 30)
+        self.assertTrue(text.startswith('Page 1 about leaves'))
+        self.assertEqual(pages_parsed, 2)
+    
+    def test_without_a_budget_every_page_is_parsed(self):
+        text, pages_parsed = self.extract_counting_pages(max_chars=None)
+        self.assertIn('Page 20 about leaves', text)
+        self.assertEqual(pages_parsed, 20)
+    
+    def test_uncached_document_is_read_up_to_the_budget(self):
+        with self.count_parsed_pages() as parse:
+            self.assertEqual(len(get_document_text(self.path, 'pdf', max_chars=30)), 30)
+        self.assertEqual(parse.call_count, 2)
+
+class ParallelExtractionTests(TestCase):
+    """extract_text_parallel returns the same text as the serial extractor."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'leaves.pdf')
+        write_pdf(self.path, [f'Page {number} about leaves' for number in range(1, 7)])
+        self.serial_text = extract_text_from_pdf(self.path)
+    
+    def test_pages_in_order(self):
+        self.assertIn('Page 1 about leaves', self.serial_text)
+        self.assertLess(self.serial_text.index('Page 2'), self.serial_text.index('Page 6'))
+    
+    @override_settings(PARALLEL_EXTRACTION_MIN_PAGES=100)
+    def test_small_pdf_is_extracted_serially(self):
+        with mock.patch('quiz_api.openai_utils.ProcessPoolExecutor') as executor:
+            self.assertEqual(extract_text_parallel(self.path, 'pdf', workers=2), self.serial_text)
+        executor.assert_not_called()
+    
+    @override_settings(PARALLEL_EXTRACTION_MIN_PAGES=2)
+    def test_large_pdf_is_extracted_in_parallel(self):
+        self.assertEqual(extract_text_parallel(self.path, 'pdf', workers=2), self.serial_text)
+    
+    @override_settings(PARALLEL_EXTRACTION_MIN_PAGES=2)
+    def test_pool_failure_falls_back_to_serial_extraction(self):
+        with mock.patch('quiz_api.openai_utils.ProcessPoolExecutor', side_effect=OSError('no semaphores')):
+            self.assertEqual(extract_text_parallel(self.path, 'pdf', workers=2), self.serial_text)
+    
+    def test_unreadable_pdf(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a pdf')
+        self.assertIsNone(extract_text_parallel(self.path, 'pdf', workers=2))
+
+class WordExtractionTests(TestCase):
+    """Word documents are read paragraph by paragraph from word/document.xml."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'leaves.docx')
+    
+    def extract(self, body, max_chars=None):
+        write_docx(self.path, body)
+        return extract_text_from_doc(self.path, max_chars)
+    
+    def test_paragraphs_and_runs(self):
+        text = self.extract(
+            '<w:p><w:r><w:t>Leaves make </w:t></w:r><w:r><w:t>food.</w:t></w:r></w:p>'
+            '<w:p><w:r><w:t>Roots</w:t><w:tab/><w:t>drink.</w:t><w:br/><w:t>Stems carry.</w:t></w:r></w:p>'
+        )
+        self.assertEqual(text, 'Leaves make food. Roots\tdrink.\nStems carry.')
+    
+    def test_tables(self):
+        text = self.extract(
+            '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Leaf</w:t></w:r></w:p></w:tc>'
+            '<w:tc><w:p><w:r><w:t>Green</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+        )
+        self.assertEqual(text, 'Leaf Green')
+    
+    def test_text_box_is_read_once(self):
+        text_box = '<w:txbxContent><w:p><w:r><w:t>Boxed</w:t></w:r></w:p></w:txbxContent>'
+        text = self.extract(
+            '<w:p><w:r><w:t>Before</w:t></w:r><w:r><mc:AlternateContent>'
+            f'<mc:Choice Requires="wps"><w:drawing>{text_box}</w:drawing></mc:Choice>'
+            f'<mc:Fallback><w:pict>{text_box}</w:pict></mc:Fallback>'
+            '</mc:AlternateContent></w:r><w:r><w:t> after</w:t></w:r></w:p>'
+        )
+        self.assertEqual(text.count('Boxed'), 1)
+        self.assertIn('Before after', text)
+    
+    def test_text_outside_runs_is_ignored(self):
+        self.assertEqual(self.extract('<w:p><w:t>Stray</w:t><w:r><w:t>Kept</w:t></w:r></w:p>'), 'Kept')
+    
+    def test_max_chars(self):
+        paragraphs = ''.join(f'<w:p><w:r><w:t>Paragraph {number}</w:t></w:r></w:p>' for number in range(100))
+        self.assertEqual(self.extract(paragraphs, max_chars=20), 'Paragraph 0 Paragrap')
+    
+    def test_not_a_word_document(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a zip')
+        self.assertIsNone(extract_text_from_doc(self.path))
+
+class VaryingFakeProvider(FakeProvider):
+    """Fake provider whose responses change from one call to the next, like a real model's."""
+    
+    def __init__(self):
+        super().__init__(latency=0)
+        self.calls = 0
+    
+    def _result(self, messages, model, operation):
+        self.calls += 1
+        messages = messages + [{'role': 'user', 'content': f'Attempt {self.calls}'}]
+        return super()._result(messages, model, operation)
+
+def use_fake_llm(test_case, provider=None):
+    """Answer a test's LLM calls offline, starting from an empty response cache."""
+    patcher = mock.patch('quiz_api.llm_providers._llm_provider', provider or FakeProvider(latency=0))
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    get_llm_cache().clear()
+
+def create_material(title='Leaves'):
+    """Create a study material in a new subject, chapter and subchapter."""
+    subject = Subject.objects.create(name='Science')
+    chapter = Chapter.objects.create(subject=subject, name='Plants', order=1)
+    subchapter = Subchapter.objects.create(chapter=chapter, name=title, order=1)
+    return StudyMaterial.objects.create(
+        subchapter=subchapter, title=title, document=f'study_materials/{title.lower()}.pdf',
+        file_type='pdf', file_size='1 KB'
+    )
+
+@override_settings(QUIZ_JOB_MAX_ATTEMPTS=3, QUIZ_JOB_RETRY_DELAY=30, QUIZ_JOB_RETRY_MAX_DELAY=600)
+class JobQueueTests(TransactionTestCase):
+    """Claiming, running, retrying and recovering quiz generation jobs."""
+    
+    def setUp(self):
+        self.material = create_material()
+        self.quiz = Quiz.objects.create(material=self.material, level='Beginner', questions_json=[])
+    
+    def run_job(self, job, **patch):
+        patch.setdefault('return_value', (self.quiz, True))
+        with mock.patch('quiz_api.jobs.get_or_create_quiz', **patch) as generate:
+            run_job(job)
+        job.refresh_from_db()
+        return generate
+    
+    def test_enqueue_reuses_active_job(self):
+        job, created = enqueue_quiz_generation(self.material, 'Beginner')
+        self.assertTrue(created)
+        self.assertEqual(enqueue_quiz_generation(self.material, 'Beginner'), (job, False))
+        other, created = enqueue_quiz_generation(self.material, 'Advanced')
+        self.assertTrue(created)
+    
+    def test_regenerate_upgrades_queued_job(self):
+        job, created = enqueue_quiz_generation(self.material, 'Beginner')
+        job, created = enqueue_quiz_generation(self.material, 'Beginner', regenerate=True)
+        self.assertFalse(created)
+        self.assertTrue(job.regenerate)
+        self.assertFalse(job.rerun)
+        
+        claimed = claim_next_job()
+        self.assertTrue(claimed.regenerate)
+    
+    def test_regenerate_while_running_runs_again(self):
+        enqueue_quiz_generation(self.material, 'Beginner')
+        job = claim_next_job()
+        enqueue_quiz_generation(self.material, 'Beginner', regenerate=True)
+        
+        generate = self.run_job(job)
+        self.assertFalse(generate.call_args.kwargs['regenerate'])
+        self.assertEqual((job.status, job.attempts, job.regenerate, job.rerun), ('queued', 0, True, False))
+        
+        job = claim_next_job()
+        generate = self.run_job(job)
+        self.assertTrue(generate.call_args.kwargs['regenerate'])
+        self.assertEqual((job.status, job.quiz), ('succeeded', self.quiz))
+    
+    def test_regenerate_reuses_regenerating_job(self):
+        enqueue_quiz_generation(self.material, 'Beginner', regenerate=True)
+        job = claim_next_job()
+        enqueue_quiz_generation(self.material, 'Beginner', regenerate=True)
+        job.refresh_from_db()
+        self.assertFalse(job.rerun)
+    
+    @override_settings(QUIZ_JOB_MAX_CONCURRENT=1)
+    def test_claim_respects_concurrency_limit(self):
+        first, created = enqueue_quiz_generation(self.material, 'Beginner')
+        enqueue_quiz_generation(self.material, 'Advanced')
+        self.assertEqual(claim_next_job(), first)
+        self.assertIsNone(claim_next_job())
+    
+    def test_failed_job_is_retried_after_a_growing_delay(self):
+        enqueue_quiz_generation(self.material, 'Beginner')
+        for attempt, delay in [(1, 30), (2, 60)]:
+            job = claim_next_job()
+            self.assertEqual(job.attempts, attempt)
+            started = timezone.now()
+            self.run_job(job, side_effect=RuntimeError('bad response'))
+            self.assertEqual((job.status, job.error), ('queued', 'bad response'))
+            self.assertGreaterEqual(job.available_at, started + timedelta(seconds=delay))
+            self.assertIsNone(claim_next_job())
+            QuizGenerationJob.objects.filter(id=job.id).update(available_at=timezone.now())
+        
+        job = claim_next_job()
+        self.run_job(job, side_effect=RuntimeError('bad response'))
+        self.assertEqual(job.status, 'failed')
+        self.assertIsNotNone(job.finished_at)
+    
+    def test_circuit_open_does_not_use_an_attempt(self):
+        enqueue_quiz_generation(self.material, 'Beginner')
+        job = claim_next_job()
+        self.run_job(job, side_effect=CircuitOpenError('openai', 20))
+        self.assertEqual((job.status, job.attempts), ('queued', 0))
+        self.assertGreater(job.available_at, timezone.now() + timedelta(seconds=15))
+    
+    def test_recover_stuck_jobs(self):
+        enqueue_quiz_generation(self.material, 'Beginner')
+        enqueue_quiz_generation(self.material, 'Advanced')
+        stuck = claim_next_job()
+        exhausted = claim_next_job()
+        alive = QuizGenerationJob.objects.create(material=self.material, level='Intermediate', status='running',
+                                                 heartbeat_at=timezone.now())
+        long_ago = timezone.now() - timedelta(hours=1)
+        QuizGenerationJob.objects.filter(id__in=[stuck.id, exhausted.id]).update(heartbeat_at=long_ago)
+        QuizGenerationJob.objects.filter(id=exhausted.id).update(attempts=3)
+        
+        self.assertEqual(recover_stuck_jobs(), 2)
+        statuses = dict(QuizGenerationJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {stuck.id: 'queued', exhausted.id: 'failed', alive.id: 'running'})
+
+class IngestionJobTests(TransactionTestCase):
+    """Uploaded documents are ingested by the worker through the job queue."""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        use_fake_llm(self)
+        
+        self.material = create_material()
+        self.material.document = 'study_materials/leaves.docx'
+        self.material.file_type = 'docx'
+        self.material.save()
+        os.makedirs(os.path.join(directory.name, 'study_materials'))
+        self.path = self.material.document.path
+        paragraphs = ''.join(
+            f'<w:p><w:r><w:t>Leaves turn sunlight into food, fact {number}.</w:t></w:r></w:p>' for number in range(50)
+        )
+        write_docx(self.path, paragraphs)
+    
+    def test_upload_queues_one_ingestion_job(self):
+        job = schedule_ingestion(self.material)
+        self.assertEqual((job.kind, job.level, job.status), ('ingestion', '', 'queued'))
+        self.assertEqual(MaterialContent.objects.get(material=self.material).status, 'pending')
+        self.assertEqual(schedule_ingestion(self.material), job)
+    
+    def test_worker_ingests_the_document(self):
+        schedule_ingestion(self.material)
+        job = claim_next_job()
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        
+        content = MaterialContent.objects.get(material=self.material)
+        self.assertEqual((content.status, content.page_count), ('ready', 1))
+        self.assertIn('fact 49', content.extracted_text.text)
+        self.assertTrue(MaterialChunk.objects.filter(material=self.material).exists())
+    
+    def test_upload_during_ingestion_ingests_again(self):
+        schedule_ingestion(self.material)
+        job = claim_next_job()
+        self.assertEqual(schedule_ingestion(self.material), job)
+        
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rerun), ('queued', False))
+    
+    def test_unreadable_document_fails_the_job(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a zip')
+        schedule_ingestion(self.material)
+        job = claim_next_job()
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(MaterialContent.objects.get(material=self.material).status, 'failed')
+    
+    def test_documents_are_ingested_without_a_summary_while_the_circuit_is_open(self):
+        CircuitBreakerState.objects.create(name='openai', state='open', opened_at=timezone.now())
+        clear_cached_circuit_states()
+        self.addCleanup(clear_cached_circuit_states)
+        QuizGenerationJob.objects.create(material=create_material('Roots'), kind='quiz', level='Beginner')
+        schedule_ingestion(self.material)
+        
+        job = claim_next_job(kinds=['ingestion'])
+        self.assertEqual(job.kind, 'ingestion')
+        self.assertIsNone(claim_next_job(kinds=['ingestion']))
+        run_job(job)
+        self.assertEqual(MaterialContent.objects.get(material=self.material).status, 'ready')
+        self.assertFalse(MaterialSummary.objects.filter(material=self.material).exists())
+    
+    @override_settings(QUIZ_JOB_MAX_ATTEMPTS=1)
+    def test_abandoned_ingestion_fails_the_content(self):
+        schedule_ingestion(self.material)
+        job = claim_next_job()
+        QuizGenerationJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        
+        self.assertEqual(recover_stuck_jobs(), 1)
+        self.assertEqual(MaterialContent.objects.get(material=self.material).status, 'failed')
+
+class ChunkSelectionTests(TestCase):
+    """Prompts use a representative, non-redundant selection of a material's chunks."""
+    
+    def make_chunks(self, texts):
+        chunks = []
+        for position, (text, vector) in enumerate(zip(texts, compute_chunk_vectors(texts))):
+            chunk = MaterialChunk(position=position, text=text)
+            chunk.set_vector(vector)
+            chunks.append(chunk)
+        return chunks
+    
+    def test_split_into_chunks_breaks_at_whitespace(self):
+        text = ' '.join(f'word{number}' for number in range(400))
+        chunks = split_into_chunks(text, chunk_size=100)
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(' '.join(chunks), text)
+    
+    def test_selection_fits_the_budget_in_document_order(self):
+        texts = [f'Chapter {number} explains photosynthesis, chlorophyll and leaves. ' * 3 for number in range(10)]
+        chunks = self.make_chunks(texts)
+        selected = select_chunks(chunks, max_chars=700)
+        self.assertTrue(selected)
+        self.assertLessEqual(sum(len(chunk.text) + len(CHUNK_SEPARATOR) for chunk in selected), 700)
+        self.assertEqual([chunk.position for chunk in selected], sorted(chunk.position for chunk in selected))
+    
+    def test_selection_prefers_new_topics_over_repeats(self):
+        leaves = 'Leaves use chlorophyll and sunlight for photosynthesis in plants.'
+        roots = 'Roots absorb water and minerals from soil for plants.'
+        stems = 'Stems transport water between roots and leaves in plants.'
+        chunks = self.make_chunks([leaves, leaves, leaves, roots, stems])
+        budget = len(leaves) + len(roots) + len(stems) + 3 * len(CHUNK_SEPARATOR)
+        selected = [chunk.text for chunk in select_chunks(chunks, budget)]
+        self.assertEqual(sorted(selected), sorted([leaves, roots, stems]))
+    
+    def test_nothing_fits(self):
+        self.assertEqual(select_chunks(self.make_chunks(['A long chunk about leaves.']), max_chars=5), [])
+    
+    def test_chunks_of_a_replaced_document_are_not_used(self):
+        material = create_material()
+        MaterialContent.objects.create(material=material, status='ready')
+        build_chunk_index(material, 'Old document about roots. ' * 100)
+        self.assertIn('roots', get_material_text(material, max_chars=500))
+        
+        with mock.patch('quiz_api.jobs.enqueue_ingestion', return_value=(None, True)):
+            schedule_ingestion(material)
+        self.assertFalse(MaterialChunk.objects.filter(material=material).exists())
+        with mock.patch('quiz_api.ingestion.get_document_text', return_value='New document about leaves') as extract:
+            self.assertEqual(get_material_text(material, max_chars=500), 'New document about leaves')
+        extract.assert_called_once()
+    
+    def test_chunks_are_ignored_until_ingestion_is_ready(self):
+        material = create_material()
+        MaterialContent.objects.create(material=material, status='failed')
+        build_chunk_index(material, 'Old document about roots. ' * 100)
+        with mock.patch('quiz_api.ingestion.get_document_text', return_value='Current document'):
+            self.assertEqual(get_material_text(material, max_chars=500), 'Current document')
+
+STUDY_TEXT = ' '.join(
+    f'Leaves contain chlorophyll pigments capturing sunlight energy. Plants convert carbon dioxide '
+    f'and water into glucose releasing oxygen. Stomata regulate transpiration and gas exchange {number}.'
+    for number in range(5)
+)
+
+@mock.patch('quiz_api.generation.get_quiz_text', lambda material: STUDY_TEXT)
+class RegenerateTests(TestCase):
+    """Regenerating a quiz asks the model again instead of replaying its cached response."""
+    
+    def setUp(self):
+        self.provider = VaryingFakeProvider()
+        use_fake_llm(self, self.provider)
+        self.material = create_material()
+    
+    def questions(self, quiz):
+        return [question['question'] for question in quiz.get_questions()]
+    
+    def test_regenerate_returns_new_questions(self):
+        quiz, created = get_or_create_quiz(self.material, 'Beginner')
+        first = self.questions(quiz)
+        
+        regenerated, created = get_or_create_quiz(self.material, 'Beginner', regenerate=True)
+        self.assertEqual(regenerated.id, quiz.id)
+        self.assertNotEqual(self.questions(regenerated), first)
+        self.assertEqual(self.provider.calls, 2)
+    
+    def test_generation_without_regenerate_uses_the_cache(self):
+        quiz, created = get_or_create_quiz(self.material, 'Beginner')
+        quiz.delete()
+        again, created = get_or_create_quiz(self.material, 'Beginner')
+        self.assertEqual(self.questions(again), self.questions(quiz))
+        self.assertEqual(self.provider.calls, 1)
+    
+    def test_regenerate_does_not_join_a_plain_generation(self):
+        regenerated = []
+        
+        def generate_while_regenerating(*args, **kwargs):
+            # A teacher regenerates the quiz while the first generation is in progress
+            if not regenerated:
+                regenerated.append(None)
+                regenerated[0], created = get_or_create_quiz(self.material, 'Beginner', regenerate=True)
+            return generate_quiz(*args, **kwargs)
+        
+        with mock.patch.object(Call, 'wait', side_effect=AssertionError('regenerate joined a plain generation')), \
+                mock.patch('quiz_api.generation.generate_quiz', side_effect=generate_while_regenerating):
+            quiz, created = get_or_create_quiz(self.material, 'Beginner')
+        # The regenerate asked the model itself, and the plain generation kept the quiz it saved
+        self.assertEqual(self.provider.calls, 1)
+        self.assertEqual(quiz.id, regenerated[0].id)
+        self.assertEqual(self.questions(quiz), self.questions(regenerated[0]))
+    
+    def test_regenerate_all_levels(self):
+        first = [self.questions(quiz) for quiz in create_quizzes_for_levels(self.material)]
+        regenerated = [self.questions(quiz) for quiz in create_quizzes_for_levels(self.material, regenerate=True)]
+        for before, after in zip(first, regenerated):
+            self.assertNotEqual(before, after)
+    
+    def test_regenerate_streamed_quiz(self):
+        events = list(stream_quiz(self.material, 'Beginner'))
+        first = self.questions(events[-1][1])
+        events = list(stream_quiz(self.material, 'Beginner', regenerate=True))
+        self.assertNotEqual(self.questions(events[-1][1]), first)
+    
+    def test_refill_question_bank(self):
+        first = self.questions(fill_question_bank(self.material, 'Beginner', size=4))
+        refilled = self.questions(fill_question_bank(self.material, 'Beginner', size=4, refill=True))
+        self.assertEqual(len(refilled), 4)
+        self.assertNotEqual(refilled, first)
+        self.assertEqual(self.provider.calls, 2)
+    
+    def test_top_up_question_bank(self):
+        first = self.questions(fill_question_bank(self.material, 'Beginner', size=4))
+        topped_up = self.questions(fill_question_bank(self.material, 'Beginner', size=8))
+        self.assertEqual(topped_up[:4], first)
+        self.assertEqual(len(set(topped_up)), 8)
+        self.assertEqual(self.provider.calls, 2)
+
+class QuizLevelValidationTests(TestCase):
+    """Quiz endpoints reject unknown levels with a 400 instead of failing."""
+    
+    def setUp(self):
+        self.material = create_material()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('teacher', password='secret', is_staff=True))
+    
+    def test_variant_rejects_an_unknown_level(self):
+        response = self.client.get('/api/quizzes/variant/', {'material_id': self.material.id, 'level': 'Expert'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid level: Expert'})
+    
+    def test_all_levels_rejects_levels_that_are_not_a_list(self):
+        for levels in ({'Beginner': True}, 3):
+            response = self.client.post(
+                f'/api/generate-quiz/{self.material.id}/all-levels/', {'levels': levels}, format='json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'levels must be a list of levels'})
+    
+    def test_all_levels_rejects_unknown_levels(self):
+        response = self.client.post(
+            f'/api/generate-quiz/{self.material.id}/all-levels/', {'levels': ['Beginner', 'Expert']}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid levels: Expert'})
+
+class QuizVariantTests(TestCase):
+    """Variants are reproducible from their seed, and answers to a variant are read against its questions."""
+    
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.material = create_material()
+        self.bank = QuestionBank.objects.create(
+            material=self.material, level='Beginner', questions_json=[question(number) for number in range(1, 11)]
+        )
+        self.quiz = Quiz.objects.create(
+            material=self.material, level='Beginner', questions_json=build_variant(self.bank.get_questions(), 0, 5)
+        )
+    
+    def test_build_variant_is_deterministic(self):
+        questions = self.bank.get_questions()
+        variant = build_variant(questions, 42, 5)
+        self.assertEqual(build_variant(questions, 42, 5), variant)
+        self.assertNotEqual(build_variant(questions, 43, 5), variant)
+        
+        originals = {original['question']: original for original in questions}
+        self.assertEqual(len({picked['question'] for picked in variant}), 5)
+        for picked in variant:
+            original = originals[picked['question']]
+            self.assertEqual(sorted(picked['options']), sorted(original['options']))
+            self.assertEqual(picked['correct_answer'], original['correct_answer'])
+        self.assertEqual(questions, [question(number) for number in range(1, 11)])
+    
+    def submit_variant(self, wrong=()):
+        variant = self.client.get(f'/api/quizzes/variant/?material_id={self.material.id}&level=Beginner').json()
+        answers = [
+            next(option for option in q['options'] if option != q['correct_answer']) if index in wrong else q['correct_answer']
+            for index, q in enumerate(variant['questions'])
+        ]
+        response = self.client.post('/api/scores/', {
+            'quiz': self.quiz.id, 'score': 80, 'time_taken': '1:30', 'answers': answers,
+            'variant_seed': variant['variant_seed']
+        }, format='json')
+        return variant, response
+    
+    def test_variant_questions_are_saved_with_the_score(self):
+        variant, response = self.submit_variant()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(variant['questions'], self.quiz.get_questions())
+        self.assertEqual(QuizScore.objects.get().get_questions(), variant['questions'])
+    
+    def test_recommendation_history_reads_answers_against_the_variant(self):
+        self.submit_variant(wrong={1})
+        history = build_quiz_history(QuizScore.objects.filter(user=self.student))
+        self.assertEqual((history[0]['missed'], history[0]['total']), (1, 5))
+    
+    def test_variant_seed_needs_a_question_bank(self):
+        self.bank.delete()
+        response = self.client.post('/api/scores/', {
+            'quiz': self.quiz.id, 'score': 80, 'time_taken': '1:30', 'answers': [], 'variant_seed': 7
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('variant_seed', response.json())
+
+class RawJSONRendererTests(TestCase):
+    """Stored JSON columns are spliced into responses as valid JSON, and other responses render as before."""
+    
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+        self.questions = [
+            question(1, question='Which part of the leaf holds "chlorophyll"?'),
+            question(2, explanation='Stomata \u2014 tiny pores \u2028 on the leaf', options=['A', 'B', 'C', 'D'])
+        ]
+        self.quiz = Quiz.objects.create(material=create_material(), level='Beginner', questions_json=self.questions)
+        self.other = Quiz.objects.create(material=create_material('Roots'), level='Advanced', questions_json=[])
+    
+    def test_quiz_list_and_detail_nest_the_stored_questions(self):
+        response = self.client.get('/api/quizzes/')
+        self.assertEqual(response.status_code, 200)
+        quizzes = {quiz['id']: quiz for quiz in json.loads(response.content)}
+        self.assertEqual(quizzes[self.quiz.id]['questions'], self.questions)
+        self.assertEqual(quizzes[self.other.id]['questions'], [])
+        self.assertEqual(quizzes[self.quiz.id]['level'], 'Beginner')
+        
+        response = self.client.get(f'/api/quizzes/{self.quiz.id}/')
+        detail = json.loads(response.content)
+        self.assertEqual(detail['questions'], self.questions)
+        self.assertEqual(detail['material']['title'], 'Leaves')
+        self.assertNotIn('\u0000', response.content.decode())
+    
+    def test_score_list_and_detail_nest_the_stored_answers(self):
+        answered = QuizScore.objects.create(
+            user=self.student, quiz=self.quiz, score=50, time_seconds=90, answers_json=['Option A for 1', None]
+        )
+        unanswered = QuizScore.objects.create(user=self.student, quiz=self.other, score=0, time_seconds=10)
+        
+        scores = {score['id']: score for score in json.loads(self.client.get('/api/scores/').content)}
+        self.assertEqual(scores[answered.id]['answers'], ['Option A for 1', None])
+        self.assertIsNone(scores[unanswered.id]['answers'])
+        self.assertEqual(scores[answered.id]['user']['username'], 'student')
+        
+        detail = json.loads(self.client.get(f'/api/scores/{answered.id}/').content)
+        self.assertEqual(detail['answers'], ['Option A for 1', None])
+    
+    def test_responses_without_stored_json_render_as_with_json_renderer(self):
+        Subject.objects.create(name='Biolog\u00eda \u2028 and more')
+        response = self.client.get('/api/subjects/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.assertIn(b'\\u2028', response.content)
+
+class TimeTakenFieldTests(TestCase):
+    """Scores take and give the time taken as m:ss and store it in seconds."""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('student', password='secret'))
+        self.quiz = Quiz.objects.create(material=create_material(), level='Beginner', questions_json=[question(1)])
+    
+    def submit(self, time_taken):
+        return self.client.post('/api/scores/', {
+            'quiz': self.quiz.id, 'score': 100, 'time_taken': time_taken, 'answers': ['Option A for 1']
+        }, format='json')
+    
+    def test_time_taken_round_trips_through_seconds(self):
+        for time_taken, seconds in [('5:30', 330), ('10:00', 600)]:
+            with self.subTest(time_taken=time_taken):
+                response = self.submit(time_taken)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(response.json()['time_taken'], time_taken)
+                score = QuizScore.objects.latest('id')
+                self.assertEqual(score.time_seconds, seconds)
+                self.assertEqual(self.client.get(f'/api/scores/{score.id}/').json()['time_taken'], time_taken)
+    
+    def test_malformed_time_taken_is_rejected(self):
+        for time_taken in ['5:75', 'five minutes', '1:2:3:4', True]:
+            with self.subTest(time_taken=time_taken):
+                response = self.submit(time_taken)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('time_taken', response.json())
+        self.assertFalse(QuizScore.objects.exists())
+
+class TokenBucketTests(TestCase):
+    """The rate limiter's buckets refill continuously up to their capacity."""
+    
+    def test_refill_and_wait(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        bucket.updated_at = 0
+        bucket.take(60)
+        self.assertEqual(bucket.wait_time(10), 10)
+        bucket.refill(4)
+        self.assertEqual(bucket.available, 4)
+        self.assertEqual(bucket.wait_time(10), 6)
+        bucket.refill(1000)
+        self.assertEqual(bucket.available, 60)
+    
+    def test_amounts_above_capacity_wait_for_a_full_bucket(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        self.assertEqual(bucket.wait_time(500), 0)
+        bucket.take(500)
+        self.assertEqual(bucket.available, 0)
+    
+    def test_giving_back_is_capped_at_capacity(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        bucket.take(10)
+        bucket.take(-30)
+        self.assertEqual(bucket.available, 60)
+    
+    def acquire_all(self, limiter, calls):
+        """Run limiter calls on a fake clock; returns the sleeps they made."""
+        clock = [0.0]
+        sleeps = []
+        
+        def sleep(seconds):
+            sleeps.append(round(seconds, 6))
+            clock[0] += seconds
+        with mock.patch('quiz_api.rate_limit.time.monotonic', lambda: clock[0]), \
+                mock.patch('quiz_api.rate_limit.time.sleep', sleep):
+            limiter.requests.updated_at = limiter.tokens.updated_at = 0.0
+            for call in calls:
+                call(limiter)
+        return sleeps
+    
+    def test_limiter_waits_for_tokens(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)
+        sleeps = self.acquire_all(limiter, [lambda l: l.acquire(60), lambda l: l.acquire(30)])
+        self.assertEqual(sleeps, [30])
+    
+    def test_limiter_waits_for_requests(self):
+        limiter = RateLimiter(requests_per_minute=2, tokens_per_minute=10000)
+        sleeps = self.acquire_all(limiter, [lambda l: l.acquire(1)] * 3)
+        self.assertEqual(sleeps, [30])
+    
+    def test_settle_charges_the_real_usage(self):
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)
+        sleeps = self.acquire_all(limiter, [
+            lambda l: l.acquire(10), lambda l: l.settle(10, 40), lambda l: l.acquire(30)
+        ])
+        self.assertEqual(sleeps, [10])
+
+class ProviderCallRateLimitTests(TestCase):
+    """Each provider call waits for the installed rate limiter with its real prompt size."""
+    
+    def setUp(self):
+        use_fake_llm(self)
+        self.limiter = mock.Mock(spec=RateLimiter)
+        set_rate_limiter(self.limiter)
+        self.addCleanup(set_rate_limiter, None)
+        self.messages = [{'role': 'user', 'content': 'Write 5 multiple-choice questions about leaves and roots.'}]
+    
+    def test_each_provider_call_acquires_once(self):
+        cached_chat_completion(self.messages, parse_quiz_response, 'quiz')
+        cached_chat_completion(self.messages, parse_quiz_response, 'quiz')
+        estimated = estimate_prompt_tokens(self.messages)
+        self.limiter.acquire.assert_called_once_with(estimated)
+        (settled_estimate, used), kwargs = self.limiter.settle.call_args
+        self.assertEqual(settled_estimate, estimated)
+        self.assertGreater(used, estimated)
+        
+        cached_chat_completion(self.messages, parse_quiz_response, 'quiz', refresh=True)
+        self.assertEqual(self.limiter.acquire.call_count, 2)
+    
+    def test_streamed_calls_settle_when_the_stream_ends(self):
+        usage = []
+        content = ''.join(stream_chat_completion(self.messages, 'quiz', on_usage=usage.append))
+        self.assertTrue(parse_quiz_response(content))
+        self.limiter.acquire.assert_called_once_with(estimate_prompt_tokens(self.messages))
+        self.limiter.settle.assert_called_once()
+        self.assertEqual(len(usage), 1)
+
+def question(number, **fields):
+    """Return a well-formed generated question."""
+    options = [f'Option {letter} for {number}' for letter in 'ABCD']
+    return {
+        'question': f'What is fact number {number} about leaves?',
+        'options': options,
+        'correct_answer': options[0],
+        'explanation': f'The lesson states fact {number}.',
+        **fields
+    }
+
+class QuestionValidationTests(TestCase):
+    """Generated questions need four distinct options, one of them correct, and new text."""
+    
+    def test_well_formed_question_is_valid(self):
+        self.assertEqual(validate_question(question(1)), [])
+    
+    def test_problems_are_reported(self):
+        options = ['A', 'B', 'C', 'D']
+        cases = [
+            ('not a question', ['question is not an object']),
+            (question(1, question='  '), ['missing question text']),
+            (question(1, options='A, B, C, D'), ['options must be a list of strings']),
+            (question(1, options=['A', 'B', 'C'], correct_answer='A'), ['expected 4 options, got 3']),
+            (question(1, options=['A', 'A', 'C', 'D'], correct_answer='A'), ['options are not distinct']),
+            (question(1, correct_answer=None), ['missing correct answer']),
+            (question(1, options=options, correct_answer='E'), ['correct answer is not one of the options']),
+        ]
+        for generated, problems in cases:
+            self.assertEqual(validate_question(generated), problems)
+    
+    def test_duplicates_are_rejected(self):
+        repeated = question(1, question='WHAT is fact number 1 about leaves')
+        valid, rejected = split_valid_questions(
+            [question(1), repeated, question(2), question(3, options=[])], existing=[question(2)]
+        )
+        self.assertEqual(valid, [question(1)])
+        self.assertEqual([problems for generated, problems in rejected], [
+            ['duplicate question'],
+            ['duplicate question'],
+            ['expected 4 options, got 0', 'correct answer is not one of the options'],
+        ])
+
+@override_settings(QUIZ_REPAIR_ATTEMPTS=2)
+class RepairQuestionsTests(TestCase):
+    """Only rejected questions are asked for again, with a small prompt."""
+    
+    def repair(self, questions, replacements, num_questions=3, existing=()):
+        """Repair questions with the given replacement responses; returns (repaired, [(missing, avoid) per call])."""
+        responses = iter(replacements) if isinstance(replacements, list) else None
+        calls = []
+        
+        def generate(text_content, level, missing, avoid, refresh=False):
+            # repair_questions keeps adding to avoid, so record it as it was sent
+            calls.append((missing, list(avoid)))
+            if responses is None:
+                raise replacements
+            return next(responses)
+        
+        with mock.patch('quiz_api.generation.generate_replacement_questions', side_effect=generate):
+            repaired = repair_questions(STUDY_TEXT, 'Beginner', questions, num_questions, existing)
+        return repaired, calls
+    
+    def test_valid_questions_need_no_repair(self):
+        repaired, calls = self.repair([question(1), question(2), question(3), question(4)], [])
+        self.assertEqual(repaired, [question(1), question(2), question(3)])
+        self.assertEqual(calls, [])
+    
+    def test_rejected_questions_are_replaced(self):
+        broken = question(2, correct_answer='Option E')
+        repaired, calls = self.repair([question(1), broken, question(1)], [[question(3), question(4)]])
+        self.assertEqual(repaired, [question(1), question(3), question(4)])
+        self.assertEqual(calls, [(2, [question(1)['question'], question(2)['question']])])
+    
+    def test_repairs_stop_after_the_allowed_attempts(self):
+        repaired, calls = self.repair([question(1)], [[question(1)], [question(2)], [question(3)]])
+        self.assertEqual(repaired, [question(1), question(2)])
+        self.assertEqual([missing for missing, avoid in calls], [2, 2])
+    
+    def test_existing_questions_count_as_duplicates(self):
+        repaired, calls = self.repair(
+            [question(1), question(2)], [[question(3), question(4)]], num_questions=2, existing=[question(1)]
+        )
+        self.assertEqual(repaired, [question(2), question(3)])
+        self.assertEqual(calls, [(1, [question(1)['question'], question(2)['question']])])
+    
+    def test_open_circuit_keeps_the_valid_questions(self):
+        repaired, calls = self.repair([question(1), {}], CircuitOpenError('openai', 20))
+        self.assertEqual(repaired, [question(1)])
+        self.assertEqual(len(calls), 1)
+    
+    def test_nothing_generated_is_not_repaired(self):
+        repaired, calls = self.repair([], [])
+        self.assertEqual(repaired, [])
+        self.assertEqual(calls, [])
+
+class AsyncGenerationTests(TestCase):
+    """The async generation path shares the response cache, metrics and question repair of the sync one."""
+    
+    def setUp(self):
+        use_fake_llm(self)
+        clear_cached_circuit_states()
+    
+    def test_quiz_shares_the_response_cache(self):
+        questions = async_to_sync(agenerate_quiz)(STUDY_TEXT, 'Beginner', 3)
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(generate_quiz(STUDY_TEXT, 'Beginner', 3), questions)
+        self.assertEqual(list(LLMCallMetric.objects.order_by('id').values_list('operation', 'cached', 'outcome')), [
+            ('quiz', False, 'ok'), ('quiz', True, 'ok')
+        ])
+        
+        refreshed = async_to_sync(agenerate_quiz)(STUDY_TEXT, 'Beginner', 3, refresh=True)
+        self.assertEqual(LLMCallMetric.objects.filter(cached=False).count(), 2)
+        self.assertEqual(refreshed, questions)
+    
+    def test_recommendations(self):
+        recommendations = async_to_sync(agenerate_study_recommendations)({'avg_score': 60}, [])
+        self.assertEqual(len(recommendations), 3)
+        self.assertTrue(all(isinstance(recommendation, str) for recommendation in recommendations))
+    
+    def test_rejected_questions_are_replaced(self):
+        broken = question(2, correct_answer='Option E')
+        calls = []
+        
+        async def generate(text_content, level, missing, avoid, refresh=False):
+            calls.append((missing, list(avoid)))
+            return [question(3), question(4)]
+        
+        with mock.patch('quiz_api.generation.agenerate_replacement_questions', side_effect=generate):
+            repaired = async_to_sync(arepair_questions)(STUDY_TEXT, 'Beginner', [question(1), broken, question(1)], 3)
+        self.assertEqual(repaired, [question(1), question(3), question(4)])
+        self.assertEqual(calls, [(2, [question(1)['question'], question(2)['question']])])
+    
+    def test_open_circuit_keeps_the_valid_questions(self):
+        with mock.patch(
+            'quiz_api.generation.agenerate_replacement_questions', side_effect=CircuitOpenError('openai', 20)
+        ):
+            repaired = async_to_sync(arepair_questions)(STUDY_TEXT, 'Beginner', [question(1), {}], 3)
+        self.assertEqual(repaired, [question(1)])
+    
+    @override_settings(OPENAI_MAX_RETRIES=1, OPENAI_RETRY_BASE_DELAY=0, OPENAI_HEDGE_AFTER=0)
+    def test_openai_call_is_retried_on_the_shared_async_client(self):
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{"questions": []}'))], model='gpt-4o', usage=None
+        )
+        provider = OpenAIProvider()
+        
+        async def complete():
+            client = provider.get_async_client()
+            self.assertIs(provider.get_async_client(), client)
+            with mock.patch.object(
+                client.chat.completions, 'create', new_callable=mock.AsyncMock, side_effect=[api_timeout_error(), response]
+            ) as create:
+                result = await provider.acomplete([{'role': 'user', 'content': 'Quiz'}], 'gpt-4o', 0.7)
+            return result, create.call_count
+        
+        result, calls = async_to_sync(complete)()
+        self.assertEqual((result.content, calls), ('{"questions": []}', 2))
+        self.assertEqual(CircuitBreakerState.objects.get().failures, 0)
+
+class StreamParsingTests(TestCase):
+    """Questions are parsed out of a streamed response as soon as each one is complete."""
+    
+    def feed_in_pieces(self, text, size):
+        parser = JSONArrayObjectParser()
+        completed = []
+        for start in range(0, len(text), size):
+            completed.append(parser.feed(text[start:start + size]))
+        return completed
+    
+    def test_objects_are_returned_as_they_complete(self):
+        questions = [question(1), question(2)]
+        text = json.dumps({'questions': questions})
+        completed = self.feed_in_pieces(text, 1)
+        self.assertEqual([objects for objects in completed if objects], [[questions[0]], [questions[1]]])
+        first_done = next(index for index, objects in enumerate(completed) if objects)
+        self.assertLess(first_done, text.index('What is fact number 2'))
+    
+    def test_any_piece_size(self):
+        questions = [question(number) for number in range(1, 6)]
+        text = json.dumps({'questions': questions}, indent=2)
+        for size in (1, 3, 7, 50, len(text)):
+            completed = [obj for objects in self.feed_in_pieces(text, size) for obj in objects]
+            self.assertEqual(completed, questions)
+    
+    def test_braces_and_escapes_inside_strings(self):
+        tricky = question(1, question='Which {brace} or [bracket] is "quoted" \\ here?')
+        text = json.dumps({'questions': [tricky, question(2)]})
+        completed = [obj for objects in self.feed_in_pieces(text, 2) for obj in objects]
+        self.assertEqual(completed, [tricky, question(2)])
+    
+    def test_nested_objects_stay_inside_their_question(self):
+        nested = question(1, source={'page': 3, 'tags': [{'name': 'leaf'}]})
+        completed = JSONArrayObjectParser().feed(json.dumps({'questions': [nested]}))
+        self.assertEqual(completed, [nested])
+    
+    def test_arrays_under_any_key(self):
+        text = json.dumps({'Beginner': [question(1)], 'Advanced': [question(2)]})
+        self.assertEqual(JSONArrayObjectParser().feed(text), [question(1), question(2)])
+    
+    def test_truncated_stream_returns_only_complete_objects(self):
+        text = json.dumps({'questions': [question(1), question(2)]})
+        cut = text.index('What is fact number 2')
+        self.assertEqual(JSONArrayObjectParser().feed(text[:cut]), [question(1)])
+    
+    def test_stream_quiz_questions(self):
+        use_fake_llm(self)
+        streamed = list(stream_quiz_questions(STUDY_TEXT, 'Beginner', 4))
+        self.assertEqual(len(streamed), 4)
+        
+        with mock.patch.object(FakeProvider, 'stream') as stream:
+            self.assertEqual(list(stream_quiz_questions(STUDY_TEXT, 'Beginner', 4)), streamed)
+        stream.assert_not_called()
+
+class StreamProviderTests(TestCase):
+    """Streaming provider calls release their connection and can be recorded and replayed."""
+    
+    def setUp(self):
+        clear_cached_circuit_states()
+    
+    def test_openai_stream_is_closed_when_the_reader_stops(self):
+        delta = SimpleNamespace(content='{"questions": [')
+        chunk = SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None, model='gpt-4o')
+        response = mock.MagicMock()
+        response.__iter__.return_value = iter([chunk] * 5)
+        provider = OpenAIProvider()
+        client = mock.Mock()
+        client.chat.completions.create.return_value = response
+        
+        with mock.patch.object(provider, 'get_client', return_value=client):
+            pieces = provider.stream([{'role': 'user', 'content': 'Quiz'}], 'gpt-4o', 0.7)
+            next(pieces)
+            response.close.assert_not_called()
+            pieces.close()
+        response.close.assert_called_once()
+    
+    def test_record_and_replay_streams(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        messages = [{'role': 'user', 'content': 'Write 3 multiple-choice questions about roots.'}]
+        
+        recorder = RecordReplayProvider('record', directory.name, inner=FakeProvider(latency=0))
+        recorded_usage = []
+        recorded = ''.join(recorder.stream(messages, 'gpt-4o', 0.7, 'quiz', recorded_usage.append))
+        self.assertEqual(len(os.listdir(directory.name)), 1)
+        
+        replayer = RecordReplayProvider('replay', directory.name)
+        replayed_usage = []
+        self.assertEqual(''.join(replayer.stream(messages, 'gpt-4o', 0.7, 'quiz', replayed_usage.append)), recorded)
+        self.assertEqual(replayed_usage, recorded_usage)
+        self.assertEqual(replayer.complete(messages, 'gpt-4o', 0.7, 'quiz').content, recorded)
+        
+        with self.assertRaises(LLMReplayMissError):
+            list(replayer.stream(messages + [{'role': 'user', 'content': 'More'}], 'gpt-4o', 0.7, 'quiz'))
+    
+    def test_abandoned_recording_is_not_saved(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        recorder = RecordReplayProvider('record', directory.name, inner=FakeProvider(latency=0))
+        pieces = recorder.stream([{'role': 'user', 'content': 'Quiz about stems'}], 'gpt-4o', 0.7, 'quiz')
+        next(pieces)
+        pieces.close()
+        self.assertEqual(os.listdir(directory.name), [])
+
+class LLMMetricsTests(TestCase):
+    """The Prometheus counters survive pruning and closed streams are told apart."""
+    
+    def record(self, latency_ms, outcome='ok', cached=False):
+        record_llm_call(
+            operation='quiz', model='gpt-4o', outcome=outcome, cached=cached,
+            latency_ms=latency_ms, prompt_tokens=100, completion_tokens=50
+        )
+    
+    def test_counters_do_not_drop_when_metrics_are_pruned(self):
+        self.record(200)
+        self.record(3000)
+        self.record(90000, outcome='api_error')
+        self.record(5, cached=True)
+        before = render_prometheus_metrics()
+        
+        LLMCallMetric.objects.update(created_at=timezone.now() - timedelta(days=365))
+        self.assertEqual(prune_llm_metrics(), 4)
+        self.record(400)
+        
+        after = render_prometheus_metrics()
+        self.assertIn('quizwhiz_llm_calls_total{operation="quiz",model="gpt-4o",outcome="ok",cached="false"} 2', before)
+        self.assertIn('quizwhiz_llm_calls_total{operation="quiz",model="gpt-4o",outcome="ok",cached="false"} 3', after)
+        self.assertIn('quizwhiz_llm_calls_total{operation="quiz",model="gpt-4o",outcome="ok",cached="true"} 1', after)
+        self.assertIn('quizwhiz_llm_call_duration_seconds_bucket{operation="quiz",le="0.25"} 1', after)
+        self.assertIn('quizwhiz_llm_call_duration_seconds_bucket{operation="quiz",le="0.5"} 2', after)
+        self.assertIn('quizwhiz_llm_call_duration_seconds_bucket{operation="quiz",le="5"} 3', after)
+        self.assertIn('quizwhiz_llm_call_duration_seconds_bucket{operation="quiz",le="60"} 3', after)
+        self.assertIn('quizwhiz_llm_call_duration_seconds_bucket{operation="quiz",le="+Inf"} 4', after)
+        self.assertIn('quizwhiz_llm_call_duration_seconds_sum{operation="quiz"} 93.6', after)
+        self.assertIn('quizwhiz_llm_tokens_total{operation="quiz",model="gpt-4o",type="prompt"} 400', after)
+        self.assertEqual(LLMCallCounter.objects.filter(operation='quiz', outcome='ok', cached=False).count(), 3)
+    
+    def test_closed_stream_is_recorded_as_aborted(self):
+        use_fake_llm(self)
+        questions = stream_quiz_questions(STUDY_TEXT, 'Beginner', 3)
+        next(questions)
+        questions.close()
+        
+        metric = LLMCallMetric.objects.get(operation='quiz_stream')
+        self.assertEqual(metric.outcome, 'aborted')
+        self.assertEqual(LLMCallCounter.objects.get(operation='quiz_stream').outcome, 'aborted')
+
+class SingleFlightTests(TestCase):
+    """Concurrent calls for one key share a single computation."""
+    
+    def run_concurrently(self, flight, fn, callers):
+        """Start `callers` threads calling flight.do('key', fn); returns their results or errors."""
+        outcomes = [None] * callers
+        
+        def call(index):
+            try:
+                outcomes[index] = flight.do('key', fn)
+            except Exception as e:
+                outcomes[index] = e
+        
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+        for thread in threads:
+            thread.start()
+        return threads, outcomes
+    
+    def test_concurrent_callers_share_the_result(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'quiz'
+        
+        joined = threading.Semaphore(0)
+        wait = Call.wait
+        
+        def counting_wait(call, timeout=None):
+            joined.release()
+            return wait(call, timeout)
+        
+        with mock.patch.object(Call, 'wait', counting_wait):
+            threads, outcomes = self.run_concurrently(flight, compute, 1)
+            self.assertTrue(started.wait(5))
+            more_threads, more_outcomes = self.run_concurrently(flight, compute, 3)
+            # Only let the leader finish once the other callers are waiting on it
+            for thread in more_threads:
+                self.assertTrue(joined.acquire(timeout=5))
+            release.set()
+            for thread in threads + more_threads:
+                thread.join(5)
+        
+        self.assertEqual(calls, [1])
+        self.assertEqual(outcomes + more_outcomes, ['quiz'] * 4)
+        self.assertEqual(flight._calls, {})
+    
+    def test_error_is_shared_and_the_key_is_released(self):
+        flight = SingleFlight()
+        call, leader = flight.begin('key')
+        self.assertTrue(leader)
+        waiter, leader = flight.begin('key')
+        self.assertFalse(leader)
+        self.assertIs(waiter, call)
+        
+        flight.fail('key', ValueError('bad response'))
+        with self.assertRaisesMessage(ValueError, 'bad response'):
+            waiter.wait()
+        self.assertEqual(flight.do('key', lambda: 'retried'), 'retried')
+    
+    def test_different_keys_run_separately(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('Beginner', lambda: flight.do('Advanced', lambda: 'inner')), 'inner')
+    
+    def test_wait_times_out(self):
+        flight = SingleFlight()
+        flight.begin('key')
+        call, leader = flight.begin('key')
+        with self.assertRaises(TimeoutError):
+            call.wait(timeout=0.01)
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Migrates the database back to `migrate_from`, so a test can create rows
+    with the models of that state, then runs the migrations up to
+    `migrate_to`. The database is migrated forward again afterwards.
+    """
+    migrate_from = None
+    migrate_to = None
+    
+    def setUp(self):
+        super().setUp()
+        self.old_apps = self.migrate(self.migrate_from)
+    
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+    
+    def migrate(self, name=None):
+        """Migrate quiz_api to a migration (migrate_to by default) and return the models of that state."""
+        target = [('quiz_api', name or self.migrate_to)]
+        executor = MigrationExecutor(connection)
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+    
+    def create_old_material(self):
+        """Create a student and a study material with the models of migrate_from; returns (student, material)."""
+        Subject = self.old_apps.get_model('quiz_api', 'Subject')
+        Chapter = self.old_apps.get_model('quiz_api', 'Chapter')
+        Subchapter = self.old_apps.get_model('quiz_api', 'Subchapter')
+        StudyMaterial = self.old_apps.get_model('quiz_api', 'StudyMaterial')
+        student = self.old_apps.get_model('auth', 'User').objects.create(username='student')
+        chapter = Chapter.objects.create(subject=Subject.objects.create(name='Science'), name='Plants')
+        material = StudyMaterial.objects.create(
+            subchapter=Subchapter.objects.create(chapter=chapter, name='Leaves'), title='Leaves',
+            document='study_materials/leaves.pdf', file_type='pdf', file_size='1 KB'
+        )
+        return student, material
+
+class MergeDuplicateQuizzesMigrationTests(MigrationTestCase):
+    """0008 keeps the newest quiz per material and level and moves the others' scores and jobs to it."""
+    migrate_from = '0007_llmcallmetric'
+    migrate_to = '0008_unique_quiz_per_material_level'
+    
+    def test_duplicates_are_merged_into_the_newest_quiz(self):
+        OldQuiz = self.old_apps.get_model('quiz_api', 'Quiz')
+        OldQuizScore = self.old_apps.get_model('quiz_api', 'QuizScore')
+        OldJob = self.old_apps.get_model('quiz_api', 'QuizGenerationJob')
+        
+        student, material = self.create_old_material()
+        oldest = OldQuiz.objects.create(material=material, level='Beginner', questions_json='[]')
+        older = OldQuiz.objects.create(material=material, level='Beginner', questions_json='[]')
+        newest = OldQuiz.objects.create(material=material, level='Beginner', questions_json='[]')
+        OldQuiz.objects.filter(id=oldest.id).update(created_at=timezone.now() - timedelta(days=2))
+        OldQuiz.objects.filter(id=older.id).update(created_at=timezone.now() - timedelta(days=1))
+        other_level = OldQuiz.objects.create(material=material, level='Advanced', questions_json='[]')
+        for quiz in (oldest, older, other_level):
+            OldQuizScore.objects.create(quiz=quiz, user=student, score=80, time_taken='1:00')
+        job = OldJob.objects.create(material=material, level='Beginner', status='succeeded', quiz=older)
+        
+        new_apps = self.migrate()
+        NewQuiz = new_apps.get_model('quiz_api', 'Quiz')
+        NewQuizScore = new_apps.get_model('quiz_api', 'QuizScore')
+        self.assertEqual(
+            sorted(NewQuiz.objects.values_list('id', flat=True)), sorted([newest.id, other_level.id])
+        )
+        self.assertEqual(NewQuizScore.objects.filter(quiz_id=newest.id).count(), 2)
+        self.assertEqual(NewQuizScore.objects.filter(quiz_id=other_level.id).count(), 1)
+        self.assertEqual(new_apps.get_model('quiz_api', 'QuizGenerationJob').objects.get(id=job.id).quiz_id, newest.id)
+
+@override_settings(SUMMARY_RETRY_AFTER=3600)
+class MaterialSummaryTests(TestCase):
+    """Summaries follow the current document and failed ones are not retried on every request."""
+    
+    def setUp(self):
+        self.material = create_material()
+        MaterialContent.objects.create(material=self.material, content_hash='v2', status='ready')
+        patcher = mock.patch('quiz_api.summaries.get_material_text', return_value=STUDY_TEXT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_failed_summary_is_retried_after_the_cooldown(self):
+        with mock.patch('quiz_api.summaries.generate_material_summary', return_value={}) as generate:
+            self.assertIsNone(get_material_summary(self.material))
+            self.assertIsNone(get_material_summary(self.material))
+            self.assertEqual(generate.call_count, 1)
+            self.assertIsNotNone(MaterialSummary.objects.get(material=self.material).failed_at)
+        
+        MaterialSummary.objects.update(failed_at=timezone.now() - timedelta(hours=2))
+        summary = {'key_concepts': ['Photosynthesis']}
+        with mock.patch('quiz_api.summaries.generate_material_summary', return_value=summary) as generate:
+            self.assertEqual(get_material_summary(self.material), summary)
+            self.assertEqual(get_material_summary(self.material), summary)
+            self.assertEqual(generate.call_count, 1)
+        self.assertIsNone(MaterialSummary.objects.get(material=self.material).failed_at)
+    
+    def test_stored_summaries_are_for_the_current_document(self):
+        outdated = create_material('Roots')
+        MaterialContent.objects.create(material=outdated, content_hash='v2', status='ready')
+        failed = create_material('Stems')
+        MaterialContent.objects.create(material=failed, content_hash='v2', status='ready')
+        summary_json = json.dumps({'key_concepts': ['Photosynthesis']})
+        MaterialSummary.objects.create(material=self.material, content_hash='v2', summary_json=summary_json)
+        MaterialSummary.objects.create(material=outdated, content_hash='v1', summary_json=summary_json)
+        MaterialSummary.objects.create(
+            material=failed, content_hash='v2', summary_json='{}', failed_at=timezone.now()
+        )
+        
+        summaries = get_stored_summaries([self.material.id, outdated.id, failed.id])
+        self.assertEqual(summaries, {self.material.id: {'key_concepts': ['Photosynthesis']}})
+
+    def test_document_waiting_for_ingestion_is_hashed_once_per_version(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        material = create_material('Roots')
+        material.document = 'roots.pdf'
+        with open(material.document.path, 'wb') as f:
+            f.write(b'first version')
+        
+        with mock.patch('quiz_api.summaries.compute_document_hash', wraps=compute_document_hash) as compute:
+            first = get_content_hash(material)
+            self.assertEqual(get_content_hash(material), first)
+            self.assertEqual(compute.call_count, 1)
+            
+            with open(material.document.path, 'wb') as f:
+                f.write(b'second version, longer')
+            self.assertNotEqual(get_content_hash(material), first)
+            self.assertEqual(compute.call_count, 2)
+
+class RecommendationStalenessTests(TestCase):
+    """Changing or deleting a score queues a refresh of the student's recommendations."""
+    
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('teacher', password='secret', is_staff=True))
+        quiz = Quiz.objects.create(material=create_material(), level='Beginner', questions_json=[])
+        self.score = QuizScore.objects.create(user=self.student, quiz=quiz, score=60, time_seconds=90)
+    
+    def assert_pending(self):
+        state = RecommendationState.objects.get(user=self.student)
+        self.assertIsNotNone(state.pending_since)
+    
+    def test_updated_score_marks_recommendations_stale(self):
+        response = self.client.patch(f'/api/scores/{self.score.id}/', {'score': '90.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_pending()
+    
+    def test_deleted_score_marks_recommendations_stale(self):
+        response = self.client.delete(f'/api/scores/{self.score.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_pending()
+    
+    def test_recommendations_without_scores_keep_the_response_shape(self):
+        self.client.force_authenticate(User.objects.create_user('newcomer', password='secret'))
+        response = self.client.get('/api/recommendations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['recommendations'], [])
+        self.assertFalse(response.json()['pending'])
+
+class RecommendationHistoryTests(TestCase):
+    """The recommendation prompt describes only the student's most recent quizzes."""
+    
+    def test_history_covers_the_most_recent_quizzes(self):
+        student = User.objects.create_user('student', password='secret')
+        start = timezone.now() - timedelta(days=30)
+        quizzes = []
+        for number in range(RECOMMENDATION_HISTORY_QUIZZES + 5):
+            quiz = Quiz.objects.create(material=create_material(f'Topic {number}'), level='Beginner', questions_json=[question(1)])
+            score = QuizScore.objects.create(user=student, quiz=quiz, score=number, time_seconds=60)
+            QuizScore.objects.filter(id=score.id).update(completed_at=start + timedelta(hours=number))
+            quizzes.append(quiz)
+        # A new attempt at the oldest quiz makes it recent again
+        QuizScore.objects.create(user=student, quiz=quizzes[0], score=90, time_seconds=60)
+        
+        with self.assertNumQueries(3):
+            history = build_quiz_history(QuizScore.objects.filter(user=student))
+        self.assertEqual(len(history), RECOMMENDATION_HISTORY_QUIZZES)
+        self.assertEqual((history[0]['material'], history[0]['attempts'], history[0]['score']), ('Topic 0', 2, 45.0))
+        self.assertNotIn('Topic 5', [entry['material'] for entry in history])
+
+class NativeJSONMigrationTests(MigrationTestCase):
+    """0013 moves questions and answers from JSON text columns to native JSON columns and back."""
+    migrate_from = '0012_llmcallmetric_circuit_open_outcome'
+    migrate_to = '0013_native_json_questions_and_answers'
+    
+    def test_json_text_is_decoded(self):
+        student, material = self.create_old_material()
+        questions = [question(1), question(2)]
+        quiz = self.old_apps.get_model('quiz_api', 'Quiz').objects.create(
+            material=material, level='Beginner', questions_json=json.dumps(questions)
+        )
+        broken = self.old_apps.get_model('quiz_api', 'Quiz').objects.create(
+            material=material, level='Advanced', questions_json='[{"question": '
+        )
+        bank = self.old_apps.get_model('quiz_api', 'QuestionBank').objects.create(
+            material=material, level='Beginner', questions_json=json.dumps(questions)
+        )
+        QuizScore = self.old_apps.get_model('quiz_api', 'QuizScore')
+        answered = QuizScore.objects.create(
+            quiz=quiz, user=student, score=50, time_taken='1:00', answers_json=json.dumps(['Option A for 1', None])
+        )
+        unanswered = QuizScore.objects.create(quiz=quiz, user=student, score=0, time_taken='0:10')
+        
+        new_apps = self.migrate()
+        Quiz = new_apps.get_model('quiz_api', 'Quiz')
+        QuizScore = new_apps.get_model('quiz_api', 'QuizScore')
+        self.assertEqual(Quiz.objects.get(id=quiz.id).questions_json, questions)
+        self.assertEqual(Quiz.objects.get(id=broken.id).questions_json, [])
+        self.assertEqual(new_apps.get_model('quiz_api', 'QuestionBank').objects.get(id=bank.id).questions_json, questions)
+        self.assertEqual(QuizScore.objects.get(id=answered.id).answers_json, ['Option A for 1', None])
+        self.assertIsNone(QuizScore.objects.get(id=unanswered.id).answers_json)
+        
+        # Migrating back restores the text columns
+        old_apps = self.migrate(self.migrate_from)
+        self.assertEqual(json.loads(old_apps.get_model('quiz_api', 'Quiz').objects.get(id=quiz.id).questions_json), questions)
+        OldQuizScore = old_apps.get_model('quiz_api', 'QuizScore')
+        self.assertEqual(json.loads(OldQuizScore.objects.get(id=answered.id).answers_json), ['Option A for 1', None])
+        self.assertIsNone(OldQuizScore.objects.get(id=unanswered.id).answers_json)
+
+class TimeSecondsMigrationTests(MigrationTestCase):
+    """0014 turns the time taken text of scores into seconds and back."""
+    migrate_from = '0013_native_json_questions_and_answers'
+    migrate_to = '0014_quizscore_time_seconds'
+    
+    def test_time_taken_is_converted_to_seconds(self):
+        student, material = self.create_old_material()
+        quiz = self.old_apps.get_model('quiz_api', 'Quiz').objects.create(
+            material=material, level='Beginner', questions_json=[question(1)]
+        )
+        QuizScore = self.old_apps.get_model('quiz_api', 'QuizScore')
+        times = {'5:30': 330, '0:07': 7, '1:05:30': 3930, ' 2:00 ': 120, '45': 45, '': 0, 'a while': 0, '-1:00': 0}
+        score_ids = {
+            time_taken: QuizScore.objects.create(quiz=quiz, user=student, score=80, time_taken=time_taken).id
+            for time_taken in times
+        }
+        
+        new_apps = self.migrate()
+        seconds = dict(new_apps.get_model('quiz_api', 'QuizScore').objects.values_list('id', 'time_seconds'))
+        self.assertEqual({time_taken: seconds[score_id] for time_taken, score_id in score_ids.items()}, times)
+        
+        # Migrating back writes the seconds as m:ss
+        old_apps = self.migrate(self.migrate_from)
+        time_taken = dict(old_apps.get_model('quiz_api', 'QuizScore').objects.values_list('id', 'time_taken'))
+        self.assertEqual(time_taken[score_ids['5:30']], '5:30')
+        self.assertEqual(time_taken[score_ids['1:05:30']], '65:30')
+        self.assertEqual(time_taken[score_ids['a while']], '0:00')
+
+class VariantQuestionsMigrationTests(MigrationTestCase):
+    """0023 saves the questions of earlier variant attempts, rebuilt from their bank."""
+    migrate_from = '0022_circuitbreakerstate'
+    migrate_to = '0023_quizscore_questions_json'
+    
+    def test_variant_questions_are_rebuilt(self):
+        student, material = self.create_old_material()
+        bank_questions = [question(number) for number in range(1, 11)]
+        self.old_apps.get_model('quiz_api', 'QuestionBank').objects.create(
+            material=material, level='Beginner', questions_json=bank_questions
+        )
+        quiz = self.old_apps.get_model('quiz_api', 'Quiz').objects.create(
+            material=material, level='Beginner', questions_json=build_variant(bank_questions, 0, 5)
+        )
+        QuizScore = self.old_apps.get_model('quiz_api', 'QuizScore')
+        variant_score = QuizScore.objects.create(quiz=quiz, user=student, score=80, variant_seed=42)
+        quiz_score = QuizScore.objects.create(quiz=quiz, user=student, score=60)
+        
+        new_apps = self.migrate()
+        questions = dict(new_apps.get_model('quiz_api', 'QuizScore').objects.values_list('id', 'questions_json'))
+        self.assertEqual(questions[variant_score.id], build_variant(bank_questions, 42, settings.QUIZ_VARIANT_SIZE))
+        self.assertIsNone(questions[quiz_score.id])
+
+def api_status_error(status_code):
+    """Return the error the OpenAI client raises for an error response."""
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return openai.APIStatusError(f'Error {status_code}', response=httpx.Response(status_code, request=request), body=None)
+
+def api_timeout_error():
+    return openai.APITimeoutError(request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+
+@override_settings(
+    OPENAI_CIRCUIT_FAILURE_THRESHOLD=2, OPENAI_CIRCUIT_RESET_TIMEOUT=30, OPENAI_MAX_RETRIES=0, OPENAI_HEDGE_AFTER=0
+)
+class CircuitBreakerTests(TestCase):
+    """The breaker's state is shared through the database and only outages count against it."""
+    
+    def setUp(self):
+        clear_cached_circuit_states()
+        self.addCleanup(clear_cached_circuit_states)
+    
+    def fail(self, breaker, error):
+        with self.assertRaises(type(error)):
+            breaker.call(mock.Mock(side_effect=error))
+    
+    def test_open_circuit_is_seen_by_other_processes(self):
+        breaker = get_circuit_breaker()
+        self.fail(breaker, api_timeout_error())
+        self.assertEqual(get_circuit_breaker().retry_after(), 0)
+        self.fail(breaker, api_timeout_error())
+        
+        # A breaker created elsewhere reads the same state
+        other = get_circuit_breaker()
+        self.assertGreater(other.retry_after(), 0)
+        fn = mock.Mock(return_value='quiz')
+        with self.assertRaises(CircuitOpenError):
+            other.call(fn)
+        fn.assert_not_called()
+        
+        metrics = render_prometheus_metrics()
+        self.assertIn('quizwhiz_llm_circuit_state{service="openai"} 2', metrics)
+        self.assertIn('quizwhiz_llm_circuit_opened_total{service="openai"} 1', metrics)
+        self.assertIn('quizwhiz_llm_circuit_rejected_total{service="openai"} 1', metrics)
+    
+    def test_one_trial_call_closes_the_circuit(self):
+        breaker = get_circuit_breaker()
+        self.fail(breaker, api_timeout_error())
+        self.fail(breaker, api_timeout_error())
+        CircuitBreakerState.objects.update(opened_at=timezone.now() - timedelta(seconds=31))
+        clear_cached_circuit_states()
+        
+        breaker.before_call()
+        self.assertEqual(CircuitBreakerState.objects.get().state, 'half_open')
+        with self.assertRaises(CircuitOpenError):
+            get_circuit_breaker().before_call()
+        breaker.record_success()
+        self.assertEqual(get_circuit_breaker().call(lambda timeout: 'quiz'), 'quiz')
+        self.assertEqual(CircuitBreakerState.objects.get().state, 'closed')
+    
+    def test_failed_trial_call_opens_the_circuit_again(self):
+        breaker = get_circuit_breaker()
+        self.fail(breaker, api_timeout_error())
+        self.fail(breaker, api_timeout_error())
+        CircuitBreakerState.objects.update(opened_at=timezone.now() - timedelta(seconds=31))
+        clear_cached_circuit_states()
+        self.fail(breaker, api_timeout_error())
+        state = CircuitBreakerState.objects.get()
+        self.assertEqual((state.state, state.opened_total), ('open', 2))
+    
+    def test_server_errors_count_and_client_errors_do_not(self):
+        breaker = get_circuit_breaker()
+        self.fail(breaker, api_status_error(502))
+        self.fail(breaker, api_status_error(400))
+        self.assertEqual(CircuitBreakerState.objects.get().failures, 1)
+        self.fail(breaker, api_status_error(502))
+        self.assertEqual(CircuitBreakerState.objects.get().state, 'open')
+    
+    def test_success_resets_the_failures(self):
+        breaker = get_circuit_breaker()
+        self.fail(breaker, api_timeout_error())
+        breaker.call(lambda timeout: 'quiz')
+        self.fail(breaker, api_timeout_error())
+        self.assertEqual(CircuitBreakerState.objects.get().state, 'closed')
+    
+    def test_calls_through_a_closed_circuit_reuse_the_state(self):
+        get_circuit_breaker().call(lambda timeout: 'quiz')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_circuit_breaker().call(lambda timeout: 'quiz'), 'quiz')
+        
+        # Another process opens the circuit; this one sees it once its copy of the state is stale
+        CircuitBreakerState.objects.update(state='open', opened_at=timezone.now())
+        self.assertEqual(get_circuit_breaker().retry_after(), 0)
+        with mock.patch('quiz_api.circuit_breaker.time.monotonic', return_value=time.monotonic() + 2):
+            self.assertGreater(get_circuit_breaker().retry_after(), 0)
+    
+    @override_settings(OPENAI_HEDGE_AFTER=0.05)
+    def test_slow_request_is_hedged(self):
+        release = threading.Event()
+        closed = threading.Event()
+        slow_response = mock.Mock()
+        slow_response.close.side_effect = lambda: closed.set()
+        calls = []
+        
+        def create(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                release.wait(5)
+                return slow_response
+            return 'fast'
+        
+        self.assertEqual(get_circuit_breaker().call(create), 'fast')
+        self.assertEqual(len(calls), 2)
+        release.set()
+        # The losing response is released once it arrives
+        self.assertTrue(closed.wait(5))
+    
+    @override_settings(OPENAI_HEDGE_AFTER=0.05)
+    def test_slow_async_request_is_hedged_and_cancelled(self):
+        cancelled = []
+        calls = []
+        
+        async def create(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+            return 'fast'
+        
+        self.assertEqual(async_to_sync(get_circuit_breaker().acall)(create), 'fast')
+        self.assertEqual((len(calls), cancelled), (2, [True]))
+    
+    @override_settings(OPENAI_HEDGE_AFTER=0.05)
+    def test_hedged_request_waits_for_a_success(self):
+        calls = []
+        
+        def create(timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                time.sleep(0.2)
+                return 'slow'
+            raise api_timeout_error()
+        
+        self.assertEqual(get_circuit_breaker().call(create), 'slow')
+    
+    def test_requests_are_not_hedged_by_default(self):
+        threads = []
+        get_circuit_breaker().call(lambda timeout: threads.append(threading.current_thread()))
+        self.assertEqual(threads, [threading.current_thread()])
+    
+    def test_admin_stops_generating_while_the_circuit_is_open(self):
+        create_material('Roots')
+        create_material('Stems')
+        model_admin = StudyMaterialAdmin(StudyMaterial, admin.site)
+        with mock.patch('quiz_api.admin.create_quizzes_for_levels', side_effect=CircuitOpenError('openai', 20)) as create, \
+                mock.patch.object(model_admin, 'message_user') as message_user:
+            model_admin.generate_all_level_quizzes(None, StudyMaterial.objects.order_by('id'))
+        self.assertEqual(create.call_count, 1)
+        message_user.assert_called_once()
+        self.assertIn('retry in 20 seconds', message_user.call_args.args[1])
+
+class ScoreDeletionTests(TestCase):
+    """Deleting scores in any way rebuilds the affected students' performance."""
+    
+    def setUp(self):
+        self.students = [User.objects.create_user(name, password='secret') for name in ('ana', 'ben')]
+        self.leaves = create_material('Leaves')
+        self.roots = create_material('Roots')
+        for material, score in ((self.leaves, 40), (self.roots, 90)):
+            quiz = Quiz.objects.create(material=material, level='Beginner', questions_json=[])
+            for student in self.students:
+                record_score(QuizScore.objects.create(user=student, quiz=quiz, score=score, time_seconds=60))
+    
+    def overall(self, student):
+        return StudentPerformance.objects.get(user=student, scope='overall')
+    
+    def test_cascade_rebuilds_every_affected_student(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.roots.delete()
+        for student in self.students:
+            overall = self.overall(student)
+            self.assertEqual((overall.quiz_count, float(overall.highest_score)), (1, 40))
+            self.assertFalse(StudentPerformance.objects.filter(
+                user=student, subchapter=self.roots.subchapter
+            ).exists())
+    
+    def test_each_student_is_rebuilt_once(self):
+        with mock.patch('quiz_api.signals.rebuild_student_performance') as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                QuizScore.objects.all().delete()
+        rebuild.assert_called_once()
+        self.assertEqual(sorted(rebuild.call_args.args[0]), sorted(student.id for student in self.students))
+    
+    def test_deleted_score_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        score = QuizScore.objects.get(user=self.students[0], quiz__material=self.roots)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(f'/api/scores/{score.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.overall(self.students[0]).quiz_count, 1)
+        self.assertEqual(self.overall(self.students[1]).quiz_count, 2)
+    
+    def test_report_lists_the_quizzes_of_each_subchapter(self):
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        report = client.get('/api/student-report/').json()
+        subchapters = report['subject_performance']['Science']['chapters']['Plants']['subchapters']
+        quizzes = subchapters['Roots']['quizzes']
+        self.assertEqual([(quiz['id'], quiz['title'], quiz['level'], quiz['score']) for quiz in quizzes], [
+            (Quiz.objects.get(material=self.roots).id, 'Roots', 'Beginner', 90.0)
+        ])
+    
+    def test_report_lists_only_the_most_recent_quizzes_of_each_subchapter(self):
+        quiz = Quiz.objects.get(material=self.roots)
+        start = timezone.now() - timedelta(days=1)
+        for hours, score in ((1, 50), (2, 60), (3, 70)):
+            QuizScore.objects.create(
+                user=self.students[0], quiz=quiz, score=score, time_seconds=60, completed_at=start + timedelta(hours=hours)
+            )
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        with mock.patch('quiz_api.performance.REPORT_RECENT_QUIZZES', 2):
+            report = client.get('/api/student-report/').json()
+        subchapters = report['subject_performance']['Science']['chapters']['Plants']['subchapters']
+        self.assertEqual([quiz['score'] for quiz in subchapters['Roots']['quizzes']], [70.0, 90.0])
+
+class LeaderboardEntryTests(TestCase):
+    """A student's entry is their best attempt: highest score, then fastest, then earliest."""
+    
+    def setUp(self):
+        self.student = User.objects.create_user('student', password='secret')
+        self.material = create_material()
+        self.quiz = Quiz.objects.create(material=self.material, level='Beginner', questions_json=[])
+    
+    def submit(self, score, time_seconds, completed_at=None):
+        score = QuizScore.objects.create(
+            user=self.student, quiz=self.quiz, score=score, time_seconds=time_seconds,
+            completed_at=completed_at or timezone.now()
+        )
+        record_leaderboard_score(score)
+        return score
+    
+    def entry(self):
+        entries = LeaderboardEntry.objects.filter(user=self.student, scope='material', scope_id=self.material.id)
+        # Every window of every scope holds the same attempt
+        self.assertEqual(len({entry.quiz_score_id for entry in LeaderboardEntry.objects.filter(user=self.student)}), 1)
+        return entries.get(window='all_time')
+    
+    def test_higher_score_replaces_the_entry(self):
+        self.submit(60, 30)
+        best = self.submit(80, 300)
+        self.submit(70, 10)
+        self.assertEqual(self.entry().quiz_score_id, best.id)
+    
+    def test_ties_go_to_the_faster_attempt(self):
+        self.submit(80, 300)
+        faster = self.submit(80, 200)
+        self.submit(80, 250)
+        self.assertEqual(self.entry().quiz_score_id, faster.id)
+    
+    def test_full_ties_go_to_the_earlier_attempt(self):
+        first = self.submit(80, 200, timezone.now() - timedelta(minutes=5))
+        self.submit(80, 200)
+        self.assertEqual(self.entry().quiz_score_id, first.id)
+    
+    def test_concurrent_better_entry_is_kept(self):
+        best = self.submit(90, 100)
+        # The lookup ran before the other request saved its entry
+        with mock.patch('quiz_api.leaderboards.existing_entries', return_value={}):
+            self.submit(70, 50)
+        self.assertEqual(self.entry().quiz_score_id, best.id)
+        self.assertEqual(LeaderboardEntry.objects.filter(user=self.student).count(), 12)
+    
+    def test_concurrent_worse_entry_is_replaced(self):
+        self.submit(70, 50)
+        with mock.patch('quiz_api.leaderboards.existing_entries', return_value={}):
+            best = self.submit(90, 100)
+        self.assertEqual(self.entry().quiz_score_id, best.id)
+        self.assertEqual(LeaderboardEntry.objects.filter(user=self.student).count(), 12)
+    
+    def test_deleted_best_attempt_gives_way_to_the_next_best(self):
+        self.submit(60, 30)
+        runner_up = self.submit(80, 300)
+        best = self.submit(90, 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            best.delete()
+        self.assertEqual(self.entry().quiz_score_id, runner_up.id)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.material.delete()
+        self.assertFalse(LeaderboardEntry.objects.filter(user=self.student).exists())
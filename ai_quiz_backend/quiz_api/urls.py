@@ -21,6 +21,10 @@ urlpatterns = [
     
     # Quiz generation endpoints
     path('generate-quiz/<int:material_id>/', views.generate_quiz, name='generate-quiz'),
+    path('generate-quiz/<int:material_id>/all-levels/', views.generate_quiz_all_levels, name='generate-quiz-all-levels'),
+    path('generate-quiz/<int:material_id>/stream/', views.generate_quiz_stream, name='generate-quiz-stream'),
+    path('generate-quiz/<int:material_id>/bank/', views.fill_quiz_question_bank, name='fill-question-bank'),
+    path('generate-quiz/jobs/<int:job_id>/', views.quiz_generation_job, name='quiz-generation-job'),
     
     # Study recommendations
     path('recommendations/', views.study_recommendations, name='recommendations'),
@@ -30,4 +34,9 @@ urlpatterns = [
     
     # Leaderboard
     path('leaderboard/material/<int:material_id>/', views.material_leaderboard, name='material-leaderboard'),
+    path('leaderboards/global/', views.leaderboard, {'scope': 'global'}, name='global-leaderboard'),
+    path('leaderboards/<str:scope>/<int:scope_id>/', views.leaderboard, name='leaderboard'),
+    
+    # Monitoring
+    path('metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
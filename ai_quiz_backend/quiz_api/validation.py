@@ -0,0 +1,59 @@
+"""
+Checks applied to generated quiz questions before they are shown to students.
+"""
+import re
+
+# Number of answer options every question must have
+OPTIONS_PER_QUESTION = 4
+
+def validate_question(question):
+    """Return a list of problems with a generated question; empty if it is usable."""
+    if not isinstance(question, dict):
+        return ['question is not an object']
+    
+    problems = []
+    if not isinstance(question.get('question'), str) or not question['question'].strip():
+        problems.append('missing question text')
+    
+    options = question.get('options')
+    if not isinstance(options, list) or not all(isinstance(option, str) for option in options):
+        problems.append('options must be a list of strings')
+    elif len(options) != OPTIONS_PER_QUESTION:
+        problems.append(f'expected {OPTIONS_PER_QUESTION} options, got {len(options)}')
+    elif len(set(options)) != len(options):
+        problems.append('options are not distinct')
+    
+    correct_answer = question.get('correct_answer')
+    if not isinstance(correct_answer, str):
+        problems.append('missing correct answer')
+    elif isinstance(options, list) and correct_answer not in options:
+        problems.append('correct answer is not one of the options')
+    
+    return problems
+
+def question_key(question):
+    """Normalized question text used to spot duplicates that differ only in case, spacing or punctuation."""
+    return re.sub(r'[^\w]+', ' ', question['question'].lower()).strip()
+
+def split_valid_questions(questions, existing=()):
+    """
+    Split generated questions into (valid, rejected). A question is rejected
+    if validate_question() finds problems or it repeats an earlier question
+    or one of `existing`. rejected holds (question, problems) pairs.
+    """
+    seen = {question_key(question) for question in existing}
+    valid = []
+    rejected = []
+    for question in questions:
+        problems = validate_question(question)
+        if not problems:
+            key = question_key(question)
+            if key in seen:
+                problems = ['duplicate question']
+            else:
+                seen.add(key)
+        if problems:
+            rejected.append((question, problems))
+        else:
+            valid.append(question)
+    return valid, rejected
@@ -1,33 +1,63 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Avg, Max
-from django.http import FileResponse
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authtoken.models import Token
 from rest_framework.parsers import MultiPartParser, FormParser
 import os
 import json
+import logging
 from datetime import datetime
 
 from .models import (
     Subject, Chapter, Subchapter, StudyMaterial, 
-    Quiz, QuizScore, StudyRecommendation
+    Quiz, QuestionBank, QuizGenerationJob, QuizScore, StudyRecommendation, RecommendationState
 )
 from .serializers import (
     UserSerializer, UserRegistrationSerializer,
     SubjectSerializer, ChapterSerializer, ChapterDetailSerializer,
     SubchapterSerializer, SubchapterDetailSerializer,
     StudyMaterialSerializer, StudyMaterialDetailSerializer,
-    QuizSerializer, QuizDetailSerializer,
+    QuizSerializer, QuizDetailSerializer, QuestionBankSerializer, QuizGenerationJobSerializer,
     QuizScoreSerializer, QuizScoreCreateSerializer,
-    StudyRecommendationSerializer, LeaderboardSerializer
+    StudyRecommendationSerializer, LeaderboardSerializer, LeaderboardEntrySerializer
 )
 from .permissions import IsTeacher
-from .openai_utils import extract_text_from_document, generate_quiz, generate_study_recommendations
+from .ingestion import schedule_ingestion
+from .generation import (
+    QUIZ_LEVELS, QuizGenerationError, TextExtractionError, create_quizzes_for_levels, stream_quiz,
+    fill_question_bank
+)
+from .question_bank import build_variant, variant_seed
+from .recommendations import get_recommendation_freshness, mark_recommendations_stale
+from .performance import get_student_performance, rebuild_student_performance, record_score
+from .leaderboards import WINDOWS, current_period, get_leaderboard, rebuild_leaderboards, record_leaderboard_score
+from .jobs import enqueue_quiz_generation
+from .streaming import EventStreamRenderer, format_sse
+from .metrics import render_prometheus_metrics
+from .circuit_breaker import CircuitOpenError, get_circuit_breaker
+from .renderers import with_raw_json
+
+logger = logging.getLogger(__name__)
+
+def is_true(value):
+    """Interpret a request flag such as `regenerate` sent as JSON, form or query data."""
+    return value is True or str(value).lower() in ('true', '1', 'yes', 'on')
+
+def service_unavailable(error):
+    """Fail fast with 503 while calls to OpenAI are refused by the circuit breaker."""
+    return Response({'error': 'Quiz generation is temporarily unavailable, please try again later',
+                     'retry_after': error.retry_after},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': str(error.retry_after)})
 
 # Authentication views
 @api_view(['POST'])
@@ -171,14 +201,28 @@ class StudyMaterialViewSet(viewsets.ModelViewSet):
             file_size = document.size / 1024  # Convert to KB
             file_size_str = f"{file_size:.2f} KB" if file_size < 1024 else f"{file_size/1024:.2f} MB"
             
-            serializer.save(
+            material = serializer.save(
                 uploaded_by=self.request.user,
                 file_type=file_extension,
                 file_size=file_size_str
             )
+            # Parse the document in the background so quiz generation reads pre-parsed text
+            schedule_ingestion(material, self.request.user)
         else:
             serializer.save(uploaded_by=self.request.user)
     
+    def perform_update(self, serializer):
+        document = self.request.data.get('document')
+        if document:
+            file_extension = document.name.split('.')[-1].lower()
+            file_size = document.size / 1024  # Convert to KB
+            file_size_str = f"{file_size:.2f} KB" if file_size < 1024 else f"{file_size/1024:.2f} MB"
+            
+            material = serializer.save(file_type=file_extension, file_size=file_size_str)
+            schedule_ingestion(material, self.request.user)
+        else:
+            serializer.save()
+    
     @action(detail=True, methods=['get'])
     def download(self, request, pk=None):
         """Download the study material file"""
@@ -190,34 +234,161 @@ class StudyMaterialViewSet(viewsets.ModelViewSet):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_quiz(request, material_id):
-    """Generate a quiz from study material"""
+    """
+    Get the quiz for a study material and level, queueing its generation if
+    there is none. An existing quiz is returned with 200; otherwise returns
+    202 with a job whose status can be polled, and identical requests share
+    the same job. Teachers can pass `regenerate` to replace an existing quiz.
+    """
     material = get_object_or_404(StudyMaterial, id=material_id)
     level = request.data.get('level', 'Beginner')
+    regenerate = is_true(request.data.get('regenerate'))
     
-    # Extract text from study material
-    file_path = material.document.path
-    text_content = extract_text_from_document(file_path, material.file_type)
+    if level not in QUIZ_LEVELS:
+        return Response({'error': f"Invalid level: {level}"}, 
+                        status=status.HTTP_400_BAD_REQUEST)
+    if regenerate and not request.user.is_staff:
+        return Response({'error': 'Only teachers can regenerate quizzes'}, 
+                        status=status.HTTP_403_FORBIDDEN)
+    
+    if not regenerate:
+        quiz = Quiz.objects.filter(material=material, level=level).first()
+        if quiz:
+            serializer = QuizDetailSerializer(quiz)
+            return Response(serializer.data)
+    
+    retry_after = get_circuit_breaker().retry_after()
+    if retry_after:
+        return service_unavailable(CircuitOpenError('openai', retry_after))
+    
+    job, created = enqueue_quiz_generation(material, level, request.user, regenerate)
+    
+    status_url = request.build_absolute_uri(reverse('quiz-generation-job', args=[job.id]))
+    data = QuizGenerationJobSerializer(job).data
+    data['status_url'] = status_url
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def generate_quiz_stream(request, material_id):
+    """
+    Generate a quiz and stream each question to the client with Server-Sent
+    Events as soon as it has been generated, then save the quiz. An existing
+    quiz is streamed back without generating a new one unless a teacher
+    passes `regenerate`.
+    
+    Events: `question` ({index, question}), then `done` ({quiz_id, question_count})
+    or `error` ({error}).
+    """
+    material = get_object_or_404(StudyMaterial, id=material_id)
+    level = request.query_params.get('level', 'Beginner')
+    regenerate = is_true(request.query_params.get('regenerate'))
     
-    if not text_content:
-        return Response({'error': 'Could not extract text from the document'}, 
+    if level not in QUIZ_LEVELS:
+        return Response({'error': f"Invalid level: {level}"}, 
                         status=status.HTTP_400_BAD_REQUEST)
+    if regenerate and not request.user.is_staff:
+        return Response({'error': 'Only teachers can regenerate quizzes'}, 
+                        status=status.HTTP_403_FORBIDDEN)
+    
+    def events():
+        index = 0
+        try:
+            for kind, item in stream_quiz(material, level, regenerate=regenerate):
+                if kind == 'question':
+                    yield format_sse('question', {'index': index, 'question': item})
+                    index += 1
+                else:
+                    yield format_sse('done', {'quiz_id': item.id, 'question_count': index})
+        except QuizGenerationError as e:
+            yield format_sse('error', {'error': str(e)})
+        except CircuitOpenError as e:
+            yield format_sse('error', {'error': 'Quiz generation is temporarily unavailable, please try again later',
+                                       'retry_after': e.retry_after})
+        except Exception as e:
+            logger.error(f"Error streaming quiz for material {material.id}: {e}")
+            yield format_sse('error', {'error': 'Failed to generate quiz questions'})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsTeacher])
+def fill_quiz_question_bank(request, material_id):
+    """
+    Fill the question bank for a study material and level with one large
+    generation call, so students can be served quiz variants from it.
+    """
+    material = get_object_or_404(StudyMaterial, id=material_id)
+    level = request.data.get('level', 'Beginner')
+    refill = is_true(request.data.get('refill'))
     
-    # Generate quiz questions
-    questions = generate_quiz(text_content, level)
+    if level not in QUIZ_LEVELS:
+        return Response({'error': f"Invalid level: {level}"}, 
+                        status=status.HTTP_400_BAD_REQUEST)
     
-    if not questions:
-        return Response({'error': 'Failed to generate quiz questions'}, 
-                        status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    try:
+        size = int(request.data.get('size') or settings.QUESTION_BANK_SIZE)
+    except (TypeError, ValueError):
+        size = 0
+    if size < 1:
+        return Response({'error': 'size must be a positive number'}, 
+                        status=status.HTTP_400_BAD_REQUEST)
     
-    # Save the generated quiz
-    quiz = Quiz.objects.create(
-        material=material,
-        level=level
-    )
-    quiz.set_questions(questions)
-    quiz.save()
+    try:
+        bank = fill_question_bank(material, level, size, refill=refill)
+    except TextExtractionError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except QuizGenerationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except CircuitOpenError as e:
+        return service_unavailable(e)
     
-    serializer = QuizDetailSerializer(quiz)
+    serializer = QuestionBankSerializer(bank)
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def quiz_generation_job(request, job_id):
+    """Get the status and progress of a quiz generation job"""
+    job = get_object_or_404(QuizGenerationJob, id=job_id)
+    serializer = QuizGenerationJobSerializer(job)
+    return Response(serializer.data)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsTeacher])
+def generate_quiz_all_levels(request, material_id):
+    """
+    Generate quizzes for several levels of a study material with one model
+    call. Levels that already have a quiz are kept unless `regenerate` is set.
+    """
+    material = get_object_or_404(StudyMaterial, id=material_id)
+    levels = request.data.get('levels') or QUIZ_LEVELS
+    regenerate = is_true(request.data.get('regenerate'))
+    if isinstance(levels, str):
+        levels = [levels]
+    if not isinstance(levels, list):
+        return Response({'error': 'levels must be a list of levels'}, 
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    invalid_levels = [level for level in levels if level not in QUIZ_LEVELS]
+    if invalid_levels:
+        return Response({'error': f"Invalid levels: {', '.join(map(str, invalid_levels))}"}, 
+                        status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        quizzes = create_quizzes_for_levels(material, levels, regenerate=regenerate)
+    except TextExtractionError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except QuizGenerationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    except CircuitOpenError as e:
+        return service_unavailable(e)
+    
+    serializer = QuizDetailSerializer(quizzes, many=True)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class QuizViewSet(viewsets.ReadOnlyModelViewSet):
@@ -230,7 +401,8 @@ class QuizViewSet(viewsets.ReadOnlyModelViewSet):
         return QuizSerializer
     
     def get_queryset(self):
-        queryset = Quiz.objects.all()
+        # Questions are sent on as stored, without decoding them
+        queryset = with_raw_json(Quiz.objects.all(), 'questions_json')
         material_id = self.request.query_params.get('material_id')
         level = self.request.query_params.get('level')
         
@@ -238,8 +410,41 @@ class QuizViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(material_id=material_id)
         if level:
             queryset = queryset.filter(level=level)
-            
+        
         return queryset
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def variant(self, request):
+        """
+        Draw the student's own variant of the quiz for a material and level
+        from its question bank, without calling the model. The same variant is
+        returned until the student submits a score; submit it with the
+        returned variant_seed.
+        """
+        material_id = request.query_params.get('material_id')
+        level = request.query_params.get('level', 'Beginner')
+        if not material_id:
+            return Response({'error': 'material_id is required'}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        if level not in QUIZ_LEVELS:
+            return Response({'error': f"Invalid level: {level}"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        bank = QuestionBank.objects.filter(material_id=material_id, level=level).first()
+        quiz = Quiz.objects.filter(material_id=material_id, level=level).first()
+        if bank is None or quiz is None:
+            return Response({'error': 'No question bank exists for this material and level yet'}, 
+                            status=status.HTTP_404_NOT_FOUND)
+        
+        attempt = QuizScore.objects.filter(user=request.user, quiz=quiz).count()
+        seed = variant_seed(request.user.id, bank.id, attempt)
+        return Response({
+            'quiz_id': quiz.id,
+            'material': quiz.material_id,
+            'level': quiz.level,
+            'variant_seed': seed,
+            'questions': build_variant(bank.get_questions(), seed, settings.QUIZ_VARIANT_SIZE)
+        })
 
 # Quiz Score submission and retrieval
 class QuizScoreViewSet(viewsets.ModelViewSet):
@@ -256,232 +461,148 @@ class QuizScoreViewSet(viewsets.ModelViewSet):
             queryset = QuizScore.objects.all()
         else:  # Students can only see their own scores
             queryset = QuizScore.objects.filter(user=self.request.user)
-            
+        
         quiz_id = self.request.query_params.get('quiz_id')
         if quiz_id:
             queryset = queryset.filter(quiz_id=quiz_id)
-            
+        
+        if self.action in ('list', 'retrieve'):
+            queryset = with_raw_json(queryset.select_related('user'), 'answers_json').defer('questions_json')
         return queryset
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            score = serializer.save(user=self.request.user)
+            record_score(score)
+            record_leaderboard_score(score)
+        mark_recommendations_stale(self.request.user)
+    
+    def perform_update(self, serializer):
+        # A changed score can lower a maximum, so the student's totals are recomputed
+        with transaction.atomic():
+            score = serializer.save()
+            rebuild_student_performance([score.user_id])
+            rebuild_leaderboards([score.user_id])
+        mark_recommendations_stale(score.user)
+    
+    def perform_destroy(self, instance):
+        # The student's totals and leaderboard entries are rebuilt by the QuizScore post_delete handler
+        instance.delete()
+        mark_recommendations_stale(instance.user)
 
 # Leaderboard views
+LEADERBOARD_SCOPE_MODELS = {
+    'material': StudyMaterial,
+    'subchapter': Subchapter,
+    'subject': Subject,
+}
+
+def leaderboard_params(request):
+    """Return the (window, limit) asked for, or raise ValueError with the reason."""
+    window = request.query_params.get('window', 'all_time')
+    if window not in WINDOWS:
+        raise ValueError(f"Invalid window: {window}")
+    try:
+        limit = int(request.query_params.get('limit') or settings.LEADERBOARD_SIZE)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 1 <= limit <= settings.LEADERBOARD_MAX_SIZE:
+        raise ValueError(f"limit must be between 1 and {settings.LEADERBOARD_MAX_SIZE}")
+    return window, limit
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def material_leaderboard(request, material_id):
-    """Get leaderboard for a study material"""
+    """Get leaderboard for a study material: each student's best attempt"""
     material = get_object_or_404(StudyMaterial, id=material_id)
-    quizzes = Quiz.objects.filter(material=material)
+    try:
+        window, limit = leaderboard_params(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    if not quizzes:
-        return Response({'error': 'No quizzes found for this material'}, 
-                        status=status.HTTP_404_NOT_FOUND)
-    
-    # Get top scores
-    top_scores = QuizScore.objects.filter(quiz__in=quizzes).order_by('-score', 'time_taken')[:10]
-    serializer = LeaderboardSerializer(top_scores, many=True)
+    entries = get_leaderboard('material', material.id, window, limit).select_related(
+        'quiz_score__user', 'quiz_score__quiz'
+    )
+    serializer = LeaderboardSerializer([entry.quiz_score for entry in entries], many=True)
     
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def leaderboard(request, scope, scope_id=0):
+    """
+    Get the top students of a material, subchapter or subject, or the global
+    top, for all time or the current week or day (?window=) from the
+    materialized leaderboards.
+    """
+    if scope != 'global':
+        if scope not in LEADERBOARD_SCOPE_MODELS:
+            return Response({'error': f"Invalid scope: {scope}"}, 
+                            status=status.HTTP_400_BAD_REQUEST)
+        get_object_or_404(LEADERBOARD_SCOPE_MODELS[scope], id=scope_id)
+    try:
+        window, limit = leaderboard_params(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    serializer = LeaderboardEntrySerializer(get_leaderboard(scope, scope_id, window, limit), many=True)
+    return Response({
+        'scope': scope,
+        'scope_id': scope_id,
+        'window': window,
+        'period': current_period(window),
+        'entries': [{'rank': rank, **entry} for rank, entry in enumerate(serializer.data, 1)],
+    })
+
 # Study recommendations
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def study_recommendations(request):
-    """Get personalized study recommendations for the current user"""
+    """
+    Get the current user's study recommendations. They are recomputed in the
+    background after new quiz scores, so this only reads the stored ones and
+    reports how fresh they are.
+    """
     user = request.user
-    
-    # Get existing recommendations
-    existing_recommendations = StudyRecommendation.objects.filter(user=user).order_by('-created_at')
-    
-    if existing_recommendations.exists():
-        serializer = StudyRecommendationSerializer(existing_recommendations, many=True)
-        return Response(serializer.data)
-    
-    # Generate new recommendations if none exist
-    scores = QuizScore.objects.filter(user=user).select_related('quiz')
-    
-    if not scores.exists():
-        return Response({'message': 'Complete some quizzes to get recommendations'}, 
-                        status=status.HTTP_200_OK)
-    
-    # Prepare user data for recommendation generation
-    avg_score = scores.aggregate(avg_score=Avg('score'))['avg_score']
-    
-    # Identify strengths and weaknesses
-    strengths = []
-    weaknesses = []
-    
-    # Get the user's quiz history with questions and answers
-    quiz_history = []
-    for score in scores:
-        quiz = score.quiz
-        questions = quiz.get_questions()
-        answers = score.get_answers()
-        
-        quiz_data = {
-            'material': quiz.material.title,
-            'level': quiz.level,
-            'score': float(score.score),
-            'questions': []
-        }
-        
-        # Match questions with user's answers
-        if answers:
-            for q_idx, question in enumerate(questions):
-                if q_idx < len(answers):
-                    user_answer = answers[q_idx]
-                    is_correct = user_answer == question['correct_answer']
-                    
-                    quiz_data['questions'].append({
-                        'question': question['question'],
-                        'user_answer': user_answer,
-                        'correct_answer': question['correct_answer'],
-                        'is_correct': is_correct
-                    })
-        
-        quiz_history.append(quiz_data)
-    
-    # Identify subject areas from recent quizzes
-    recent_materials = [score.quiz.material for score in scores.order_by('-completed_at')[:5]]
-    for material in recent_materials:
-        subchapter = material.subchapter
-        chapter = subchapter.chapter
-        subject = chapter.subject
-        
-        if any(score.score >= 70 for score in scores if score.quiz.material == material):
-            strengths.append(f"{subject.name} - {chapter.name} - {subchapter.name}")
-        else:
-            weaknesses.append(f"{subject.name} - {chapter.name} - {subchapter.name}")
-    
-    user_data = {
-        'avg_score': float(avg_score),
-        'strengths': strengths[:3],  # Top 3 strengths
-        'weaknesses': weaknesses[:3]  # Top 3 weaknesses
-    }
-    
-    # Generate recommendations using OpenAI
-    recommendations = generate_study_recommendations(user_data, quiz_history)
-    
-    # Save recommendations to database
-    saved_recommendations = []
-    for weakness in weaknesses[:2]:  # Use top 2 weaknesses
-        parts = weakness.split(' - ')
-        if len(parts) == 3:
-            subject_name, chapter_name, subchapter_name = parts
-            
-            try:
-                subchapter = Subchapter.objects.get(
-                    name=subchapter_name,
-                    chapter__name=chapter_name,
-                    chapter__subject__name=subject_name
-                )
-                
-                for rec_text in recommendations[:2]:  # Save first 2 recommendations per weakness
-                    recommendation = StudyRecommendation.objects.create(
-                        user=user,
-                        subchapter=subchapter,
-                        recommendation=rec_text
-                    )
-                    saved_recommendations.append(recommendation)
-                    
-                recommendations = recommendations[2:]  # Remove used recommendations
-                if not recommendations:
-                    break
-                    
-            except Subchapter.DoesNotExist:
-                continue
-    
-    serializer = StudyRecommendationSerializer(saved_recommendations, many=True)
-    return Response(serializer.data)
+    state = RecommendationState.objects.filter(user=user).first()
+    recommendations = StudyRecommendation.objects.filter(user=user).select_related(
+        'subchapter__chapter__subject'
+    ).order_by('-created_at')
+    
+    if state is None:
+        if not QuizScore.objects.filter(user=user).exists():
+            return Response({
+                'message': 'Complete some quizzes to get recommendations',
+                'recommendations': [],
+                **get_recommendation_freshness(state)
+            }, status=status.HTTP_200_OK)
+        if not recommendations.exists():
+            # Scores from before background refreshes existed: queue the first refresh
+            mark_recommendations_stale(user)
+            state = RecommendationState.objects.filter(user=user).first()
+    
+    serializer = StudyRecommendationSerializer(recommendations, many=True)
+    return Response({
+        'recommendations': serializer.data,
+        **get_recommendation_freshness(state)
+    })
 
 # Student report
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def student_report(request):
-    """Generate a comprehensive report of student performance"""
+    """
+    Generate a comprehensive report of student performance from the
+    aggregates kept up to date as scores are submitted.
+    """
     user = request.user
     
-    # Get all quiz scores for the user
-    scores = QuizScore.objects.filter(user=user).select_related('quiz__material__subchapter__chapter__subject')
-    
-    if not scores.exists():
+    overall, subject_performance = get_student_performance(user)
+    if overall is None:
         return Response({'message': 'No quiz data available yet'}, status=status.HTTP_200_OK)
     
-    # Overall statistics
-    total_quizzes = scores.count()
-    avg_score = scores.aggregate(avg=Avg('score'))['avg']
-    highest_score = scores.aggregate(max=Max('score'))['max']
-    
-    # Subject area performance
-    subject_performance = {}
-    for score in scores:
-        quiz = score.quiz
-        material = quiz.material
-        subchapter = material.subchapter
-        chapter = subchapter.chapter
-        subject = chapter.subject
-        
-        subject_name = subject.name
-        if subject_name not in subject_performance:
-            subject_performance[subject_name] = {
-                'total_quizzes': 0,
-                'total_score': 0,
-                'chapters': {}
-            }
-            
-        subject_data = subject_performance[subject_name]
-        subject_data['total_quizzes'] += 1
-        subject_data['total_score'] += float(score.score)
-        
-        chapter_name = chapter.name
-        if chapter_name not in subject_data['chapters']:
-            subject_data['chapters'][chapter_name] = {
-                'total_quizzes': 0,
-                'total_score': 0,
-                'subchapters': {}
-            }
-            
-        chapter_data = subject_data['chapters'][chapter_name]
-        chapter_data['total_quizzes'] += 1
-        chapter_data['total_score'] += float(score.score)
-        
-        subchapter_name = subchapter.name
-        if subchapter_name not in chapter_data['subchapters']:
-            chapter_data['subchapters'][subchapter_name] = {
-                'total_quizzes': 0,
-                'total_score': 0,
-                'quizzes': []
-            }
-            
-        subchapter_data = chapter_data['subchapters'][subchapter_name]
-        subchapter_data['total_quizzes'] += 1
-        subchapter_data['total_score'] += float(score.score)
-        
-        quiz_data = {
-            'id': quiz.id,
-            'title': material.title,
-            'level': quiz.level,
-            'score': float(score.score),
-            'date': score.completed_at.strftime('%Y-%m-%d %H:%M')
-        }
-        subchapter_data['quizzes'].append(quiz_data)
-    
-    # Calculate averages
-    for subject_name, subject_data in subject_performance.items():
-        if subject_data['total_quizzes'] > 0:
-            subject_data['avg_score'] = subject_data['total_score'] / subject_data['total_quizzes']
-            
-        for chapter_name, chapter_data in subject_data['chapters'].items():
-            if chapter_data['total_quizzes'] > 0:
-                chapter_data['avg_score'] = chapter_data['total_score'] / chapter_data['total_quizzes']
-                
-            for subchapter_name, subchapter_data in chapter_data['subchapters'].items():
-                if subchapter_data['total_quizzes'] > 0:
-                    subchapter_data['avg_score'] = subchapter_data['total_score'] / subchapter_data['total_quizzes']
-    
     # Recent activity
-    recent_scores = QuizScore.objects.filter(user=user).order_by('-completed_at')[:5]
+    recent_scores = QuizScore.objects.filter(user=user).select_related('quiz__material').order_by('-completed_at')[:5]
     recent_activity = []
     
     for score in recent_scores:
@@ -499,13 +620,19 @@ def student_report(request):
         'username': user.username,
         'full_name': f"{user.first_name} {user.last_name}".strip() or user.username,
         'summary': {
-            'total_quizzes': total_quizzes,
-            'avg_score': float(avg_score) if avg_score else 0,
-            'highest_score': float(highest_score) if highest_score else 0
+            'total_quizzes': overall.quiz_count,
+            'avg_score': float(overall.avg_score),
+            'highest_score': float(overall.highest_score)
         },
         'subject_performance': subject_performance,
         'recent_activity': recent_activity,
         'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    return Response(report)
\ No newline at end of file
+    return Response(report)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsTeacher])
+def metrics(request):
+    """Expose LLM call latency, token and outcome metrics in the Prometheus text format"""
+    return HttpResponse(render_prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -146,6 +146,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSONRenderer that passes stored JSON columns through without re-encoding them
+    'DEFAULT_RENDERER_CLASSES': [
+        'quiz_api.renderers.RawJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 # Media files (uploads)
@@ -154,3 +159,73 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # OpenAI API settings
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 60))  # Seconds per request
+OPENAI_CONNECT_TIMEOUT = float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10))
+
+# Deadline, retries and circuit breaker of OpenAI calls (see quiz_api/circuit_breaker.py)
+OPENAI_CALL_DEADLINE = float(os.environ.get('OPENAI_CALL_DEADLINE', 90))  # Seconds for all attempts of a call
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+OPENAI_RETRY_BASE_DELAY = float(os.environ.get('OPENAI_RETRY_BASE_DELAY', 0.5))  # Seconds, doubled per retry
+OPENAI_RETRY_MAX_DELAY = float(os.environ.get('OPENAI_RETRY_MAX_DELAY', 8))
+OPENAI_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('OPENAI_CIRCUIT_FAILURE_THRESHOLD', 5))  # Failures in a row
+OPENAI_CIRCUIT_RESET_TIMEOUT = int(os.environ.get('OPENAI_CIRCUIT_RESET_TIMEOUT', 30))  # Seconds before a trial call
+OPENAI_CIRCUIT_STATE_TTL = float(os.environ.get('OPENAI_CIRCUIT_STATE_TTL', 1))  # Seconds a process reuses the circuit state it read
+OPENAI_HEDGE_AFTER = float(os.environ.get('OPENAI_HEDGE_AFTER', 0))  # Seconds before a slow request is sent again; 0 disables hedging
+
+# LLM provider: 'openai', 'fake' (deterministic offline stand-in), 'record' (call OpenAI
+# and save responses), 'replay' (answer only from saved responses) or a provider class path
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'openai')
+LLM_FAKE_LATENCY = float(os.environ.get('LLM_FAKE_LATENCY', 0))  # Seconds per fake call
+LLM_RECORDINGS_DIR = os.environ.get('LLM_RECORDINGS_DIR', os.path.join(BASE_DIR, 'llm_recordings'))
+
+# LLM call metrics: prices in USD per million prompt/completion tokens, matched by model
+# name prefix, and how many days of per-call metrics to keep
+LLM_TOKEN_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+}
+LLM_METRICS_RETENTION_DAYS = int(os.environ.get('LLM_METRICS_RETENTION_DAYS', 30))
+
+# LLM response cache settings
+# BACKEND is 'locmem' (in-process LRU), 'django' (Django cache framework),
+# 'database', 'none', or the dotted path of a custom backend class
+LLM_CACHE = {
+    'BACKEND': os.environ.get('LLM_CACHE_BACKEND', 'locmem'),
+    'TIMEOUT': int(os.environ.get('LLM_CACHE_TIMEOUT', 7 * 24 * 60 * 60)),  # Seconds
+    'MAX_ENTRIES': int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 1000)),
+    'CACHE_ALIAS': os.environ.get('LLM_CACHE_ALIAS', 'default'),
+}
+
+# Document text extraction settings
+TEXT_EXTRACTION_WORKERS = int(os.environ.get('TEXT_EXTRACTION_WORKERS', os.cpu_count() or 1))
+PARALLEL_EXTRACTION_MIN_PAGES = int(os.environ.get('PARALLEL_EXTRACTION_MIN_PAGES', 50))
+
+# Background quiz generation worker settings (python manage.py run_worker)
+QUIZ_JOB_MAX_CONCURRENT = int(os.environ.get('QUIZ_JOB_MAX_CONCURRENT', 4))  # Across all workers
+QUIZ_JOB_MAX_ATTEMPTS = int(os.environ.get('QUIZ_JOB_MAX_ATTEMPTS', 3))
+QUIZ_JOB_STALE_AFTER = int(os.environ.get('QUIZ_JOB_STALE_AFTER', 300))  # Seconds without a heartbeat
+QUIZ_JOB_POLL_INTERVAL = float(os.environ.get('QUIZ_JOB_POLL_INTERVAL', 2))  # Seconds
+QUIZ_JOB_RETRY_DELAY = int(os.environ.get('QUIZ_JOB_RETRY_DELAY', 30))  # Seconds before the first retry, doubled per attempt
+QUIZ_JOB_RETRY_MAX_DELAY = int(os.environ.get('QUIZ_JOB_RETRY_MAX_DELAY', 600))
+
+# Background study recommendation refresh (seconds): wait until a student has not
+# submitted a score for DEBOUNCE, but never let new scores wait longer than STALE_AFTER
+RECOMMENDATION_DEBOUNCE = int(os.environ.get('RECOMMENDATION_DEBOUNCE', 120))
+RECOMMENDATION_STALE_AFTER = int(os.environ.get('RECOMMENDATION_STALE_AFTER', 900))
+RECOMMENDATION_RETRY_AFTER = int(os.environ.get('RECOMMENDATION_RETRY_AFTER', 300))  # After a failed or abandoned refresh
+
+# Seconds before a material summary that could not be made is attempted again
+SUMMARY_RETRY_AFTER = int(os.environ.get('SUMMARY_RETRY_AFTER', 3600))
+
+# Question banks: questions generated per material and level, and questions per quiz variant
+QUESTION_BANK_SIZE = int(os.environ.get('QUESTION_BANK_SIZE', 20))
+QUIZ_VARIANT_SIZE = int(os.environ.get('QUIZ_VARIANT_SIZE', 5))
+
+# Repair calls allowed per generation to replace invalid or duplicate questions
+QUIZ_REPAIR_ATTEMPTS = int(os.environ.get('QUIZ_REPAIR_ATTEMPTS', 2))
+
+# Leaderboards: entries returned by default and the most a request may ask for
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', 10))
+LEADERBOARD_MAX_SIZE = int(os.environ.get('LEADERBOARD_MAX_SIZE', 100))
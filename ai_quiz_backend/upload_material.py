@@ -25,6 +25,7 @@ django.setup()
 # Import Django models after setting up Django
 from django.contrib.auth.models import User
 from quiz_api.models import Subject, Chapter, Subchapter, StudyMaterial
+from quiz_api.ingestion import ingest_material
 from django.core.files.base import ContentFile
 import shutil
 
@@ -96,6 +97,13 @@ def upload_material(subchapter_id, file_path, title, description, username):
         )
         
         print(f"Successfully uploaded '{file_name}' as '{title}' to subchapter '{subchapter.name}'.")
+        
+        # Extract the text now so the first quiz generation reads pre-parsed content
+        content = ingest_material(study_material.id)
+        if content and content.status == 'ready':
+            print(f"Extracted {content.word_count} words from {content.page_count or 'unknown'} page(s).")
+        else:
+            print("Warning: Could not extract text from the document. It will be retried when a quiz is generated.")
         return True
         
     except Exception as e:
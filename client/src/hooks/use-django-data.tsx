@@ -1,5 +1,5 @@
 import { useQuery, useMutation, UseQueryResult } from '@tanstack/react-query';
-import { queryClient } from '@/lib/queryClient';
+import { queryClient, apiRequest } from '@/lib/queryClient';
 import djangoApi from '@/lib/djangoApi';
 import { useDjangoAuth } from './use-django-auth';
 
@@ -80,6 +80,73 @@ export type QuizDetail = Omit<Quiz, 'material'> & {
   material: StudyMaterial;
 };
 
+// Background quiz generation job, returned with 202 while the quiz is being generated
+export type QuizGenerationJob = {
+  id: number;
+  material: number;
+  kind: string;
+  level: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  progress: number;
+  quiz: number | null;
+  error: string | null;
+  attempts: number;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  status_url?: string;
+};
+
+// How often and for how long a quiz generation job is polled
+const QUIZ_JOB_POLL_INTERVAL_MS = 1000;
+const QUIZ_JOB_POLL_TIMEOUT_MS = 5 * 60 * 1000;
+
+/**
+ * Poll a quiz generation job with getJob until it has finished, returning the
+ * finished job, whose `quiz` is the generated quiz's id. Throws if the job
+ * failed or is still not done after QUIZ_JOB_POLL_TIMEOUT_MS.
+ */
+export async function waitForQuizGenerationJob(
+  job: QuizGenerationJob,
+  getJob: (job: QuizGenerationJob) => Promise<QuizGenerationJob>
+): Promise<QuizGenerationJob> {
+  const deadline = Date.now() + QUIZ_JOB_POLL_TIMEOUT_MS;
+  let current = job;
+  while (current.status !== 'succeeded') {
+    if (current.status === 'failed') {
+      throw new Error(current.error || 'Quiz generation failed');
+    }
+    if (Date.now() > deadline) {
+      throw new Error('Quiz generation is taking longer than expected. Please try again later.');
+    }
+    await new Promise((resolve) => setTimeout(resolve, QUIZ_JOB_POLL_INTERVAL_MS));
+    current = await getJob(job);
+  }
+  return current;
+}
+
+/**
+ * Wait for a quiz generation job returned by POST /api/generate-quiz/, polling
+ * its status_url with apiRequest (for pages that call the API directly).
+ */
+export function pollQuizGenerationJob(job: QuizGenerationJob): Promise<QuizGenerationJob> {
+  return waitForQuizGenerationJob(job, async (job) => {
+    const response = await apiRequest('GET', job.status_url || `/api/generate-quiz/jobs/${job.id}/`);
+    if (!response.ok) {
+      throw new Error(`Failed to check the quiz generation progress: ${response.status}`);
+    }
+    return response.json();
+  });
+}
+
+// Django API endpoint of a job's status_url (an absolute URL under /api/)
+function quizJobEndpoint(job: QuizGenerationJob): string {
+  if (!job.status_url) {
+    return `/generate-quiz/jobs/${job.id}/`;
+  }
+  return new URL(job.status_url, window.location.origin).pathname.replace(/^\/api(?=\/)/, '');
+}
+
 // Quiz score types
 export type QuizScore = {
   id: number;
@@ -106,6 +173,15 @@ export type StudyRecommendation = {
   created_at: string;
 };
 
+// Stored recommendations and whether a refresh for newer scores is pending
+export type StudyRecommendations = {
+  recommendations: StudyRecommendation[];
+  refreshed_at: string | null;
+  pending: boolean;
+  pending_since: string | null;
+  message?: string;
+};
+
 // Hooks for subjects
 export function useSubjects(): UseQueryResult<Subject[]> {
   const { token } = useDjangoAuth();
@@ -279,14 +355,32 @@ export function useGenerateQuiz() {
   
   return useMutation({
     mutationFn: async ({ materialId, level }: { materialId: number; level: string }) => {
-      const response = await djangoApi.post<Quiz>(`/generate-quiz/${materialId}/`, { level }, token || undefined);
+      const response = await djangoApi.post<QuizDetail | QuizGenerationJob>(
+        `/generate-quiz/${materialId}/`, { level }, token || undefined
+      );
       if (!response.success) {
         throw new Error(response.error);
       }
-      return response.data!;
+      if (response.status !== 202) {
+        return response.data as QuizDetail;
+      }
+      
+      // No quiz yet: it is being generated in the background
+      const job = await waitForQuizGenerationJob(response.data as QuizGenerationJob, async (job) => {
+        const status = await djangoApi.get<QuizGenerationJob>(quizJobEndpoint(job), token || undefined);
+        if (!status.success) {
+          throw new Error(status.error);
+        }
+        return status.data!;
+      });
+      const quiz = await djangoApi.get<QuizDetail>(`/quizzes/${job.quiz}/`, token || undefined);
+      if (!quiz.success) {
+        throw new Error(quiz.error);
+      }
+      return quiz.data!;
     },
-    onSuccess: (data) => {
-      queryClient.invalidateQueries({ queryKey: ['django-quizzes', data.material] });
+    onSuccess: (data, { materialId }) => {
+      queryClient.invalidateQueries({ queryKey: ['django-quizzes', materialId] });
     }
   });
 }
@@ -331,12 +425,12 @@ export function useMaterialLeaderboard(materialId: number): UseQueryResult<QuizS
 }
 
 // Hooks for recommendations
-export function useStudyRecommendations(): UseQueryResult<StudyRecommendation[]> {
+export function useStudyRecommendations(): UseQueryResult<StudyRecommendations> {
   const { token, isAuthenticated } = useDjangoAuth();
   
   return useQuery({
     queryKey: ['django-recommendations'],
-    queryFn: djangoApi.getQueryFn<StudyRecommendation[]>('/recommendations/', token || undefined),
+    queryFn: djangoApi.getQueryFn<StudyRecommendations>('/recommendations/', token || undefined),
     enabled: isAuthenticated
   });
 }
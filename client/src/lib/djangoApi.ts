@@ -5,6 +5,7 @@ const DJANGO_API_BASE = '/django-api';
 
 export type DjangoAPIResponse<T> = {
   success: boolean;
+  status?: number;
   data?: T;
   error?: string;
 };
@@ -32,12 +33,14 @@ export async function djangoApiGet<T>(endpoint: string, token?: string): Promise
     if (response.ok) {
       return {
         success: true,
+        status: response.status,
         data: data as T
       };
     } else {
       return {
         success: false,
-        error: data.detail || 'An error occurred'
+        status: response.status,
+        error: data.detail || data.error || 'An error occurred'
       };
     }
   } catch (err: any) {
@@ -73,12 +76,14 @@ export async function djangoApiPost<T>(endpoint: string, body: any, token?: stri
     if (response.ok) {
       return {
         success: true,
+        status: response.status,
         data: data as T
       };
     } else {
       return {
         success: false,
-        error: data.detail || 'An error occurred'
+        status: response.status,
+        error: data.detail || data.error || 'An error occurred'
       };
     }
   } catch (err: any) {
@@ -112,12 +117,14 @@ export async function djangoApiUpload<T>(endpoint: string, formData: FormData, t
     if (response.ok) {
       return {
         success: true,
+        status: response.status,
         data: data as T
       };
     } else {
       return {
         success: false,
-        error: data.detail || 'An error occurred'
+        status: response.status,
+        error: data.detail || data.error || 'An error occurred'
       };
     }
   } catch (err: any) {
@@ -8,6 +8,7 @@ import { queryClient, apiRequest } from "@/lib/queryClient";
 import { QuizQuestion, QuizState, createQuizState, selectAnswer, goToNextQuestion, goToPreviousQuestion, completeQuiz } from "@/lib/quizHelpers";
 import { formatTime, getElapsedTime } from "@/lib/timeUtils";
 import useDjangoAuth from "@/hooks/use-django-auth";
+import { pollQuizGenerationJob } from "@/hooks/use-django-data";
 
 // Define the expected quiz data structure
 interface QuizData {
@@ -115,6 +116,16 @@ export default function Quiz() {
         throw new Error(`Failed to generate quiz: ${response.status} ${errorText}`);
       }
       
+      if (response.status === 202) {
+        // The quiz is generated in the background; wait for the job, then load the quiz
+        await pollQuizGenerationJob(await response.json());
+        const quizResponse = await apiRequest("GET", `/api/generate-quiz/${materialId}?level=${level}`, undefined, headers);
+        if (!quizResponse.ok) {
+          throw new Error(`Failed to load the generated quiz: ${quizResponse.status}`);
+        }
+        return quizResponse.json();
+      }
+      
       return response.json();
     },
     onSuccess: (data) => {
@@ -7,6 +7,7 @@ import { useToast } from "@/hooks/use-toast";
 import { queryClient, apiRequest } from "@/lib/queryClient";
 import { StudyMaterial, Subchapter } from "@shared/schema";
 import { useAuth } from "@/App";
+import { QuizGenerationJob, pollQuizGenerationJob } from "@/hooks/use-django-data";
 
 export default function StudyMaterials() {
   const [, params] = useRoute("/subjects/:subjectId/chapters/:chapterId/subchapters/:subchapterId/materials");
@@ -41,9 +42,17 @@ export default function StudyMaterials() {
     mutationFn: async ({ materialId, level }: { materialId: number, level: string }) => {
       const response = await apiRequest("POST", `/api/generate-quiz/${materialId}`, { level });
       const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.message || data.error || "Failed to generate quiz");
+      }
+      if (response.status === 202) {
+        // The quiz is generated in the background; wait for the job before opening it
+        await pollQuizGenerationJob(data as QuizGenerationJob);
+      }
       return data;
     },
-    onSuccess: (data) => {
+    onSuccess: (data, { materialId, level }) => {
+      queryClient.invalidateQueries({ queryKey: [`/api/generate-quiz/${materialId}?level=${level}`] });
       toast({
         title: "Success",
         description: "Quiz generated successfully!"
@@ -53,7 +62,7 @@ export default function StudyMaterials() {
     onError: (error) => {
       toast({
         title: "Error",
-        description: "Failed to generate quiz. Please try again.",
+        description: error instanceof Error ? error.message : "Failed to generate quiz. Please try again.",
         variant: "destructive"
       });
     }